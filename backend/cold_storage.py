@@ -0,0 +1,59 @@
+"""
+FIT跑步数据分析器 - 冷存储归档
+长期未访问的旧活动把 <id>.json/.rec/.lod 打包为一个 gzip 压缩的 tar 文件 <id>.cold，
+与热存储文件放在同一个分片目录中；访问时再解压回热存储。
+"""
+import io
+import tarfile
+from pathlib import Path
+from typing import List
+
+from store_io import atomic_write_bytes
+
+
+COLD_SUFFIX = ".cold"
+# gzip 压缩级别：列式JSON数据在6级时已接近最大压缩率
+COLD_COMPRESS_LEVEL = 6
+
+
+def pack_archive(archive: Path, files: List[Path]):
+    """把文件打包为冷存储归档（原子写入），归档内只保存文件名"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz", compresslevel=COLD_COMPRESS_LEVEL) as tar:
+        for path in files:
+            data = path.read_bytes()
+            info = tarfile.TarInfo(path.name)
+            info.size = len(data)
+            info.mtime = int(path.stat().st_mtime)
+            tar.addfile(info, io.BytesIO(data))
+    atomic_write_bytes(archive, buffer.getvalue())
+
+
+def unpack_archive(archive: Path, directory: Path) -> List[Path]:
+    """
+    把冷存储归档解压到目录（每个文件原子写入），返回解压出的文件
+
+    头部 .json 最后写入：读取方看到头部时，列式数据已经完整。
+    """
+    with tarfile.open(archive, mode="r:gz") as tar:
+        contents = {}
+        for member in tar.getmembers():
+            # 只接受普通文件，且忽略路径部分，防止写出目录之外
+            if member.isfile():
+                contents[Path(member.name).name] = tar.extractfile(member).read()
+
+    written = []
+    for name in sorted(contents, key=lambda n: n.endswith(".json")):
+        path = directory / name
+        atomic_write_bytes(path, contents[name])
+        written.append(path)
+    return written
+
+
+def read_archive_member(archive: Path, name: str) -> bytes:
+    """读取归档中的单个文件（重建索引时读取头部，不解压到磁盘）"""
+    with tarfile.open(archive, mode="r:gz") as tar:
+        member = tar.extractfile(name)
+        if member is None:
+            raise KeyError(name)
+        return member.read()
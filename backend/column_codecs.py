@@ -0,0 +1,331 @@
+"""
+FIT跑步数据分析器 - 列编码
+列式文件中每个列块按数据特征自动选择编码，无损还原为原始值列表（值与类型均不变）。
+
+编码后的列块仍是JSON：普通JSON数组为未编码的列（旧文件也是这种形式），
+对象为编码后的列，"c" 指明编码:
+
+    {"c": "delta", "n": [空值位置], "o": 差分阶数, "s": 小数缩放(浮点列), "f": [前o个差分值], "d": 整数流}
+        单调或缓慢变化的数值列（elapsed_time、distance、heart_rate 等）。
+        浮点数按最少的小数位数放大为整数（验证可以精确还原），再做1阶（delta）
+        或2阶（delta-of-delta）差分；开头的o个值单独保存，整数流只含小的差分值
+    {"c": "ts", "b": 基准时间, "z": 是否以Z结尾, "n": [...], "o": ..., "f": ..., "d": ...}
+        ISO时间字符串（timestamp），转换为相对基准时间的微秒数后同 delta
+    {"c": "dict", "d": [取值表], "i": 整数流}
+        取值种类少的列（IQ状态字段、字符串等），保存取值序号
+
+整数流取以下三种中最短的一种:
+    [值, ...]                                   JSON数组
+    {"v": [值], "r": [重复次数]}                游程编码（重复多时）
+    {"m": 最小值, "w": 位宽, "k": 个数, "b": base64}
+        减去最小值后按 1/2/4/8/16/32 位紧凑打包（差分后取值范围小时）
+
+编码的选择只用廉价的统计量估算大小（取值类型、差分的取值范围与游程数、取值种类数），
+只生成并序列化选中的一种，不逐个尝试；估算不比原始数组小时不编码。
+编码器按构造可以无损还原；VERIFY_ENCODING 打开时（测试/调试）编码后立即解码校验。
+解码使用 itertools.accumulate / repeat、array 与字节查找表等C实现的批量操作，不逐值解析。
+"""
+import base64
+import sys
+from array import array
+from datetime import datetime, timedelta
+from itertools import accumulate, chain, groupby, repeat
+from operator import ne, sub
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from serializer import dumps
+
+
+# 浮点列最多尝试的小数位数
+MAX_DECIMALS = 6
+# 字典编码的最大取值种类数
+MAX_DICT_SIZE = 256
+# 编码收益太小的短列不编码
+MIN_ENCODE_COUNT = 8
+# 调试：编码后立即解码校验，不能逐值还原时退回原始数组（每列多一次解码，正常保存时关闭）
+VERIFY_ENCODING = False
+# 估算原始数组大小时抽样的值个数
+_SIZE_SAMPLE = 64
+# 位打包的位宽；8位及以上按 array 类型码整块解码
+_PACK_WIDTHS = (1, 2, 4, 8, 16, 32)
+_ARRAY_TYPECODES = {8: "B", 16: "H", 32: "I"}
+# 小于8位时每个字节解码结果的查找表 {位宽: [(值, ...) for 字节 in 0..255]}
+_BYTE_TABLES = {
+    width: [tuple((byte >> shift) & ((1 << width) - 1) for shift in range(0, 8, width)) for byte in range(256)]
+    for width in (1, 2, 4)
+}
+# 小于8位打包时按字节左移的查找表 {位移: bytes.translate 表}
+_SHIFT_TABLES = {shift: bytes((b << shift) & 0xFF for b in range(256)) for shift in range(8)}
+
+
+def _delta(values: List[int]) -> List[int]:
+    """[x0, x1-x0, x2-x1, ...]（accumulate 的逆运算）"""
+    return values[:1] + list(map(sub, values[1:], values))
+
+
+def _bit_pack(values: List[int]) -> Optional[Dict[str, Any]]:
+    """减去最小值后按固定位宽打包；取值范围超过32位时返回None"""
+    if not values:
+        return None
+    low = min(values)
+    span = max(values) - low
+    width = next((w for w in _PACK_WIDTHS if span < (1 << w)), None)
+    if width is None:
+        return None
+    offsets = [v - low for v in values]
+    if width >= 8:
+        packed = array(_ARRAY_TYPECODES[width], offsets)
+        if sys.byteorder == "big":
+            packed.byteswap()
+        raw = packed.tobytes()
+    else:
+        # 第 j 个值占每个字节的第 j*width 位起：各自左移后按整数按位或合并（均为C实现的批量操作）
+        per_byte = 8 // width
+        offset_bytes = bytes(offsets)
+        merged = 0
+        for j in range(per_byte):
+            merged |= int.from_bytes(offset_bytes[j::per_byte].translate(_SHIFT_TABLES[j * width]), "little")
+        raw = merged.to_bytes(-(-len(offsets) // per_byte), "little")
+    return {"m": low, "w": width, "k": len(values), "b": base64.b64encode(raw).decode("ascii")}
+
+
+def _bit_unpack(packed: Dict[str, Any]) -> List[int]:
+    raw = base64.b64decode(packed["b"])
+    width = packed["w"]
+    if width >= 8:
+        unpacked = array(_ARRAY_TYPECODES[width])
+        unpacked.frombytes(raw)
+        if sys.byteorder == "big":
+            unpacked.byteswap()
+        values = unpacked.tolist()
+    else:
+        values = list(chain.from_iterable(map(_BYTE_TABLES[width].__getitem__, raw)))[:packed["k"]]
+    low = packed["m"]
+    return list(map(low.__add__, values)) if low else values
+
+
+def _int_stats(values: List[int]) -> Tuple[int, int, int]:
+    """整数流的 (取值范围, 游程数, 最长的十进制位数)"""
+    if not values:
+        return 0, 0, 1
+    low, high = min(values), max(values)
+    runs = 1 + sum(map(ne, values[1:], values))
+    return high - low, runs, max(len(str(low)), len(str(high)))
+
+
+def _stream_size(count: int, stats: Tuple[int, int, int]) -> Tuple[str, float]:
+    """估算整数流三种形式的序列化大小，返回 (最短的形式, 估算字节数)"""
+    span, runs, digits = stats
+    sizes = {"list": count * (digits + 1), "rle": runs * (digits + 4) + 12}
+    width = next((w for w in _PACK_WIDTHS if span < (1 << w)), None)
+    if width is not None:
+        sizes["bits"] = (count * width + 7) // 8 * 4 / 3 + 40
+    kind = min(sizes, key=sizes.get)
+    return kind, sizes[kind]
+
+
+def _pack_ints(values: List[int], stats: Optional[Tuple[int, int, int]] = None) -> Union[List[int], Dict[str, Any]]:
+    """整数流：按估算大小在JSON数组、游程编码、位打包中选择一种"""
+    kind, _ = _stream_size(len(values), stats or _int_stats(values))
+    if kind == "bits":
+        return _bit_pack(values)
+    if kind == "rle":
+        runs = [(v, sum(1 for _ in group)) for v, group in groupby(values)]
+        return {"v": [v for v, _ in runs], "r": [r for _, r in runs]}
+    return values
+
+
+def _unpack_ints(packed: Union[List[int], Dict[str, Any]]) -> List[int]:
+    if isinstance(packed, list):
+        return packed
+    if "b" in packed:
+        return _bit_unpack(packed)
+    return list(chain.from_iterable(map(repeat, packed["v"], packed["r"])))
+
+
+def _plan_int_stream(values: List[int]) -> Tuple[int, List[int], Tuple[int, int, int], float]:
+    """选择1阶或2阶差分中估算更短的一种，返回 (阶数, 差分, 整数流统计量, 估算字节数)"""
+    best = None
+    diffs = values
+    for order in (1, 2):
+        diffs = _delta(diffs)
+        stats = _int_stats(diffs[order:])
+        size = _stream_size(len(diffs) - order, stats)[1]
+        if best is None or size < best[3]:
+            best = (order, diffs, stats, size)
+    return best
+
+
+def _encode_int_stream(values: List[int], plan=None) -> Dict[str, Any]:
+    order, diffs, stats, _ = plan or _plan_int_stream(values)
+    return {"o": order, "f": diffs[:order], "d": _pack_ints(diffs[order:], stats)}
+
+
+def _decode_int_stream(encoded: Dict[str, Any]) -> List[int]:
+    values = encoded["f"] + _unpack_ints(encoded["d"])
+    for _ in range(encoded["o"]):
+        values = accumulate(values)
+    return list(values)
+
+
+def split_nulls(values: List[Any]):
+    """(空值位置, 非空值)"""
+    nulls = [i for i, v in enumerate(values) if v is None]
+    if not nulls:
+        return nulls, values
+    return nulls, [v for v in values if v is not None]
+
+
+def restore_nulls(values: List[Any], nulls: List[int]) -> List[Any]:
+    if not nulls:
+        return values
+    result: List[Any] = [None] * (len(values) + len(nulls))
+    null_set = set(nulls)
+    positions = (i for i in range(len(result)) if i not in null_set)
+    for i, v in zip(positions, values):
+        result[i] = v
+    return result
+
+
+def float_scale(values: List[float]) -> Optional[int]:
+    """能把所有浮点数精确放大为整数的最小 10^k，没有时返回None"""
+    for decimals in range(MAX_DECIMALS + 1):
+        scale = 10 ** decimals
+        if all(round(v * scale) / scale == v for v in values):
+            return scale
+    return None
+
+
+# 编码计划：(估算的序列化字节数, 生成编码的函数)；只有选中的计划会被生成
+_Plan = Tuple[float, Callable[[], Dict[str, Any]]]
+
+
+def _plan_delta(nulls: List[int], present: List[Any], kinds: set) -> Optional[_Plan]:
+    if kinds == {int}:
+        ints, scale = present, None
+    elif kinds == {float}:
+        scale = float_scale(present)
+        if scale is None:
+            return None
+        ints = [round(v * scale) for v in present]
+    else:
+        return None
+    plan = _plan_int_stream(ints)
+
+    def build() -> Dict[str, Any]:
+        encoded: Dict[str, Any] = {"c": "delta", "n": nulls}
+        if scale is not None:
+            encoded["s"] = scale
+        encoded.update(_encode_int_stream(ints, plan))
+        return encoded
+    return plan[3] + len(nulls) * 6 + 40, build
+
+
+def _decode_delta(encoded: Dict[str, Any]) -> List[Any]:
+    values = _decode_int_stream(encoded)
+    scale = encoded.get("s")
+    if scale is not None:
+        values = [v / scale for v in values]
+    return restore_nulls(values, encoded["n"])
+
+
+def _plan_timestamps(nulls: List[int], present: List[Any], kinds: set) -> Optional[_Plan]:
+    if kinds != {str}:
+        return None
+    zulu = present[0].endswith("Z")
+    try:
+        parsed = [datetime.fromisoformat(v[:-1] if zulu else v) for v in present]
+    except ValueError:
+        return None
+    base = parsed[0]
+    offsets = [(t - base) // timedelta(microseconds=1) for t in parsed]
+    plan = _plan_int_stream(offsets)
+
+    def build() -> Dict[str, Any]:
+        encoded = {"c": "ts", "b": present[0], "z": zulu, "n": nulls}
+        encoded.update(_encode_int_stream(offsets, plan))
+        return encoded
+    return plan[3] + len(nulls) * 6 + 80, build
+
+
+def _decode_timestamps(encoded: Dict[str, Any]) -> List[Any]:
+    zulu = encoded["z"]
+    base_text = encoded["b"]
+    base = datetime.fromisoformat(base_text[:-1] if zulu else base_text)
+    suffix = "Z" if zulu else ""
+    values = [(base + timedelta(microseconds=us)).isoformat() + suffix for us in _decode_int_stream(encoded)]
+    return restore_nulls(values, encoded["n"])
+
+
+def _plan_dict(values: List[Any], kinds: set) -> Optional[_Plan]:
+    if kinds & {list, dict}:
+        return None
+    # 以 (类型, 值) 为键，区分 1 / 1.0 / True
+    keys = list(zip(map(type, values), values))
+    table = dict.fromkeys(keys)
+    if len(table) > MAX_DICT_SIZE:
+        return None
+    distinct = [v for _, v in table]
+    # 序号流的游程与取值的游程相同
+    stats = (len(table) - 1, 1 + sum(map(ne, keys[1:], keys)), len(str(len(table) - 1)))
+
+    def build() -> Dict[str, Any]:
+        index = {key: i for i, key in enumerate(table)}
+        return {"c": "dict", "d": distinct, "i": _pack_ints(list(map(index.__getitem__, keys)), stats)}
+    return _stream_size(len(values), stats)[1] + len(dumps(distinct)) + 20, build
+
+
+def _decode_dict(encoded: Dict[str, Any]) -> List[Any]:
+    return list(map(encoded["d"].__getitem__, _unpack_ints(encoded["i"])))
+
+
+_DECODERS = {"delta": _decode_delta, "ts": _decode_timestamps, "dict": _decode_dict}
+
+
+def _plain_size(values: List[Any]) -> float:
+    """按抽样估算未编码数组的序列化大小"""
+    sample = values[::max(1, len(values) // _SIZE_SAMPLE)]
+    return len(dumps(sample)) * len(values) / len(sample)
+
+
+def encode_column(values: List[Any]) -> Union[List[Any], Dict[str, Any]]:
+    """
+    为列选择编码
+
+    按廉价统计量估算各适用编码的大小，只生成估算最短的一种。
+
+    Returns:
+        编码后的对象；估算不比原始数组小（或没有适用的编码）时返回原列表
+    """
+    if len(values) < MIN_ENCODE_COUNT:
+        return values
+    nulls, present = split_nulls(values)
+    kinds = set(map(type, present))
+    plans = [plan for plan in (
+        _plan_delta(nulls, present, kinds),
+        _plan_timestamps(nulls, present, kinds),
+        _plan_dict(values, kinds),
+    ) if plan is not None]
+    if not plans:
+        return values
+    size, build = min(plans, key=lambda plan: plan[0])
+    if size >= _plain_size(values):
+        return values
+    encoded = build()
+    if VERIFY_ENCODING and not _same_values(decode_column(encoded), values):
+        print(f"警告: 列编码无法逐值还原，改为不编码: {encoded['c']}")
+        return values
+    return encoded
+
+
+def decode_column(stored: Union[List[Any], Dict[str, Any]]) -> List[Any]:
+    """还原列块（未编码的数组原样返回）"""
+    if isinstance(stored, list):
+        return stored
+    return _DECODERS[stored["c"]](stored)
+
+
+def _same_values(decoded: List[Any], values: List[Any]) -> bool:
+    return len(decoded) == len(values) and all(
+        a == b and type(a) is type(b) for a, b in zip(decoded, values)
+    )
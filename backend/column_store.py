@@ -0,0 +1,432 @@
+"""
+FIT跑步数据分析器 - 记录数据列式存储
+将 records 按字段拆成列写入 <id>.rec 文件，支持只读取部分字段和部分时间段
+
+文件布局:
+    MAGIC(4字节) | 头部长度(uint32, 小端) | 头部JSON | 各列数据块
+
+头部JSON（版本4）:
+    {"version": 4, "count": 记录数, "chunks": [
+        {"start": 首条记录序号, "count": 记录数,
+         "columns": {列名: [偏移, 长度, CRC32], ...},
+         "zones": {列名: [最小值, 最大值], ...}},
+        ...
+    ]}
+
+版本1没有分块，"columns" 直接位于头部（读取时视为一个没有 zones 的块）；
+版本1、2的数据块都是未编码的JSON数组；版本3及以前的列目录没有 CRC32。
+
+- 列名与API字段名一致：标准字段直接使用字段名（如 heart_rate），
+  IQ字段加 iq_ 前缀（如 iq_dr_gct）
+- 记录按 elapsed_time 切成 RECORD_CHUNK_SEC 秒的块；.lod 等非逐条记录的文件只有一个块
+- zones 只包含数值列，按时间/距离范围读取时跳过不重叠的块
+- 每个数据块是JSON数组或按 column_codecs 编码的JSON对象（delta/时间戳/字典编码），
+  偏移相对于数据区起点
+- 读取时使用 mmap，只解析被请求的列和块；带 CRC32 的数据块先校验，不符时抛出 ValueError
+- 头部（含每块的 CRC32）的 CRC32 即整个文件的校验和（pack_checksum），
+  由写入方保存在活动头部，读取时用于确认记录文件是存储自己写入的
+"""
+import mmap
+import struct
+import sys
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from column_codecs import decode_column, encode_column
+from models import Record
+from serializer import dumps, loads
+from store_io import atomic_write_bytes
+
+
+PACK_MAGIC = b"FCOL"
+PACK_VERSION = 4
+_HEADER_STRUCT = struct.Struct("<4sI")
+
+# Record 的标准字段（iq_fields 单独按键拆列）
+RECORD_FIELDS = [name for name in Record.model_fields if name != "iq_fields"]
+IQ_COLUMN_PREFIX = "iq_"
+
+# 记录分块：按时间轴每10分钟一块（马拉松约25块，每块约600条记录）
+RECORD_CHUNK_SEC = 600
+CHUNK_FIELD = "elapsed_time"
+# 记录范围 (字段, 下限, 上限)，字段为 elapsed_time 或 distance 等数值列，上下限为None表示不限
+RecordRange = Tuple[str, Optional[float], Optional[float]]
+
+
+def records_to_columns(records: List[Record]) -> Dict[str, List[Any]]:
+    """
+    将记录列表转换为列字典
+
+    全为空的标准字段不生成列；IQ字段按首次出现顺序生成 iq_ 前缀列，缺失值为None。
+    """
+    dumped = [r.model_dump(mode="json") for r in records]
+    columns: Dict[str, List[Any]] = {}
+
+    for field in RECORD_FIELDS:
+        values = [d[field] for d in dumped]
+        if any(v is not None for v in values):
+            columns[field] = values
+
+    iq_keys: Dict[str, None] = {}
+    for d in dumped:
+        for key in d["iq_fields"]:
+            iq_keys.setdefault(key, None)
+    for key in iq_keys:
+        columns[IQ_COLUMN_PREFIX + key] = [d["iq_fields"].get(key) for d in dumped]
+
+    return columns
+
+
+def select_record_columns(records: List[Record], names: List[str]) -> Dict[str, List[Any]]:
+    """
+    只转换指定的列（列名同 records_to_columns），不对整条记录 model_dump
+
+    记录中不存在的IQ字段列为全None。
+    """
+    columns: Dict[str, List[Any]] = {}
+    for name in names:
+        if name in RECORD_FIELDS:
+            columns[name] = [r.model_dump(mode="json", include={name})[name] for r in records]
+        elif name.startswith(IQ_COLUMN_PREFIX):
+            key = name[len(IQ_COLUMN_PREFIX):]
+            columns[name] = [r.iq_fields.get(key) for r in records]
+    return columns
+
+
+def iq_schema(columns: Dict[str, List[Any]]) -> List[str]:
+    """列字典中的IQ字段名（不含 iq_ 前缀，按列顺序），即活动的IQ字段声明"""
+    return [
+        sys.intern(name[len(IQ_COLUMN_PREFIX):])
+        for name in columns
+        if name.startswith(IQ_COLUMN_PREFIX) and name not in Record.model_fields
+    ]
+
+
+# 可信构造时直接写入的 BaseModel 槽位（pydantic 2 的内部结构，requirements.txt 固定了主版本）
+_MODEL_SLOTS = ("__dict__", "__pydantic_fields_set__", "__pydantic_extra__", "__pydantic_private__")
+
+
+def _slot_setters() -> Optional[Tuple[Any, ...]]:
+    """
+    BaseModel 槽位描述符的 __set__，启动时自检一次
+
+    用槽位构造一条样例记录并与校验构造的结果比较；pydantic 内部结构不同
+    （描述符不存在或构造结果不一致）时返回None，可信读取退回逐条校验构造。
+    """
+    try:
+        setters = tuple(BaseModel.__dict__[name].__set__ for name in _MODEL_SLOTS)
+        expected = Record(timestamp=datetime(2025, 1, 1), heart_rate=120, iq_fields={"dr_gct": 250.0})
+        probe = Record.__new__(Record)
+        for setter, value in zip(setters, (dict(expected.__dict__), set(expected.model_fields_set), None, None)):
+            setter(probe, value)
+        if probe == expected and probe.model_dump() == expected.model_dump() \
+                and probe.model_fields_set == expected.model_fields_set and probe.model_copy() == expected:
+            return setters
+    except Exception:
+        pass
+    print("警告: 当前 pydantic 版本不支持快速构造记录，读取活动时改为逐条校验")
+    return None
+
+
+_SLOT_SETTERS = _slot_setters()
+
+
+def _parse_timestamp(value: str) -> datetime:
+    """解析 model_dump(mode="json") 输出的ISO时间（UTC时间以Z结尾）"""
+    return datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith("Z") else value)
+
+
+def _construct_records(columns: Dict[str, List[Any]], count: int) -> List[Record]:
+    """
+    不经校验直接构造记录（与校验后的结果相同，已设置的字段为读取到的列）
+
+    Record.model_construct 对每条记录逐字段处理默认值，并不比校验快；
+    这里按行 zip 各列后直接写入模型的 __dict__（需 _SLOT_SETTERS 自检通过）。
+    """
+    set_model_dict, set_fields_set, set_extra, set_private = _SLOT_SETTERS
+    missing = [None] * count
+    timestamps = columns.get("timestamp")
+    if timestamps is not None:
+        columns = dict(columns, timestamp=[_parse_timestamp(v) if v is not None else None for v in timestamps])
+    iq = [(key, columns[IQ_COLUMN_PREFIX + key]) for key in iq_schema(columns)]
+    iq_rows = [{key: values[i] for key, values in iq if values[i] is not None} for i in range(count)]
+
+    names = RECORD_FIELDS + ["iq_fields"]
+    fields_set = {name for name in RECORD_FIELDS if name in columns}
+    fields_set.add("iq_fields")
+    new = Record.__new__
+    records = []
+    for row in zip(*[columns.get(name, missing) for name in RECORD_FIELDS], iq_rows):
+        record = new(Record)
+        set_model_dict(record, dict(zip(names, row)))
+        set_fields_set(record, set(fields_set))
+        set_extra(record, None)
+        set_private(record, None)
+        records.append(record)
+    return records
+
+
+def columns_to_records(columns: Dict[str, List[Any]], count: int, trusted: bool = False) -> List[Record]:
+    """
+    将列字典还原为记录列表（缺失的列保持默认值，空的IQ值不写入iq_fields）
+
+    Args:
+        trusted: 列数据是存储自己写入且经过校验的 model_dump(mode="json") 结果时为True，
+                 只把 timestamp 转回 datetime，不经校验直接构造 Record
+                 （pydantic 内部结构自检未通过时仍逐条校验）
+    """
+    if trusted and _SLOT_SETTERS is not None:
+        return _construct_records(columns, count)
+    standard = [(name, values) for name, values in columns.items() if name in Record.model_fields]
+    iq = [(key, columns[IQ_COLUMN_PREFIX + key]) for key in iq_schema(columns)]
+
+    records = []
+    for i in range(count):
+        data = {name: values[i] for name, values in standard if values[i] is not None}
+        iq_fields = {key: values[i] for key, values in iq if values[i] is not None}
+        if iq_fields:
+            data["iq_fields"] = iq_fields
+        records.append(Record(**data))
+    return records
+
+
+def columns_to_record_dicts(columns: Dict[str, List[Any]], count: int) -> List[Dict[str, Any]]:
+    """
+    将列字典还原为与 Record.model_dump(mode="json") 结构相同的dict列表
+
+    列数据本身就是 model_dump(mode="json") 的结果，这里不构造 Record、不做校验，
+    用于直接输出API响应。
+    """
+    missing = [None] * count
+    standard = [columns.get(name, missing) for name in RECORD_FIELDS]
+    iq = [(key, columns[IQ_COLUMN_PREFIX + key]) for key in iq_schema(columns)]
+
+    records = [dict(zip(RECORD_FIELDS, row)) for row in zip(*standard)] if count else []
+    for i, record in enumerate(records):
+        record["iq_fields"] = {key: values[i] for key, values in iq if values[i] is not None}
+    return records
+
+
+def columns_to_table(columns: Dict[str, List[Any]], count: int) -> Dict[str, Any]:
+    """
+    将列字典转换为按活动声明IQ字段的表结构（API layout=columns）
+
+    IQ字段名只在 iq_schema 中出现一次，iq_columns 按 iq_schema 的位置对应；
+    缺失的值为null（不会像逐条记录的 iq_fields 那样省略键）。
+
+    Returns:
+        {"count": 记录数, "columns": {标准字段: [...]}, "iq_schema": [IQ字段名], "iq_columns": [[...], ...]}
+    """
+    schema = iq_schema(columns)
+    return {
+        "count": count,
+        "columns": {name: values for name, values in columns.items() if name in Record.model_fields},
+        "iq_schema": schema,
+        "iq_columns": [columns[IQ_COLUMN_PREFIX + key] for key in schema],
+    }
+
+
+def chunk_bounds(columns: Dict[str, List[Any]], count: int, chunk_sec: int = RECORD_CHUNK_SEC) -> List[Tuple[int, int]]:
+    """
+    按时间轴把记录切分为块
+
+    Returns:
+        [(起始序号, 结束序号), ...]；没有时间轴时整体为一块。时间为空的记录归入当前块
+    """
+    times = columns.get(CHUNK_FIELD)
+    if not times or count == 0:
+        return [(0, count)]
+    bounds = []
+    start = 0
+    current = None
+    for i, t in enumerate(times):
+        if t is None:
+            continue
+        block = int(t // chunk_sec)
+        if current is not None and block != current and i > start:
+            bounds.append((start, i))
+            start = i
+        current = block
+    bounds.append((start, count))
+    return bounds
+
+
+def _zone(values: List[Any]) -> Optional[List[Any]]:
+    """数值列的 [最小值, 最大值]；没有数值（或不是数值列）时返回None"""
+    numbers = [v for v in values if v is not None]
+    if not numbers or any(isinstance(v, bool) or not isinstance(v, (int, float)) for v in numbers):
+        return None
+    return [min(numbers), max(numbers)]
+
+
+def write_column_pack(path: Path, columns: Dict[str, List[Any]], count: int, chunked: bool = False) -> int:
+    """
+    原子写入列式记录文件
+
+    Args:
+        path: 文件路径
+        columns: 列字典
+        count: 记录数
+        chunked: 是否按时间轴分块（每列长度必须等于记录数）
+
+    Returns:
+        文件的校验和（同 pack_checksum）
+    """
+    data, checksum = encode_column_pack(columns, count, chunked)
+    atomic_write_bytes(path, data)
+    return checksum
+
+
+def encode_column_pack(columns: Dict[str, List[Any]], count: int, chunked: bool = False) -> Tuple[bytes, int]:
+    """
+    编码列式记录文件的内容（参数见 write_column_pack）
+
+    Returns:
+        (文件内容, 校验和)
+    """
+    bounds = chunk_bounds(columns, count) if chunked else [(0, count)]
+    blobs = []
+    chunks = []
+    offset = 0
+    for start, end in bounds:
+        directory = {}
+        zones = {}
+        for name, values in columns.items():
+            part = values[start:end] if chunked else values
+            blob = dumps(encode_column(part))
+            directory[name] = [offset, len(blob), zlib.crc32(blob)]
+            blobs.append(blob)
+            offset += len(blob)
+            zone = _zone(part) if chunked else None
+            if zone is not None:
+                zones[name] = zone
+        chunks.append({"start": start, "count": end - start, "columns": directory, "zones": zones})
+
+    header = dumps({"version": PACK_VERSION, "count": count, "chunks": chunks})
+    return _HEADER_STRUCT.pack(PACK_MAGIC, len(header)) + header + b"".join(blobs), zlib.crc32(header)
+
+
+def pack_checksum(path: Path) -> int:
+    """
+    列式记录文件的校验和：头部JSON的CRC32
+
+    头部包含每个数据块的CRC32，因此校验和覆盖全部数据；只读取文件头部。
+    """
+    with open(path, "rb") as f:
+        magic, header_len = _HEADER_STRUCT.unpack(f.read(_HEADER_STRUCT.size))
+        if magic != PACK_MAGIC:
+            raise ValueError(f"不是有效的列式记录文件: {path}")
+        return zlib.crc32(f.read(header_len))
+
+
+def _parse_header(mm, path: Path) -> Tuple[Dict[str, Any], int]:
+    """解析文件头，返回 (头部, 数据区起点)；版本1的头部转换为单个块"""
+    magic, header_len = _HEADER_STRUCT.unpack_from(mm, 0)
+    if magic != PACK_MAGIC:
+        raise ValueError(f"不是有效的列式记录文件: {path}")
+    header_end = _HEADER_STRUCT.size + header_len
+    header = loads(mm[_HEADER_STRUCT.size:header_end])
+    if "chunks" not in header:
+        header["chunks"] = [{"start": 0, "count": header["count"], "columns": header.pop("columns"), "zones": {}}]
+    return header, header_end
+
+
+def _read_chunks(mm, header_end: int, chunks: List[Dict[str, Any]], names: Optional[Iterable[str]]) -> Dict[str, List[Any]]:
+    """读取并拼接指定块中的列（某块缺少的列以None补齐）"""
+    if names is None:
+        wanted = list(dict.fromkeys(name for chunk in chunks for name in chunk["columns"]))
+    else:
+        wanted = [n for n in names if any(n in chunk["columns"] for chunk in chunks)]
+
+    columns: Dict[str, List[Any]] = {name: [] for name in wanted}
+    for chunk in chunks:
+        directory = chunk["columns"]
+        for name in wanted:
+            if name not in directory:
+                columns[name].extend([None] * chunk["count"])
+                continue
+            entry = directory[name]
+            start = header_end + entry[0]
+            blob = mm[start:start + entry[1]]
+            if len(entry) > 2 and zlib.crc32(blob) != entry[2]:
+                raise ValueError(f"列数据校验失败: {name}")
+            columns[name].extend(decode_column(loads(blob)))
+    return columns
+
+
+def read_column_pack(path: Path, names: Optional[Iterable[str]] = None) -> Tuple[int, Dict[str, List[Any]]]:
+    """
+    读取列式记录文件
+
+    Args:
+        path: .rec 文件路径
+        names: 需要读取的列名，None表示全部；文件中不存在的列会被忽略
+
+    Returns:
+        (记录数, {列名: 值列表})
+    """
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            header, header_end = _parse_header(mm, path)
+            return header["count"], _read_chunks(mm, header_end, header["chunks"], names)
+
+
+def read_column_pack_range(
+    path: Path,
+    names: Optional[Iterable[str]],
+    field: str,
+    start: Optional[float] = None,
+    end: Optional[float] = None
+) -> Tuple[int, Dict[str, List[Any]]]:
+    """
+    只读取 field 的取值范围与 [start, end] 重叠的块
+
+    根据每块的 zones 跳过不重叠的块；没有该字段 zone 的块（旧文件、全为空）总是读取。
+    返回的列只是候选块的数据，精确筛选由调用方用 slice_columns_by_range 完成。
+
+    Args:
+        path: .rec 文件路径
+        names: 需要读取的列名，None表示全部；field 列总会被读取
+        field: 用于筛选的数值列（如 elapsed_time、distance）
+        start: 范围下限（含），None表示不限
+        end: 范围上限（含），None表示不限
+
+    Returns:
+        (文件中的总记录数, {列名: 候选块的值列表})
+    """
+    if names is not None:
+        names = list(dict.fromkeys([field, *names]))
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            header, header_end = _parse_header(mm, path)
+            selected = []
+            for chunk in header["chunks"]:
+                zone = chunk.get("zones", {}).get(field)
+                if zone is not None and ((start is not None and zone[1] < start) or (end is not None and zone[0] > end)):
+                    continue
+                selected.append(chunk)
+            return header["count"], _read_chunks(mm, header_end, selected, names)
+
+
+def slice_columns_by_range(
+    columns: Dict[str, List[Any]],
+    field: str,
+    start: Optional[float] = None,
+    end: Optional[float] = None
+) -> Dict[str, List[Any]]:
+    """只保留 field 值在 [start, end] 内的记录（field 为空的记录被丢弃）"""
+    values = columns.get(field)
+    if values is None:
+        return {name: [] for name in columns}
+    keep = [
+        i for i, v in enumerate(values)
+        if v is not None and (start is None or v >= start) and (end is None or v <= end)
+    ]
+    if len(keep) == len(values):
+        return columns
+    return {name: [column[i] for i in keep] for name, column in columns.items()}
+
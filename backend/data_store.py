@@ -4,35 +4,316 @@ FIT跑步数据分析器 - 数据存储管理
 """
 import json
 import os
-from datetime import datetime
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import Callable, Collection, Iterator, List, Optional, Dict, Any, Set, Tuple
 import shutil
+import threading
 
-from models import Activity, ActivityMeta, ActivityIndex
+from models import Activity, ActivityMeta, ActivityIndex, MergeProvenance, Record
 from fit_parser import speed_to_pace
+from device_mappings import DeviceRegistry
+from index_journal import IndexJournal
+from store_io import FileLock, atomic_write_bytes, write_temp_file
+from serializer import dumps, loads
+from column_store import (
+    records_to_columns, columns_to_records, columns_to_record_dicts, encode_column_pack, read_column_pack,
+    read_column_pack_range, slice_columns_by_range, columns_to_table, pack_checksum, select_record_columns,
+    IQ_COLUMN_PREFIX, RecordRange
+)
+from lod import TIME_FIELD, build_lod_columns, select_lod_level, lod_column_names, lod_payload, raw_lod_fields
+from search_index import SearchIndex
+from field_index import FieldIndex
+from lap_index import LAP_CACHE_NAME, LapIndex
+from rollups import StatsRollup
+from write_behind import WriteBehindQueue
+from cold_storage import COLD_SUFFIX, pack_archive, unpack_archive, read_archive_member
+from record_cache import RecordCache
+from raw_store import RAW_DIR_NAME, RawStore
+from migrations import (
+    ACTIVITY_SCHEMA_VERSION, MigrationWorker, stored_column_names, upgrade_activity_data
+)
+
+
+# 旧格式文件由 json.dump(indent=2) 写入，顶层键缩进固定为2个空格，
+# records 之后紧跟 available_fields，据此可以在不解析records的情况下切出头部
+_LEGACY_RECORDS_KEY = b'\n  "records":'
+_LEGACY_AFTER_RECORDS_KEY = b'\n  "available_fields":'
+
+
+def read_activity_header(activity_file: Path) -> Dict[str, Any]:
+    """
+    读取活动头部（session、laps、字段列表等），不解析records
+    
+    新格式的头部文件本身不含records；旧格式文件按顶层键位置切掉records数组，
+    结构不符合预期时退回完整解析。
+    """
+    with open(activity_file, 'rb') as f:
+        return parse_activity_header(f.read())
+
+
+def parse_activity_header(raw: bytes) -> Dict[str, Any]:
+    """从活动文件内容中解析头部，见 read_activity_header()"""
+    start = raw.find(_LEGACY_RECORDS_KEY)
+    if start >= 0:
+        end = raw.find(_LEGACY_AFTER_RECORDS_KEY, start)
+        if end >= 0:
+            try:
+                return loads(raw[:start] + raw[end:])
+            except json.JSONDecodeError:
+                pass
+    
+    data = loads(raw)
+    data.pop('records', None)
+    return data
+
+
+# 元数据附属文件 <id>.meta：保存头部写入之后的元数据修改（名称、运动类型、备注、标签、合并溯源），
+# 修改元数据时只写这个小文件和索引，不重写头部、记录，也不解压冷存储归档；
+# 读取时覆盖到头部上，完整保存活动（头部已包含最新元数据）时删除
+METADATA_SUFFIX = ".meta"
+
+
+def read_metadata_sidecar(path: Path) -> Dict[str, Any]:
+    """读取元数据附属文件，不存在时返回空字典"""
+    try:
+        with open(path, 'rb') as f:
+            return loads(f.read())
+    except FileNotFoundError:
+        return {}
+
+
+def apply_metadata(header: Dict[str, Any], metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """把元数据修改覆盖到活动头部dict上（sport 位于 session 中），返回同一个dict"""
+    for key, value in metadata.items():
+        if key == 'sport':
+            header['session']['sport'] = value
+        else:
+            header[key] = value
+    return header
+
+
+def _read_meta_for_rebuild(activity_file: str) -> Tuple[str, Optional[Dict[str, Any]], Optional[str]]:
+    """重建索引的工作函数（可在子进程中运行）：返回 (文件名, 元数据dict, 错误信息)"""
+    path = Path(activity_file)
+    try:
+        if path.suffix == COLD_SUFFIX:
+            header = parse_activity_header(read_archive_member(path, path.stem + ".json"))
+        else:
+            header = read_activity_header(path)
+        apply_metadata(header, read_metadata_sidecar(path.with_name(path.stem + METADATA_SUFFIX)))
+        activity = Activity(**upgrade_activity_data(header))
+        meta = DataStore._activity_to_meta(activity)
+        if path.suffix == COLD_SUFFIX:
+            meta.tier = "cold"
+        # 重建/导入时访问时间未知，视为刚使用，避免旧日期的活动立即被归档到冷存储
+        meta.last_accessed = datetime.now()
+        return path.name, meta.model_dump(mode='json'), None
+    except Exception as e:
+        return path.name, None, str(e)
+
+
+def overlays_missing_base(base_ids: Dict[str, Optional[str]], available: Collection[str] = ()) -> Dict[str, str]:
+    """
+    基础活动不存在的合并活动（覆盖层）
+
+    基础活动在 base_ids 中（且本身可读取）或在 available 中时视为存在；
+    基础活动本身是基础活动缺失的覆盖层时同样无法读取，也计入。
+
+    Args:
+        base_ids: {活动ID: 基础活动ID（不是覆盖层时为None）}
+        available: 不在 base_ids 中、但确定存在的活动ID
+
+    Returns:
+        {合并活动ID: 基础活动ID}
+    """
+    missing: Dict[str, str] = {}
+    changed = True
+    while changed:
+        changed = False
+        for activity_id, base_id in base_ids.items():
+            if base_id is None or activity_id in missing or base_id in available:
+                continue
+            if base_id not in base_ids or base_id in missing:
+                missing[activity_id] = base_id
+                changed = True
+    return missing
+
+
+def _same_entry(current: Optional[ActivityMeta], expected: ActivityMeta) -> bool:
+    """索引条目自 expected 之后没有被修改（访问时间除外）"""
+    return current is not None and \
+        current.model_dump(exclude={'last_accessed'}) == expected.model_dump(exclude={'last_accessed'})
+
+
+class StagedActivity:
+    """已写为临时文件、等待 DataStore.commit_staged() 提交的活动重写"""
+    __slots__ = ("meta", "expected", "directory", "files")
+
+    def __init__(self, meta: ActivityMeta, expected: ActivityMeta, directory: Path):
+        self.meta = meta
+        self.expected = expected
+        self.directory = directory
+        # [(临时文件, 目标路径)]，按替换顺序排列
+        self.files: List[Tuple[str, Path]] = []
+
+    def discard(self):
+        """删除尚未替换到位的临时文件"""
+        for tmp_name, _ in self.files:
+            try:
+                os.unlink(tmp_name)
+            except OSError:
+                pass
+        self.files = []
 
 
 class DataStore:
-    """活动数据存储管理器"""
+    """
+    活动数据存储管理器
+    
+    支持多进程（uvicorn --workers N、旁路导入进程）共享同一数据目录：
+    - 所有文件通过临时文件 + rename 原子写入
+    - 索引变更在跨进程文件锁 (index.lock) 内执行：先同步其他进程的变更，再追加日志
+    - 读取时通过快照签名与日志长度检测并发修改，发现变化后重新同步内存索引
+    """
+    
+    # 日志操作数超过 max(该值, 活动数) 时压缩为新快照，保证总I/O为线性
+    INDEX_COMPACT_MIN_OPS = 500
+    # 重建索引时文件数达到该值才启用进程池
+    REBUILD_PARALLEL_MIN_FILES = 32
+    # 批量删除/更新时并行处理文件的线程数
+    BULK_IO_WORKERS = 8
+    # 允许通过元数据更新接口修改的字段（保存在元数据附属文件中）
+    EDITABLE_METADATA_FIELDS = ("name", "sport", "notes", "tags", "merge_provenance")
+    # 后台迁移每处理一个活动后的休眠时间（秒）
+    MIGRATION_THROTTLE_SEC = 0.05
+    # 冷存储：活动日期与最近访问时间都早于该天数时归档为压缩文件
+    COLD_AFTER_DAYS = 180
+    # 同一活动的访问时间最多每隔该秒数记录一次
+    ACCESS_RECORD_INTERVAL_SEC = 3600
+    # 内存中累积的访问时间达到该数量时合并为一次日志提交
+    ACCESS_PERSIST_BATCH = 100
+    # 删除/修改元数据等操作前等待写回队列写完的最长时间（秒）
+    FLUSH_TIMEOUT_SEC = 30
+    # 记录缓存的默认上限（MB），0表示不缓存
+    RECORD_CACHE_MB = 64
+    # 可信加载：存储自己写入且校验和一致的记录跳过 Record 的逐字段校验
+    TRUSTED_LOAD = True
+    # 活动头部应包含的字段（records 以外的 Activity 字段）
+    _HEADER_FIELDS = frozenset(name for name in Activity.model_fields if name != 'records')
     
-    def __init__(self, data_dir: str):
+    def __init__(self, data_dir: str, write_behind: bool = False, record_cache_mb: Optional[float] = None):
+        """
+        Args:
+            data_dir: 数据目录
+            write_behind: 写回模式，保存活动时只更新内存并立即返回，由后台线程写入磁盘
+            record_cache_mb: 记录缓存上限（MB），None表示 RECORD_CACHE_MB，0表示不缓存
+        """
         self.data_dir = Path(data_dir)
         self.activities_dir = self.data_dir / "activities"
         self.index_file = self.data_dir / "index.json"
+        self.journal_file = self.data_dir / "index.journal"
+        self._journal = IndexJournal(self.index_file, self.journal_file)
+        self._lock = FileLock(self.data_dir / "index.lock")
+        
+        # 内存中的索引（按插入顺序，最新的在最后），首次访问时加载
+        self._entries: Optional[Dict[str, ActivityMeta]] = None
+        # 加载内存索引时的快照签名，用于检测其他进程的压缩/重写
+        self._snapshot_sig = None
+        self._updated_at = datetime.now()
+        self._snapshot_dirty = False
+        # batch() 期间累积的日志操作
+        self._pending_ops: Optional[List[Dict[str, Any]]] = None
+        # 后台格式迁移
+        self._migration: Optional[MigrationWorker] = None
+        # 搜索索引与统计汇总，首次使用时由内存索引构建，之后随索引操作增量维护
+        self._search: Optional[SearchIndex] = None
+        self._rollup: Optional[StatsRollup] = None
+        self._field_index: Optional[FieldIndex] = None
+        # 圈索引（持久化在 laps.cache，按签名增量刷新）；内存索引整体重新加载后需要重新对齐
+        self._lap_index: Optional[LapIndex] = None
+        self._lap_index_synced = False
+        # 尚未写入索引日志的访问时间（活动ID -> 时间）
+        self._unsaved_access: Dict[str, datetime] = {}
+        self._access_lock = threading.Lock()
+        # 写回模式的队列（尚未写入磁盘的活动）
+        self._write_behind: Optional[WriteBehindQueue] = None
+        # 最近读取的记录列（紧凑类型）
+        cache_mb = self.RECORD_CACHE_MB if record_cache_mb is None else record_cache_mb
+        self._record_cache = RecordCache(int(cache_mb * 1024 * 1024)) if cache_mb > 0 else None
+        # 原始FIT文件存档（按内容寻址，用于重新解析）
+        self.raw_store = RawStore(self.data_dir / RAW_DIR_NAME)
         
         # 确保目录存在
         self.activities_dir.mkdir(parents=True, exist_ok=True)
         
         # 初始化索引
-        if not self.index_file.exists():
-            self._save_index(ActivityIndex())
+        with self._lock:
+            if not self.index_file.exists():
+                self._save_index(ActivityIndex())
+        
+        if write_behind:
+            self._write_behind = WriteBehindQueue(self)
     
     def _load_index(self) -> ActivityIndex:
-        """加载活动索引，如果索引损坏则尝试从磁盘重建"""
+        """加载活动索引（快照 + 日志重放），结果缓存在内存中"""
+        self._ensure_index()
+        return ActivityIndex(
+            activities=list(reversed(self._entries.values())),
+            updated_at=self._updated_at
+        )
+    
+    def _ensure_index(self):
+        """确保内存索引已加载且与磁盘一致"""
+        if self._entries is not None and not self._index_changed_on_disk():
+            return
+        with self._lock:
+            self._sync_index()
+    
+    def _index_changed_on_disk(self) -> bool:
+        """检测其他进程是否修改了索引（无锁的廉价stat检查）"""
+        return (self._journal.snapshot_signature() != self._snapshot_sig
+                or self._journal.journal_size() != self._journal.offset)
+    
+    def _sync_index(self):
+        """（需持有锁）将其他进程的索引变更同步到内存"""
+        if self._entries is not None and self._journal.snapshot_signature() == self._snapshot_sig:
+            if self._journal.journal_size() >= self._journal.offset:
+                # 只有日志增长：增量重放新追加的部分
+                ops, _ = self._journal.read_ops(self._journal.offset)
+                for op in ops:
+                    self._apply_index_op(op)
+                return
+        
+        # 快照被替换或日志被截断（其他进程压缩过）：完整重新加载
+        index = self._read_index_snapshot()
+        self._entries = {a.id: a for a in reversed(index.activities)}
+        self._search = None
+        self._rollup = None
+        self._field_index = None
+        self._lap_index_synced = False
+        self._updated_at = index.updated_at
+        self._snapshot_sig = self._journal.snapshot_signature()
+        
+        ops, _ = self._journal.read_ops(0)
+        for op in ops:
+            self._apply_index_op(op)
+        self._reapply_write_behind()
+        
+        # 快照经过修复时，在重放日志之后再回写，避免丢失日志中的变更
+        if self._snapshot_dirty:
+            self._snapshot_dirty = False
+            self._compact_index()
+    
+    def _read_index_snapshot(self) -> ActivityIndex:
+        """读取索引快照，如果快照损坏则尝试从磁盘重建"""
         try:
-            with open(self.index_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            with open(self.index_file, 'rb') as f:
+                data = loads(f.read())
                 try:
                     return ActivityIndex(**data)
                 except Exception as e:
@@ -44,9 +325,9 @@ class DataStore:
                             data['updated_at'] = datetime.now().isoformat()
                         try:
                             index = ActivityIndex(**data)
-                            # 尝试回写修复后的索引，避免后续启动再次失败
+                            # 重放日志后回写修复后的索引，避免后续启动再次失败
                             print(f"成功修复索引文件，包含 {len(index.activities)} 个活动")
-                            self._save_index(index)
+                            self._snapshot_dirty = True
                             return index
                         except Exception as e2:
                             print(f"索引修复失败: {e2}，尝试从磁盘重建...")
@@ -61,43 +342,223 @@ class DataStore:
     
     def _rebuild_index_from_disk(self) -> ActivityIndex:
         """从activities目录重建索引"""
+        index, _ = self.rebuild_index()
+        return index
+    
+    def rebuild_index(
+        self,
+        max_workers: Optional[int] = None,
+        progress_callback: Optional[Callable[[int, int], None]] = None
+    ) -> Tuple[ActivityIndex, Dict[str, Any]]:
+        """
+        从activities目录重建索引
+        
+        只读取每个活动的头部（不解析records），文件较多时分发到进程池并行处理。
+        
+        Args:
+            max_workers: 并行工作进程数，None表示CPU核数
+            progress_callback: 进度回调 (已处理数, 总数)
+        
+        Returns:
+            (重建的索引, 报告 {"rebuilt": 成功数, "skipped": [{"file", "error"}], "duration_sec"})
+        """
+        self.flush(self.FLUSH_TIMEOUT_SEC)
         print("开始从磁盘重建索引...")
+        started = time.time()
         index = ActivityIndex()
+        report: Dict[str, Any] = {"rebuilt": 0, "skipped": [], "duration_sec": 0.0}
         
         # 扫描activities目录
         if not self.activities_dir.exists():
             print("activities目录不存在，返回空索引")
-            return index
+            return index, report
         
-        rebuilt_count = 0
-        for activity_file in self.activities_dir.glob("*.json"):
-            try:
-                with open(activity_file, 'r', encoding='utf-8') as f:
-                    activity_data = json.load(f)
-                    activity = Activity(**activity_data)
-                    meta = self._activity_to_meta(activity)
-                    index.activities.append(meta)
-                    rebuilt_count += 1
-            except Exception as e:
-                print(f"警告: 无法加载活动文件 {activity_file.name}: {e}")
-                continue
+        # 旧的平铺文件在前、分片目录在后，同一活动同时存在时（迁移中断）以分片目录为准；
+        # 冷存储归档只读取其中的头部
+        patterns = ("*.json", "*" + COLD_SUFFIX)
+        files = [str(p) for pattern in patterns for p in self.activities_dir.glob(pattern)]
+        for year_dir in sorted(self._shard_year_dirs()):
+            files.extend(str(p) for pattern in patterns for p in sorted(year_dir.glob("*/" + pattern)))
+        total = len(files)
         
-        if rebuilt_count > 0:
-            print(f"成功重建索引，恢复了 {rebuilt_count} 个活动")
+        # 打包版本(PyInstaller)中不使用子进程，避免重复启动应用
+        if total >= self.REBUILD_PARALLEL_MIN_FILES and not getattr(sys, 'frozen', False):
+            executor = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            executor = ThreadPoolExecutor(max_workers=1)
+        
+        progress_step = max(1, total // 20)
+        found: Dict[str, ActivityMeta] = {}
+        with executor:
+            results = executor.map(_read_meta_for_rebuild, files, chunksize=16)
+            for done, (file_name, meta, error) in enumerate(results, start=1):
+                if meta is not None:
+                    found[meta['id']] = ActivityMeta(**meta)
+                else:
+                    print(f"警告: 无法加载活动文件 {file_name}: {error}")
+                    report["skipped"].append({"file": file_name, "error": error})
+                
+                if progress_callback:
+                    progress_callback(done, total)
+                if done % progress_step == 0 or done == total:
+                    print(f"重建索引进度: {done}/{total}")
+        
+        # 最新的活动排在最前面
+        index.activities = list(found.values())
+        index.activities.sort(key=lambda a: a.date.timestamp() if a.date else 0, reverse=True)
+        report["rebuilt"] = len(index.activities)
+        report["duration_sec"] = round(time.time() - started, 3)
+        
+        if index.activities:
+            print(f"成功重建索引，恢复了 {report['rebuilt']} 个活动，跳过 {len(report['skipped'])} 个文件")
             # 保存重建的索引
             self._save_index(index)
         else:
             print("未找到有效的活动文件，返回空索引")
         
-        return index
+        return index, report
     
     def _save_index(self, index: ActivityIndex):
-        """保存活动索引"""
-        index.updated_at = datetime.now()
-        with open(self.index_file, 'w', encoding='utf-8') as f:
-            json.dump(index.model_dump(mode='json'), f, ensure_ascii=False, indent=2, default=str)
+        """整体保存活动索引（原子写入快照并清空日志）"""
+        with self._lock:
+            index.updated_at = datetime.now()
+            self._journal.write_snapshot(index.model_dump(mode='json'))
+            self._search = None
+            self._rollup = None
+            self._field_index = None
+            self._lap_index_synced = False
+            self._entries = {a.id: a for a in reversed(index.activities)}
+            self._updated_at = index.updated_at
+            self._snapshot_sig = self._journal.snapshot_signature()
+            self._reapply_write_behind()
+    
+    def replace_index(self, activities: List[ActivityMeta]):
+        """
+        用给定的条目整体替换索引（写入新快照并清空日志，不读写活动文件）
+        
+        用于恢复/导入后为已就位的活动文件生成索引。
+        
+        Args:
+            activities: 索引条目（最新的活动在前）
+        """
+        self._save_index(ActivityIndex(activities=activities))
+    
+    def _reapply_write_behind(self, activity_ids: Optional[Set[str]] = None):
+        """（需持有锁）重新应用写回队列中尚未提交到日志的活动，避免重新加载索引后丢失"""
+        if self._write_behind is None:
+            return
+        for meta in self._write_behind.pending_metas():
+            if activity_ids is None or meta.id in activity_ids:
+                self._apply_index_op({"op": "put", "meta": meta.model_dump(mode='json')})
+    
+    def _compact_index(self):
+        """将内存索引压缩为新快照"""
+        self._save_index(self._load_index())
+    
+    def _apply_index_op(self, op: Dict[str, Any]):
+        """将一条日志操作应用到内存索引"""
+        kind = op.get('op')
+        if kind == 'put':
+            meta = ActivityMeta(**op['meta'])
+            # 已存在的活动原位更新，新活动追加到末尾（即列表最前面）
+            old = self._entries.get(meta.id)
+            if meta.last_accessed is None and old is not None:
+                meta.last_accessed = old.last_accessed
+            self._entries[meta.id] = meta
+            if self._search is not None:
+                self._search.put(meta)
+            if self._rollup is not None:
+                self._rollup.put(meta, old)
+            if self._field_index is not None:
+                self._field_index.put(meta, old)
+            if self._lap_index is not None:
+                self._lap_index.put(meta)
+        elif kind == 'del':
+            old = self._entries.pop(op.get('id'), None)
+            if self._search is not None:
+                self._search.remove(op.get('id'))
+            if self._rollup is not None and old is not None:
+                self._rollup.remove(old)
+            if self._field_index is not None and old is not None:
+                self._field_index.remove(old)
+            if self._lap_index is not None:
+                self._lap_index.remove(op.get('id'))
+        elif kind == 'touch':
+            meta = self._entries.get(op.get('id'))
+            if meta is not None:
+                self._entries[meta.id] = meta.model_copy(update={"last_accessed": datetime.fromisoformat(op['at'])})
+        else:
+            print(f"警告: 忽略未知的索引日志操作: {kind}")
+    
+    def _commit_index_ops(self, ops: List[Dict[str, Any]]):
+        """应用索引变更并追加到日志（batch() 期间延迟到批次结束统一提交）"""
+        with self._lock:
+            # 先同步其他进程的变更，避免基于过期索引追加/压缩
+            self._sync_index()
+            for op in ops:
+                self._apply_index_op(op)
+            self._updated_at = datetime.now()
+            
+            if self._pending_ops is not None:
+                self._pending_ops.extend(ops)
+                return
+            
+            self._journal.append(ops)
+            self._maybe_compact_index()
+    
+    def put_entries(self, metas: List[ActivityMeta]):
+        """
+        直接写入索引条目（不写活动文件，用于按磁盘文件修复索引）
+        
+        与 batch() 一起使用时合并为一次日志提交。
+        """
+        if metas:
+            self._commit_index_ops([{"op": "put", "meta": meta.model_dump(mode='json')} for meta in metas])
     
-    def _activity_to_meta(self, activity: Activity) -> ActivityMeta:
+    def drop_entries(self, activity_ids: Collection[str]) -> List[str]:
+        """
+        从索引删除条目（不删除活动文件，用于清理文件已丢失或已隔离的活动）
+        
+        Returns:
+            实际删除的活动ID
+        """
+        with self._lock:
+            self._ensure_index()
+            dropped = [activity_id for activity_id in activity_ids if activity_id in self._entries]
+            if dropped:
+                self._commit_index_ops([{"op": "del", "id": activity_id} for activity_id in dropped])
+            return dropped
+    
+    def _maybe_compact_index(self):
+        """日志过长时压缩"""
+        if self._journal.op_count >= max(self.INDEX_COMPACT_MIN_OPS, len(self._entries)):
+            self._compact_index()
+    
+    @contextmanager
+    def batch(self):
+        """
+        批量提交索引变更
+        
+        批次内的所有 save/delete 只在结束时追加一次日志、执行一次fsync。
+        批次期间持有索引锁，其他进程的索引变更会等待批次结束。
+        支持嵌套，只有最外层批次负责提交。批次内的保存总是同步写入。
+        """
+        self.flush(self.FLUSH_TIMEOUT_SEC)
+        with self._lock:
+            if self._pending_ops is not None:
+                yield
+                return
+            
+            self._pending_ops = []
+            try:
+                yield
+            finally:
+                ops, self._pending_ops = self._pending_ops, None
+                self._journal.append(ops)
+                self._maybe_compact_index()
+    
+    @staticmethod
+    def _activity_to_meta(activity: Activity) -> ActivityMeta:
         """将Activity转换为ActivityMeta"""
         session = activity.session
         
@@ -123,9 +584,35 @@ class DataStore:
             avg_power=session.avg_power,
             total_ascent=session.total_ascent,
             available_fields=activity.available_fields,
-            available_iq_fields=activity.available_iq_fields
+            available_iq_fields=activity.available_iq_fields,
+            file_name=activity.file_name,
+            devices=DataStore._activity_devices(activity),
+            notes=activity.notes,
+            tags=activity.tags,
+            raw_sha256=activity.raw_sha256,
+            parser_version=activity.parser_version,
+            base_id=activity.base_id
         )
     
+    @staticmethod
+    def _activity_devices(activity: Activity) -> List[str]:
+        """活动关联的设备名：按前缀识别的IQ字段设备 + 心率合并来源设备"""
+        return DataStore._devices_of(activity.available_iq_fields, activity.merge_provenance)
+    
+    @staticmethod
+    def _devices_of(available_iq_fields: List[str], merge_provenance: Optional[MergeProvenance]) -> List[str]:
+        """见 _activity_devices"""
+        devices: Dict[str, None] = {}
+        for field in available_iq_fields:
+            device = DeviceRegistry.get_device_by_prefix(field)
+            if device is not None:
+                devices.setdefault(device.device_name, None)
+        if merge_provenance is not None:
+            for source in merge_provenance.sources:
+                if source.device_name:
+                    devices.setdefault(source.device_name, None)
+        return list(devices)
+    
     def save_activity(self, activity: Activity) -> ActivityMeta:
         """
         保存活动到文件系统
@@ -136,47 +623,678 @@ class DataStore:
         Returns:
             ActivityMeta对象
         """
-        # 保存活动详情
-        activity_file = self.activities_dir / f"{activity.id}.json"
-        with open(activity_file, 'w', encoding='utf-8') as f:
-            json.dump(activity.model_dump(mode='json'), f, ensure_ascii=False, indent=2, default=str)
-        
-        # 更新索引
         meta = self._activity_to_meta(activity)
-        index = self._load_index()
+        # 刚保存（上传、合并、重新解析）的活动视为刚使用，不会因活动日期较早而被立即归档
+        meta.last_accessed = datetime.now()
+        op = {"op": "put", "meta": meta.model_dump(mode='json')}
+        self._detach_overlays(activity)
         
-        # 检查是否已存在（更新）
-        existing_idx = next((i for i, a in enumerate(index.activities) if a.id == activity.id), None)
-        if existing_idx is not None:
-            index.activities[existing_idx] = meta
-        else:
-            index.activities.insert(0, meta)  # 新活动放在最前面
+        if self._write_behind is not None and self._pending_ops is None:
+            # 写回模式：只更新内存索引，活动文件和索引日志由后台线程写入
+            with self._lock:
+                self._sync_index()
+                self._apply_index_op(op)
+                self._updated_at = datetime.now()
+                self._write_behind.submit(activity, meta)
+            self._invalidate_laps(meta.id)
+            return meta
+        
+        self._write_activity_files(activity)
         
-        self._save_index(index)
+        # 更新索引（已存在则原位更新，新活动放在最前面）
+        self._commit_index_ops([op])
+        self._invalidate_laps(meta.id)
         
         return meta
     
-    def get_activity(self, activity_id: str) -> Optional[Activity]:
+    def _invalidate_laps(self, activity_id: str):
+        """活动被重新保存：圈数据可能变化而索引元数据（圈索引签名）不变"""
+        if self._lap_index is not None:
+            self._lap_index.invalidate(activity_id)
+    
+    def _overlays_of(self, activity_id: str) -> List[str]:
+        """直接引用该活动的合并活动（覆盖层）ID"""
+        self._ensure_index()
+        return [meta.id for meta in list(self._entries.values()) if meta.base_id == activity_id]
+    
+    def _materialize_overlay(self, activity_id: str):
+        """把合并活动（覆盖层）重写为完整活动，不再引用基础活动"""
+        activity = self.get_activity(activity_id)
+        if activity is None:
+            print(f"警告: 无法读取合并活动，保留为覆盖层: {activity_id}")
+            return
+        activity.base_id = None
+        activity.overlay_fields = []
+        self.save_activity(activity)
+    
+    def _detach_overlays(self, activity: Activity):
+        """
+        写时复制：即将保存的活动被合并活动引用，且记录时间轴变化（记录数或 elapsed_time 不同）时，
+        先把这些合并活动物化为完整活动；时间轴不变时（如重新解析只修正了字段值）继续引用
+        """
+        overlays = self._overlays_of(activity.id)
+        if not overlays:
+            return
+        stored = self._read_activity_data(activity.id, [TIME_FIELD], record_access=False)
+        if stored is not None and stored['record_count'] == len(activity.records):
+            times = stored['columns'].get(TIME_FIELD, [None] * stored['record_count'])
+            if times == [r.elapsed_time for r in activity.records]:
+                return
+        for overlay_id in overlays:
+            self._materialize_overlay(overlay_id)
+    
+    def _commit_written(self, metas: List[ActivityMeta]):
+        """写回线程写完一轮活动文件后，合并为一次日志提交"""
+        with self._lock:
+            self._commit_index_ops([{"op": "put", "meta": meta.model_dump(mode='json')} for meta in metas])
+            # 写入期间又被保存的活动，内存索引保持最新版本
+            self._reapply_write_behind({meta.id for meta in metas})
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        写回模式下等待已保存的活动全部写入磁盘（显式持久化点）
+        
+        持有索引锁时不等待（写回线程提交索引需要该锁），直接返回False。
+        多次写入失败而被放弃的活动也视为已处理。
+        
+        Returns:
+            是否全部写入（非写回模式总是True）
+        """
+        if self._write_behind is None:
+            return True
+        if self._lock.held_by_current_thread():
+            return False
+        return self._write_behind.flush(timeout)
+    
+    def _flush_before_mutation(self):
+        """
+        删除/修改元数据前等待写回队列写完（最多 FLUSH_TIMEOUT_SEC 秒）
+        
+        Raises:
+            TimeoutError: 超时仍未写完
+        """
+        if self._write_behind is None or self._lock.held_by_current_thread():
+            return
+        if not self._write_behind.flush(self.FLUSH_TIMEOUT_SEC):
+            raise TimeoutError(f"写回队列未能在 {self.FLUSH_TIMEOUT_SEC} 秒内写入磁盘")
+    
+    def _discard_unwritten(self):
+        """写回线程放弃写入活动后调用：从磁盘重新加载索引，丢弃内存中未持久化的版本"""
+        with self._lock:
+            # 清空快照签名使 _sync_index 完整重新加载（仍在队列中的活动会被重新应用）
+            self._snapshot_sig = None
+            self._sync_index()
+    
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """
+        关闭存储：提交内存中的访问时间，等待写回队列写完并停止后台写入线程，之后的保存改为同步写入
+        
+        Returns:
+            写回队列是否已全部写入
+        """
+        self.persist_access_times()
+        queue = self._write_behind
+        if queue is None:
+            return True
+        drained = queue.close(timeout)
+        if drained:
+            self._write_behind = None
+        else:
+            print(f"警告: 仍有 {queue.status()['pending']} 个活动未写入磁盘")
+        return drained
+    
+    def write_behind_status(self) -> Dict[str, Any]:
+        """
+        写回队列状态
+        
+        Returns:
+            {"enabled", "pending", "writing", "closed", "written", "commits", "failed",
+             "abandoned", "abandoned_ids", "last_error", "last_commit_at"}
+        """
+        if self._write_behind is None:
+            return {"enabled": False}
+        return {"enabled": True, **self._write_behind.status()}
+    
+    def is_write_pending(self, activity_id: str) -> bool:
+        """活动是否在写回队列中尚未写入磁盘"""
+        return self._write_behind is not None and self._write_behind.get(activity_id) is not None
+    
+    def referenced_raw_hashes(self) -> Set[str]:
+        """索引与写回队列中的活动引用的原始FIT文件哈希"""
+        with self._lock:
+            self._ensure_index()
+            referenced = {meta.raw_sha256 for meta in self._entries.values() if meta.raw_sha256}
+            if self._write_behind is not None:
+                for activity_id in list(self._entries):
+                    pending = self._write_behind.get(activity_id)
+                    if pending is not None and pending.raw_sha256:
+                        referenced.add(pending.raw_sha256)
+            return referenced
+    
+    def _write_activity_files(self, activity: Activity):
+        """写入活动头部和列式记录（不更新索引），文件位于活动日期对应的分片目录"""
+        previous_dir = self._activity_dir(activity.id)
+        directory, files = self._encode_activity_files(activity)
+        directory.mkdir(parents=True, exist_ok=True)
+        
+        # 先写列式记录和LOD，再写头部（均为原子写入，读取方不会看到写了一半的文件）
+        for path, data in files:
+            atomic_write_bytes(path, data)
+        self._finish_activity_files(activity.id, directory, previous_dir)
+    
+    def _encode_activity_files(self, activity: Activity) -> Tuple[Path, List[Tuple[Path, bytes]]]:
+        """
+        编码活动的列式记录、LOD和头部（不写入磁盘）
+        
+        Returns:
+            (活动日期对应的分片目录, [(文件路径, 内容)])，按写入顺序排列，头部在最后
+        """
+        directory = self._shard_dir(activity.session.start_time or activity.created_at)
+        if activity.base_id is not None:
+            # 覆盖层只保存自己的列；LOD按相同的时间轴只计算这些列
+            columns = select_record_columns(activity.records, activity.overlay_fields)
+            lod_columns = build_lod_columns({TIME_FIELD: [r.elapsed_time for r in activity.records], **columns})
+        else:
+            columns = records_to_columns(activity.records)
+            lod_columns = build_lod_columns(columns)
+        records_data, checksum = encode_column_pack(columns, len(activity.records), chunked=activity.base_id is None)
+        lod_data, _ = encode_column_pack(lod_columns, len(activity.records))
+        
+        header = activity.model_dump(mode='json', exclude={'records'})
+        header['schema_version'] = ACTIVITY_SCHEMA_VERSION
+        header['record_count'] = len(activity.records)
+        header['records_checksum'] = checksum
+        return directory, [
+            (self._records_file(activity.id, directory), records_data),
+            (self._lod_file(activity.id, directory), lod_data),
+            (self._activity_file(activity.id, directory), dumps(header, indent=True)),
+        ]
+    
+    def _finish_activity_files(self, activity_id: str, directory: Path, previous_dir: Path):
+        """新文件写入后：删除冷存储归档和元数据附属文件（已合并进头部），从旧位置迁出时删除旧文件"""
+        self._cold_file(activity_id, directory).unlink(missing_ok=True)
+        self._metadata_file(activity_id, directory).unlink(missing_ok=True)
+        
+        # 从旧位置（平铺目录或其他分片）迁出后删除旧文件
+        if previous_dir != directory:
+            self._remove_activity_files(activity_id, previous_dir)
+    
+    def stage_activity(self, activity: Activity, expected: ActivityMeta) -> "StagedActivity":
+        """
+        在锁外准备重写活动（后台迁移/重新解析用）：编码并把新文件写为同目录下的临时文件
+        
+        之后由 commit_staged() 在索引锁内只做复核、rename和索引提交，编码与写盘不占用索引锁，
+        上传、删除和元数据修改不会等待整批活动重写完成。
+        
+        Args:
+            activity: 重写后的活动
+            expected: 读取旧活动前的索引条目，提交时索引条目仍与之一致才替换
+        """
+        self._detach_overlays(activity)
+        directory, files = self._encode_activity_files(activity)
+        directory.mkdir(parents=True, exist_ok=True)
+        staged = StagedActivity(self._activity_to_meta(activity), expected, directory)
+        try:
+            for path, data in files:
+                staged.files.append((write_temp_file(path, data), path))
+        except BaseException:
+            staged.discard()
+            raise
+        return staged
+    
+    def commit_staged(self, staged: List["StagedActivity"]) -> List[bool]:
+        """
+        提交 stage_activity() 准备好的活动：一次索引锁、一次日志提交
+        
+        准备期间活动被保存、删除、修改元数据或冻结（索引条目与 expected 不一致，
+        访问时间除外）时放弃该活动的新文件，不覆盖其他修改。
+        
+        Returns:
+            每个活动是否已替换
+        """
+        results = []
+        ops = []
+        with self._lock:
+            self._sync_index()
+            for item in staged:
+                activity_id = item.meta.id
+                current = self._entries.get(activity_id)
+                pending = self._write_behind is not None and self._write_behind.get(activity_id) is not None
+                if pending or not _same_entry(current, item.expected):
+                    item.discard()
+                    results.append(False)
+                    continue
+                previous_dir = self._activity_dir(activity_id)
+                try:
+                    # 头部最后替换，读取方不会看到新头部配旧记录
+                    for tmp_name, path in item.files:
+                        os.replace(tmp_name, path)
+                except OSError as e:
+                    print(f"警告: 替换活动文件失败 {activity_id}: {e}")
+                    item.discard()
+                    results.append(False)
+                    continue
+                item.files = []
+                self._finish_activity_files(activity_id, item.directory, previous_dir)
+                ops.append({"op": "put", "meta": item.meta.model_dump(mode='json')})
+                results.append(True)
+            if ops:
+                self._commit_index_ops(ops)
+        for item, replaced in zip(staged, results):
+            if replaced:
+                self._invalidate_laps(item.meta.id)
+        return results
+    
+    def _shard_dir(self, when: Optional[datetime]) -> Path:
+        """按活动日期分片的目录 activities/YYYY/MM（没有日期时为平铺目录）"""
+        if when is None:
+            return self.activities_dir
+        return self.activities_dir / f"{when.year:04d}" / f"{when.month:02d}"
+    
+    def _shard_year_dirs(self) -> List[Path]:
+        """activities/ 下的年份分片目录"""
+        return [p for p in self.activities_dir.iterdir() if p.is_dir() and p.name.isdigit()]
+    
+    def _activity_dir(self, activity_id: str) -> Path:
+        """
+        通过索引定位活动文件所在目录
+        
+        由索引中的活动日期确定分片目录；文件不在分片目录时（旧的平铺布局，
+        或尚未写入索引的活动）退回 activities/ 本身。冷存储归档与热存储文件位于同一目录。
+        """
+        self._ensure_index()
+        meta = self._entries.get(activity_id)
+        if meta is not None and meta.date is not None:
+            directory = self._shard_dir(meta.date)
+            if (directory / f"{activity_id}.json").exists() or (directory / f"{activity_id}{COLD_SUFFIX}").exists():
+                return directory
+        return self.activities_dir
+    
+    def activity_dir(self, activity_id: str) -> Path:
+        """活动文件的读取目录（见 _activity_dir）"""
+        return self._activity_dir(activity_id)
+    
+    def has_activity_files(self, activity_id: str) -> bool:
+        """读取目录中是否有活动的头部文件或冷存储归档"""
+        directory = self._activity_dir(activity_id)
+        return self._activity_file(activity_id, directory).exists() or self._cold_file(activity_id, directory).exists()
+    
+    def _activity_file(self, activity_id: str, directory: Optional[Path] = None) -> Path:
+        """活动头部文件路径（旧格式下为完整活动文件）"""
+        return (directory or self._activity_dir(activity_id)) / f"{activity_id}.json"
+    
+    def _records_file(self, activity_id: str, directory: Optional[Path] = None) -> Path:
+        """列式记录文件路径"""
+        return (directory or self._activity_dir(activity_id)) / f"{activity_id}.rec"
+    
+    def _lod_file(self, activity_id: str, directory: Optional[Path] = None) -> Path:
+        """多分辨率包络文件路径"""
+        return (directory or self._activity_dir(activity_id)) / f"{activity_id}.lod"
+    
+    def _cold_file(self, activity_id: str, directory: Optional[Path] = None) -> Path:
+        """冷存储归档路径"""
+        return (directory or self._activity_dir(activity_id)) / f"{activity_id}{COLD_SUFFIX}"
+    
+    def _metadata_file(self, activity_id: str, directory: Optional[Path] = None) -> Path:
+        """元数据附属文件路径（不打包进冷存储归档）"""
+        return (directory or self._activity_dir(activity_id)) / f"{activity_id}{METADATA_SUFFIX}"
+    
+    def _stored_schema_version(self, activity_id: str) -> Optional[int]:
+        """活动文件在磁盘上的格式版本（活动不存在时返回None）"""
+        directory = self._activity_dir(activity_id)
+        try:
+            if not self._records_file(activity_id, directory).exists():
+                return 1 if self._activity_file(activity_id, directory).exists() else None
+            with open(self._activity_file(activity_id, directory), 'rb') as f:
+                return loads(f.read()).get('schema_version', 1)
+        except FileNotFoundError:
+            return None
+    
+    def _activity_paths(self, activity_id: str, directory: Optional[Path] = None) -> List[Path]:
+        """活动的所有数据文件"""
+        directory = directory or self._activity_dir(activity_id)
+        return [
+            self._activity_file(activity_id, directory),
+            self._records_file(activity_id, directory),
+            self._lod_file(activity_id, directory),
+            self._cold_file(activity_id, directory),
+            self._metadata_file(activity_id, directory),
+        ]
+    
+    def _read_activity_data(
+        self,
+        activity_id: str,
+        fields: Optional[List[str]] = None,
+        record_access: bool = True,
+        record_range: Optional[RecordRange] = None,
+        check_trusted: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """
+        读取活动原始数据，records 以列字典形式放在 "columns" 键中
+        
+        兼容所有旧版本：schema 1 的 records 会被转换为列，
+        结果在内存中升级到最新版本（字段改名等），磁盘文件由后台迁移重写。
+        写回模式下尚未写入磁盘的活动直接从队列中读取；冷存储的活动先解压回热存储。
+        record_access 为False时（后台迁移等内部读取）不记录访问时间。
+        record_range 只返回范围内的记录（record_count 为范围内的记录数），
+        分块的 .rec 文件只读取与范围重叠的块。
+        合并活动（覆盖层，头部带 base_id）的其余列从基础活动读取，见 _read_overlay_records。
+        check_trusted 为True时结果带 "trusted" 键：记录文件为最新格式，且其校验和与
+        头部保存的 records_checksum 一致（即由存储自己写入，数据块已逐块校验CRC32）。
+        """
+        pending = self._write_behind.get(activity_id) if self._write_behind is not None else None
+        if pending is not None:
+            count, columns = self._select_records(
+                records_to_columns(pending.records), len(pending.records), fields, record_range
+            )
+            data = pending.model_dump(mode='json', exclude={'records'})
+            data.update(schema_version=ACTIVITY_SCHEMA_VERSION, record_count=count, columns=columns)
+            if check_trusted:
+                data['trusted'] = True
+            return data
+        
+        directory = self._hot_dir(activity_id, record_access)
+        activity_file = self._activity_file(activity_id, directory)
+        if not activity_file.exists():
+            return None
+        
+        with open(activity_file, 'rb') as f:
+            data = loads(f.read())
+        apply_metadata(data, read_metadata_sidecar(self._metadata_file(activity_id, directory)))
+        
+        version = data.get('schema_version', 1)
+        wanted = stored_column_names(version, fields) if fields is not None else None
+        trusted = False
+        if data.get('base_id') is not None:
+            count, columns, trusted = self._read_overlay_records(
+                data, self._records_file(activity_id, directory), fields, record_access, record_range, check_trusted
+            )
+        elif version >= 2:
+            records_file = self._records_file(activity_id, directory)
+            if check_trusted and version == ACTIVITY_SCHEMA_VERSION and data.get('records_checksum') is not None:
+                trusted = pack_checksum(records_file) == data['records_checksum']
+            count, columns = self._read_records(records_file, wanted, record_range)
+        else:
+            records = [Record(**r) for r in data.pop('records', [])]
+            count, columns = len(records), records_to_columns(records)
+        count, columns = self._select_records(columns, count, wanted, record_range)
+        
+        data['record_count'] = count
+        data['columns'] = columns
+        if check_trusted:
+            data['trusted'] = trusted
+        return upgrade_activity_data(data)
+    
+    def _read_overlay_records(
+        self,
+        data: Dict[str, Any],
+        records_file: Path,
+        fields: Optional[List[str]],
+        record_access: bool,
+        record_range: Optional[RecordRange],
+        check_trusted: bool
+    ) -> Tuple[int, Dict[str, List[Any]], bool]:
+        """
+        读取合并活动（覆盖层）的记录：基础活动的列 + 自己保存的 overlay_fields 列
+        
+        基础活动本身也可以是覆盖层（对合并结果再次合并），逐层解析。
+        返回未按范围筛选的 (记录数, 列字典, 是否可信)，范围由调用方筛选。
+        
+        Raises:
+            ValueError: 基础活动不存在，或记录数与基础活动不一致
+        """
+        own_names = data.get('overlay_fields') or []
+        base_fields = None
+        if fields is not None:
+            base_fields = [name for name in fields if name not in own_names]
+            if record_range is not None and record_range[0] not in base_fields:
+                base_fields.append(record_range[0])
+        base = self._read_activity_data(data['base_id'], base_fields, record_access, check_trusted=check_trusted)
+        if base is None:
+            raise ValueError(f"合并活动引用的基础活动不存在: {data['base_id']}")
+        
+        own_wanted = own_names if fields is None else [name for name in own_names if name in fields]
+        count, own = self._read_records(records_file, own_wanted, None)
+        if count != base['record_count']:
+            raise ValueError(f"合并活动与基础活动的记录数不一致: {count}, {base['record_count']}")
+        
+        trusted = False
+        if check_trusted and base.get('trusted') and data.get('records_checksum') is not None \
+                and data.get('schema_version', 1) == ACTIVITY_SCHEMA_VERSION:
+            trusted = pack_checksum(records_file) == data['records_checksum']
+        return count, {**base['columns'], **own}, trusted
+    
+    def _read_records(
+        self,
+        records_file: Path,
+        names: Optional[List[str]],
+        record_range: Optional[RecordRange]
+    ) -> Tuple[int, Dict[str, List[Any]]]:
+        """
+        读取列式记录，优先使用记录缓存
+        
+        范围读取在缓存未命中时只读取重叠的块，不加入缓存；完整读取的列加入缓存。
+        """
+        if self._record_cache is None:
+            if record_range is not None:
+                return read_column_pack_range(records_file, names, *record_range)
+            return read_column_pack(records_file, names)
+        
+        if record_range is not None:
+            range_names = None if names is None else list(dict.fromkeys([record_range[0], *names]))
+            cached = self._record_cache.read(records_file, range_names, load=False)
+            if cached is not None:
+                return cached
+            return read_column_pack_range(records_file, names, *record_range)
+        return self._record_cache.read(records_file, names)
+    
+    def record_cache_status(self) -> Dict[str, Any]:
+        """
+        记录缓存状态
+        
+        Returns:
+            {"enabled": bool, "activities", "bytes", "max_bytes", "hits", "misses", "dtypes"}
+        """
+        if self._record_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self._record_cache.status()}
+    
+    @staticmethod
+    def _select_records(
+        columns: Dict[str, List[Any]],
+        count: int,
+        names: Optional[List[str]],
+        record_range: Optional[RecordRange]
+    ) -> Tuple[int, Dict[str, List[Any]]]:
+        """按范围筛选记录，再只保留请求的列（范围字段未被请求时不返回）；返回 (记录数, 列字典)"""
+        if record_range is not None:
+            columns = slice_columns_by_range(columns, *record_range)
+            count = len(columns.get(record_range[0], []))
+        if names is not None:
+            columns = {name: columns[name] for name in names if name in columns}
+        return count, columns
+    
+    def get_activity(
+        self,
+        activity_id: str,
+        fields: Optional[List[str]] = None,
+        record_range: Optional[RecordRange] = None
+    ) -> Optional[Activity]:
         """
         获取活动详情
         
         Args:
             activity_id: 活动ID
+            fields: 只加载指定的记录字段（API字段名，如 ["heart_rate", "iq_dr_gct"]），
+                    None表示加载全部。未加载的字段在records中为空
+            record_range: 只加载范围内的记录，如 ("elapsed_time", 600, 1200)、("distance", 5000, None)
         
         Returns:
             Activity对象或None
+        
+        存储自己写入的记录（见 _read_activity_data 的 check_trusted）跳过逐字段校验，
+        其他情况（旧格式、校验和缺失或不一致）完整校验。
         """
-        activity_file = self.activities_dir / f"{activity_id}.json"
-        if not activity_file.exists():
+        try:
+            data = self._read_activity_data(
+                activity_id, fields, record_range=record_range, check_trusted=self.TRUSTED_LOAD
+            )
+            if data is None:
+                return None
+            trusted = data.pop('trusted', False)
+            records = columns_to_records(data.pop('columns'), data['record_count'], trusted=trusted)
+            return Activity(**data, records=records)
+        except (json.JSONDecodeError, Exception) as e:
+            print(f"Error loading activity {activity_id}: {e}")
+            return None
+    
+    def get_activity_payload(
+        self,
+        activity_id: str,
+        fields: Optional[List[str]] = None,
+        record_range: Optional[RecordRange] = None,
+        layout: str = "records"
+    ) -> Optional[Dict[str, Any]]:
+        """
+        获取活动详情的JSON结构，与 get_activity(...).model_dump(mode='json') 相同
+        
+        磁盘上的头部与列数据本身就是 model_dump(mode='json') 的结果，
+        这里直接组装dict，跳过逐条记录的模型校验与再次转换（大活动的主要耗时）。
+        头部缺少当前模型字段时（旧版本写入）退回模型校验以补齐默认值。
+        
+        Args:
+            activity_id: 活动ID
+            fields: 同 get_activity
+            record_range: 同 get_activity
+            layout: "records" 为逐条记录（每条带 iq_fields 字典，兼容原有结构）；
+                    "columns" 时 records 为 columns_to_table 的表结构，IQ字段只声明一次；
+                    "none" 时不读取记录列，records 为空列表，另带 record_count
+        
+        Returns:
+            dict或None
+        """
+        try:
+            if layout == "none":
+                fields = []
+            data = self._read_activity_data(activity_id, fields, record_range=record_range)
+            if data is None:
+                return None
+            columns = data.pop('columns')
+            count = data['record_count']
+            if not self._HEADER_FIELDS <= data.keys():
+                # 只校验头部以补齐默认值，记录仍直接组装
+                data = Activity(**data).model_dump(mode='json', exclude={'records'})
+            payload = {name: data.get(name) for name in Activity.model_fields}
+            if layout == "records":
+                payload['records'] = columns_to_record_dicts(columns, count)
+            if layout == "columns":
+                payload['records'] = columns_to_table(columns, count)
+            if layout == "none":
+                payload['records'] = []
+                payload['record_count'] = count
+            return payload
+        except (json.JSONDecodeError, Exception) as e:
+            print(f"Error loading activity {activity_id}: {e}")
             return None
+    
+    def get_record_columns(
+        self,
+        activity_id: str,
+        fields: List[str],
+        record_range: Optional[RecordRange] = None
+    ) -> Optional[Dict[str, List[Any]]]:
+        """
+        只读取指定记录字段的列数据（不构造Record对象）
+        
+        Args:
+            activity_id: 活动ID
+            fields: 字段名列表（API字段名），活动中不存在的字段会被忽略
+            record_range: 同 get_activity
         
+        Returns:
+            {字段名: 值列表}，活动不存在时返回None
+        """
         try:
-            with open(activity_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return Activity(**data)
+            data = self._read_activity_data(activity_id, fields, record_range=record_range)
         except (json.JSONDecodeError, Exception) as e:
             print(f"Error loading activity {activity_id}: {e}")
             return None
+        return data['columns'] if data is not None else None
+    
+    def get_record_table(
+        self,
+        activity_id: str,
+        fields: Optional[List[str]] = None,
+        record_range: Optional[RecordRange] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        按列读取记录，IQ字段按活动声明（见 columns_to_table）
+        
+        Returns:
+            {"count", "columns", "iq_schema", "iq_columns"}，活动不存在时返回None
+        """
+        try:
+            data = self._read_activity_data(activity_id, fields, record_range=record_range)
+        except (json.JSONDecodeError, Exception) as e:
+            print(f"Error loading activity {activity_id}: {e}")
+            return None
+        return columns_to_table(data['columns'], data['record_count']) if data is not None else None
+    
+    def get_activity_lod(
+        self,
+        activity_id: str,
+        fields: List[str],
+        width: int,
+        record_range: Optional[RecordRange] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        获取适合指定像素宽度的多分辨率包络数据
+        
+        Args:
+            activity_id: 活动ID
+            fields: 字段名列表（API字段名）
+            width: 图表像素宽度（期望的最大点数）
+            record_range: 只返回范围内的数据（图表缩放），由范围内的记录现场计算，
+                          只读取与范围重叠的记录块
+        
+        Returns:
+            {"level_sec", "points", "x", "series": {字段: {"min", "max", "mean"}}}，
+            level_sec 为0表示原始数据；活动不存在时返回None
+        
+        合并活动（覆盖层）的 .lod 只有自己的列，其余字段取基础活动的包络（时间轴相同，层级一致）。
+        """
+        try:
+            directory = self._hot_dir(activity_id)
+            lod_file = self._lod_file(activity_id, directory)
+            header = loads(self._activity_file(activity_id, directory).read_bytes()) if lod_file.exists() else {}
+            # 旧版本的包络列名可能与最新字段名不一致，交给下面的兼容读取路径
+            if record_range is None and header.get('schema_version', 1) == ACTIVITY_SCHEMA_VERSION:
+                raw_count, _ = read_column_pack(self._records_file(activity_id, directory), [])
+                _, lod_columns = read_column_pack(lod_file, ["levels"])
+                level = select_lod_level(lod_columns.get("levels", []), raw_count, width)
+                if level:
+                    base_id = header.get('base_id')
+                    own = header.get('overlay_fields') or []
+                    own_fields = fields if base_id is None else [f for f in fields if f in own]
+                    _, lod_columns = read_column_pack(lod_file, lod_column_names(level, own_fields))
+                    payload = lod_payload(level, lod_columns, own_fields)
+                    if base_id is None:
+                        return payload
+                    base = self.get_activity_lod(base_id, [f for f in fields if f not in own], width)
+                    if base is not None and base['level_sec'] == level:
+                        series = {**base['series'], **payload['series']}
+                        payload['series'] = {f: series[f] for f in fields if f in series}
+                        return payload
+        except (json.JSONDecodeError, Exception) as e:
+            print(f"Error loading LOD for activity {activity_id}: {e}")
+        
+        # 原始数据足够稀疏、没有预计算文件（旧格式），或只需要缩放范围内的数据时现场计算
+        columns = self.get_record_columns(activity_id, raw_lod_fields(fields), record_range)
+        if columns is None:
+            return None
+        lod_columns = build_lod_columns(columns)
+        level = select_lod_level(lod_columns.get("levels", []), len(columns.get("elapsed_time", [])), width)
+        return lod_payload(level, lod_columns if level else columns, fields)
     
     def delete_activity(self, activity_id: str) -> bool:
         """
@@ -186,46 +1304,442 @@ class DataStore:
             activity_id: 活动ID
         
         Returns:
-            是否删除成功
+            是否删除成功（活动不存在时返回False）
         """
-        # 删除活动文件
-        activity_file = self.activities_dir / f"{activity_id}.json"
-        if activity_file.exists():
-            activity_file.unlink()
+        return self.delete_activities([activity_id])[activity_id]
+    
+    def delete_activities(self, activity_ids: List[str]) -> Dict[str, bool]:
+        """
+        批量删除活动
         
-        # 更新索引
-        index = self._load_index()
-        index.activities = [a for a in index.activities if a.id != activity_id]
-        self._save_index(index)
+        并行删除活动文件，所有索引变更合并为一次日志提交。
         
-        return True
+        Args:
+            activity_ids: 活动ID列表
+        
+        Returns:
+            {活动ID: 是否删除成功}，活动不存在时为False
+        
+        Raises:
+            TimeoutError: 写回模式下队列未能及时写完（见 _flush_before_mutation）
+        
+        引用被删除活动、自身不在删除列表中的合并活动先物化为完整活动。
+        """
+        ids = list(dict.fromkeys(activity_ids))
+        if not ids:
+            return {}
+        
+        deleting = set(ids)
+        for overlay_id in dict.fromkeys(o for aid in ids for o in self._overlays_of(aid)):
+            if overlay_id not in deleting:
+                self._materialize_overlay(overlay_id)
+        self._flush_before_mutation()
+        removed = dict(zip(ids, self._map_bulk_io(self._remove_activity_files, ids)))
+        
+        with self._lock:
+            self._sync_index()
+            results = {aid: removed[aid] or aid in self._entries for aid in ids}
+            ops = [{"op": "del", "id": aid} for aid in ids if results[aid]]
+            if ops:
+                self._commit_index_ops(ops)
+        
+        return results
+    
+    def _remove_activity_files(self, activity_id: str, directory: Optional[Path] = None) -> bool:
+        """删除活动的所有文件，返回是否有文件被删除"""
+        removed = False
+        for path in self._activity_paths(activity_id, directory):
+            try:
+                path.unlink()
+                removed = True
+            except FileNotFoundError:
+                pass
+        return removed
+    
+    def _map_bulk_io(self, fn: Callable, items: List[Any]) -> List[Any]:
+        """用线程池并行执行文件操作（单个元素时直接执行）"""
+        if len(items) <= 1:
+            return [fn(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.BULK_IO_WORKERS, len(items))) as pool:
+            return list(pool.map(fn, items))
+    
+    def update_activities_metadata(self, updates: Dict[str, Dict[str, Any]]) -> Dict[str, bool]:
+        """
+        批量更新活动元数据（名称、运动类型、备注、标签、合并溯源）
+        
+        只写每个活动的元数据附属文件（几百字节），不重写头部和记录数据，冷存储的活动也不解压；
+        索引条目由原条目直接修改，所有索引变更合并为一次日志提交。
+        附属文件的读取-合并-写入在索引锁内完成，其他进程/线程对同一活动的修改、
+        重新解析和格式迁移的保存不会与之交错而丢失修改。
+        
+        Args:
+            updates: {活动ID: {字段: 新值}}，只处理 EDITABLE_METADATA_FIELDS 中的字段，值为None的字段保持不变
+        
+        Returns:
+            {活动ID: 是否更新成功}，活动不存在时为False
+        
+        Raises:
+            TimeoutError: 写回模式下队列未能及时写完（见 _flush_before_mutation）
+        """
+        self._flush_before_mutation()
+        cleaned = {aid: self._clean_metadata(changes) for aid, changes in updates.items()}
+        with self._lock:
+            self._sync_index()
+            current = {aid: self._entries.get(aid) for aid in updates}
+            items = [(aid, cleaned[aid], current[aid]) for aid in updates if current[aid] is not None]
+            metas = self._map_bulk_io(lambda item: self._write_metadata(*item), items)
+            
+            ops = [{"op": "put", "meta": meta.model_dump(mode='json')} for meta in metas]
+            if ops:
+                self._commit_index_ops(ops)
+        
+        return {aid: current[aid] is not None for aid in updates}
+    
+    def _clean_metadata(self, changes: Dict[str, Any]) -> Dict[str, Any]:
+        """只保留可修改的字段并规范化（标签去空白、去重；合并溯源按模型校验）"""
+        changes = {k: v for k, v in changes.items() if k in self.EDITABLE_METADATA_FIELDS and v is not None}
+        if 'tags' in changes:
+            changes['tags'] = list(dict.fromkeys(t.strip() for t in changes['tags'] if t and t.strip()))
+        if 'merge_provenance' in changes:
+            changes['merge_provenance'] = MergeProvenance.model_validate(changes['merge_provenance']).model_dump(mode='json')
+        return changes
+    
+    def _write_metadata(self, activity_id: str, changes: Dict[str, Any], meta: ActivityMeta) -> ActivityMeta:
+        """（需持有锁）把修改合并进活动的元数据附属文件，返回修改后的索引条目"""
+        sidecar = self._metadata_file(activity_id)
+        metadata = read_metadata_sidecar(sidecar)
+        metadata.update(changes)
+        atomic_write_bytes(sidecar, dumps(metadata, indent=True))
+        
+        update = {k: v for k, v in changes.items() if k != 'merge_provenance'}
+        if 'merge_provenance' in changes:
+            provenance = MergeProvenance.model_validate(changes['merge_provenance'])
+            update['devices'] = self._devices_of(meta.available_iq_fields, provenance)
+        return meta.model_copy(update=update)
     
     def delete_all_activities(self) -> int:
         """
         删除所有活动 (v1.8.0+)
         
-        警告: 此操作不可逆！删除所有activities/*.json文件和index.json。
+        警告: 此操作不可逆！删除activities目录下的所有活动文件和index.json。
         
         Returns:
             删除的活动数量
         """
-        # 获取当前活动数量
-        index = self._load_index()
-        deleted_count = len(index.activities)
+        self._flush_before_mutation()
+        with self._lock:
+            # 获取当前活动数量
+            index = self._load_index()
+            deleted_count = len(index.activities)
+            
+            # 删除所有活动文件：分片目录整体删除，旧的平铺文件逐个删除
+            if self.activities_dir.exists():
+                for shard in self._shard_year_dirs():
+                    try:
+                        shutil.rmtree(shard)
+                    except Exception as e:
+                        print(f"警告: 删除目录失败 {shard.name}: {e}")
+                activity_files = [p for pattern in ("*.json", "*.rec", "*.lod", "*" + COLD_SUFFIX, "*" + METADATA_SUFFIX)
+                                  for p in self.activities_dir.glob(pattern)]
+                for activity_file in activity_files:
+                    try:
+                        activity_file.unlink()
+                    except Exception as e:
+                        print(f"警告: 删除文件失败 {activity_file.name}: {e}")
+            
+            # 重置索引
+            empty_index = ActivityIndex()
+            self._save_index(empty_index)
+            
+        return deleted_count
+    
+    def _hot_dir(self, activity_id: str, record_access: bool = True) -> Path:
+        """读取活动文件前调用：冷存储的活动先解压回热存储，并按需记录访问时间，返回文件所在目录"""
+        directory = self._activity_dir(activity_id)
+        if self._cold_file(activity_id, directory).exists():
+            self.thaw_activity(activity_id)
+            directory = self._activity_dir(activity_id)
+        if record_access:
+            self._record_access(activity_id)
+        return directory
+    
+    def _record_access(self, activity_id: str):
+        """
+        记录活动访问时间（同一活动在 ACCESS_RECORD_INTERVAL_SEC 内只记录一次）
         
-        # 删除所有活动文件
-        if self.activities_dir.exists():
-            for activity_file in self.activities_dir.glob("*.json"):
+        只保存在内存中，不让读取请求等待索引锁和fsync；累积 ACCESS_PERSIST_BATCH 个、
+        冷存储归档前和关闭存储时由 persist_access_times() 合并为一次日志提交。
+        """
+        meta = self._entries.get(activity_id)
+        if meta is None:
+            return
+        now = datetime.now()
+        with self._access_lock:
+            last = self._unsaved_access.get(activity_id) or meta.last_accessed
+            if last is not None and (now - last).total_seconds() < self.ACCESS_RECORD_INTERVAL_SEC:
+                return
+            self._unsaved_access[activity_id] = now
+            full = len(self._unsaved_access) >= self.ACCESS_PERSIST_BATCH
+        if full:
+            self.persist_access_times()
+    
+    def persist_access_times(self):
+        """把内存中累积的访问时间合并为一次索引日志提交"""
+        with self._access_lock:
+            pending, self._unsaved_access = self._unsaved_access, {}
+        if not pending:
+            return
+        try:
+            self._commit_index_ops([
+                {"op": "touch", "id": activity_id, "at": at.isoformat()} for activity_id, at in pending.items()
+            ])
+        except Exception as e:
+            print(f"警告: 记录活动访问时间失败: {e}")
+    
+    def freeze_activity(self, activity_id: str) -> bool:
+        """
+        将活动移入冷存储：文件打包压缩为 <id>.cold 后删除热存储文件
+        
+        Returns:
+            是否归档（活动不存在、已在冷存储或尚未写入磁盘时返回False）
+        """
+        with self._lock:
+            self._sync_index()
+            meta = self._entries.get(activity_id)
+            if meta is None or (self._write_behind is not None and self._write_behind.get(activity_id) is not None):
+                return False
+            directory = self._activity_dir(activity_id)
+            if not self._activity_file(activity_id, directory).exists():
+                return False
+            
+            archive = self._cold_file(activity_id, directory)
+            sidecar = self._metadata_file(activity_id, directory)
+            files = [p for p in self._activity_paths(activity_id, directory) if p not in (archive, sidecar) and p.exists()]
+            pack_archive(archive, files)
+            # 先删除头部，读取方要么看到完整的热存储文件，要么只看到归档
+            for path in files:
+                path.unlink()
+            
+            self._commit_index_ops([{"op": "put", "meta": meta.model_copy(update={"tier": "cold"}).model_dump(mode='json')}])
+        return True
+    
+    def thaw_activity(self, activity_id: str) -> bool:
+        """
+        将冷存储的活动解压回热存储
+        
+        Returns:
+            是否解压（活动不在冷存储时返回False）
+        """
+        with self._lock:
+            self._sync_index()
+            directory = self._activity_dir(activity_id)
+            archive = self._cold_file(activity_id, directory)
+            if not archive.exists():
+                return False
+            unpack_archive(archive, directory)
+            archive.unlink()
+            
+            meta = self._entries.get(activity_id)
+            if meta is not None:
+                self._commit_index_ops([{"op": "put", "meta": meta.model_copy(update={"tier": "hot"}).model_dump(mode='json')}])
+        return True
+    
+    @staticmethod
+    def _last_used(meta: ActivityMeta) -> Optional[datetime]:
+        """活动日期与最近访问时间中较晚的一个（统一为本地时间，不带时区）"""
+        times = [t.astimezone().replace(tzinfo=None) if t.tzinfo else t
+                 for t in (meta.date, meta.last_accessed) if t is not None]
+        return max(times, default=None)
+    
+    def apply_tiering(
+        self,
+        cold_after_days: Optional[int] = None,
+        stop_event: Optional[threading.Event] = None
+    ) -> Dict[str, Any]:
+        """
+        按策略把旧活动移入冷存储
+        
+        活动日期与最近访问时间都早于 cold_after_days 天的热存储活动会被归档；
+        被再次访问时自动解压回热存储。
+        
+        Args:
+            cold_after_days: 归档阈值（天），None表示使用 COLD_AFTER_DAYS
+            stop_event: 设置后在处理完当前活动时停止
+        
+        Returns:
+            {"frozen": 归档数, "failed": [{"id", "error"}], "tiers": storage_tiers()}
+        """
+        days = self.COLD_AFTER_DAYS if cold_after_days is None else cold_after_days
+        cutoff = datetime.now() - timedelta(days=days)
+        self.flush(self.FLUSH_TIMEOUT_SEC)
+        self.persist_access_times()
+        self._ensure_index()
+        candidates = [
+            meta.id for meta in list(self._entries.values())
+            if meta.tier != "cold" and (self._last_used(meta) or cutoff) < cutoff
+        ]
+        
+        report: Dict[str, Any] = {"frozen": 0, "failed": []}
+        for activity_id in candidates:
+            if stop_event is not None and stop_event.is_set():
+                break
+            try:
+                if self.freeze_activity(activity_id):
+                    report["frozen"] += 1
+            except Exception as e:
+                print(f"警告: 活动归档失败 {activity_id}: {e}")
+                report["failed"].append({"id": activity_id, "error": str(e)})
+        
+        if report["frozen"]:
+            print(f"冷存储归档: {report['frozen']} 个活动")
+        report["tiers"] = self.storage_tiers()
+        return report
+    
+    def storage_tiers(self) -> Dict[str, Dict[str, int]]:
+        """
+        各存储层级的活动数与占用空间
+        
+        Returns:
+            {"hot": {"count", "bytes"}, "cold": {"count", "bytes"}}
+        """
+        self._ensure_index()
+        tiers = {"hot": {"count": 0, "bytes": 0}, "cold": {"count": 0, "bytes": 0}}
+        for meta in list(self._entries.values()):
+            tiers["cold" if meta.tier == "cold" else "hot"]["count"] += 1
+        for path in self.activities_dir.rglob("*"):
+            if path.is_file():
                 try:
-                    activity_file.unlink()
-                except Exception as e:
-                    print(f"警告: 删除文件失败 {activity_file.name}: {e}")
+                    size = path.stat().st_size
+                except FileNotFoundError:
+                    continue
+                tiers["cold" if path.suffix == COLD_SUFFIX else "hot"]["bytes"] += size
+        return tiers
+    
+    def read_activity_files(
+        self,
+        activity_id: str,
+        skip: Collection[str] = ()
+    ) -> List[Tuple[ActivityMeta, List[Tuple[str, bytes]]]]:
+        """
+        在索引锁内读取活动的全部文件（用于快照）
         
-        # 重置索引
-        empty_index = ActivityIndex()
-        self._save_index(empty_index)
+        同一把锁内读取索引条目和文件内容，两者一定对应同一个版本；
+        合并活动（覆盖层）引用的基础活动链也在这把锁内一起读取，
+        不会读到覆盖层之后基础活动才被删除。其他活动的读写不受影响。
         
-        return deleted_count
+        Args:
+            activity_id: 活动ID
+            skip: 已读取的活动ID，基础活动链读到其中的活动即停止
+        
+        Returns:
+            [(索引元数据, [(相对 data_dir 的路径, 文件内容)])]，活动在前、基础活动依次在后；
+            活动不存在，或引用的基础活动不存在时为空列表
+        """
+        if self._write_behind is not None:
+            self._ensure_index()
+            chain = self._base_chain(activity_id, skip)
+            if any(self._write_behind.get(aid) is not None for aid in chain):
+                self.flush(self.FLUSH_TIMEOUT_SEC)
+        with self._lock:
+            self._sync_index()
+            result = []
+            for aid in self._base_chain(activity_id, skip):
+                meta = self._entries.get(aid)
+                files = []
+                for path in self._activity_paths(aid) if meta is not None else []:
+                    try:
+                        files.append((path.relative_to(self.data_dir).as_posix(), path.read_bytes()))
+                    except FileNotFoundError:
+                        pass
+                if not files:
+                    if aid != activity_id:
+                        print(f"警告: 合并活动引用的基础活动不存在: {activity_id} -> {aid}")
+                    return []
+                result.append((meta, files))
+        return result
+    
+    def _base_chain(self, activity_id: str, skip: Collection[str]) -> List[str]:
+        """活动及其引用的基础活动链（遇到 skip 中的活动或链结束为止，最后一项可能已不在索引中）"""
+        chain = [activity_id]
+        meta = self._entries.get(activity_id)
+        while meta is not None and meta.base_id is not None and meta.base_id not in skip and meta.base_id not in chain:
+            chain.append(meta.base_id)
+            meta = self._entries.get(meta.base_id)
+        return chain
+    
+    def find_outdated_activities(self) -> List[str]:
+        """返回磁盘格式低于最新版本的活动ID（最新的活动在前）"""
+        self._ensure_index()
+        outdated = []
+        for activity_id in reversed(list(self._entries)):
+            version = self._stored_schema_version(activity_id)
+            if version is not None and version < ACTIVITY_SCHEMA_VERSION:
+                outdated.append(activity_id)
+        return outdated
+    
+    def migrate_activity(self, activity_id: str) -> bool:
+        """
+        将单个活动重写为最新格式（见 stage_migration）
+        
+        Returns:
+            是否重写了活动文件
+        """
+        staged = self.stage_migration(activity_id)
+        return staged is not None and self.commit_staged([staged])[0]
+    
+    def stage_migration(self, activity_id: str) -> Optional["StagedActivity"]:
+        """
+        在锁外读取旧格式的活动并准备重写（由 commit_staged() 提交）
+        
+        活动已被删除或已是最新版本时返回None；准备期间活动被修改时提交会放弃重写，不会丢失修改。
+        """
+        self._ensure_index()
+        expected = self._entries.get(activity_id)
+        if expected is None:
+            return None
+        version = self._stored_schema_version(activity_id)
+        if version is None or version >= ACTIVITY_SCHEMA_VERSION:
+            return None
+        
+        data = self._read_activity_data(activity_id, record_access=False)
+        if data is None:
+            return None
+        records = columns_to_records(data.pop('columns'), data['record_count'])
+        return self.stage_activity(Activity(**data, records=records), expected)
+    
+    def start_migration(self, throttle_sec: Optional[float] = None) -> Dict[str, Any]:
+        """
+        启动后台迁移线程（已在运行时直接返回当前进度）
+        
+        Returns:
+            迁移进度，见 migration_status()
+        """
+        if self._migration is not None and self._migration.is_running():
+            return self._migration.status()
+        
+        throttle = self.MIGRATION_THROTTLE_SEC if throttle_sec is None else throttle_sec
+        # 需要迁移的活动在后台线程中查找（读取每个活动的头部），不阻塞启动与API请求
+        self._migration = MigrationWorker(self, throttle_sec=throttle)
+        self._migration.start()
+        return self._migration.status()
+    
+    def migration_status(self) -> Dict[str, Any]:
+        """
+        后台迁移进度
+        
+        Returns:
+            {"state", "target_version", "total", "migrated", "skipped", "failed", "current",
+             "started_at", "finished_at", "pending"}；未启动过迁移时 state 为 "idle"，pending 为None
+             （未知；不为状态查询扫描磁盘）
+        """
+        if self._migration is None:
+            return {"state": "idle", "target_version": ACTIVITY_SCHEMA_VERSION, "pending": None}
+        return self._migration.status()
+    
+    def stop_migration(self):
+        """停止后台迁移（等待当前活动处理完）"""
+        if self._migration is not None:
+            self._migration.stop()
     
     def list_activities(
         self,
@@ -236,6 +1750,8 @@ class DataStore:
         filter_date_to: Optional[datetime] = None,
         filter_distance_min: Optional[float] = None,
         filter_distance_max: Optional[float] = None,
+        filter_tag: Optional[str] = None,
+        filter_fields: Optional[List[str]] = None,
         page: int = 1,
         limit: int = 20
     ) -> tuple[List[ActivityMeta], int]:
@@ -250,6 +1766,9 @@ class DataStore:
             filter_date_to: 结束日期
             filter_distance_min: 最小距离(km)
             filter_distance_max: 最大距离(km)
+            filter_tag: 只返回带该标签的活动
+            filter_fields: 只返回包含所有这些字段的活动（API字段名，可用 iq_imported_* 这样的前缀），
+                           由字段倒排索引查找
             page: 页码
             limit: 每页数量
         
@@ -275,6 +1794,13 @@ class DataStore:
         if filter_distance_max is not None:
             activities = [a for a in activities if a.distance_km <= filter_distance_max]
         
+        if filter_tag:
+            activities = [a for a in activities if filter_tag in a.tags]
+        
+        if filter_fields:
+            matched = self._get_field_index().matching(filter_fields)
+            activities = [a for a in activities if a.id in matched]
+        
         # 排序
         sort_key_map = {
             "date": lambda x: x.date or datetime.min,
@@ -298,36 +1824,66 @@ class DataStore:
         
         return activities, total
     
-    def get_activities_for_compare(self, activity_ids: List[str]) -> List[Activity]:
+    def iter_entries(self) -> Iterator[ActivityMeta]:
+        """遍历索引中的所有活动元数据（最新的活动在前，遍历的是调用时的快照）"""
+        self._ensure_index()
+        return reversed(list(self._entries.values()))
+    
+    def get_activity_meta(self, activity_id: str) -> Optional[ActivityMeta]:
+        """从索引获取单个活动的元数据"""
+        self._ensure_index()
+        return self._entries.get(activity_id)
+    
+    def get_activities_for_compare(self, activity_ids: List[str], fields: Optional[List[str]] = None) -> List[Activity]:
         """
         获取多个活动用于对比
         
         Args:
             activity_ids: 活动ID列表
+            fields: 只加载指定的记录字段，None表示全部
         
         Returns:
             Activity对象列表
         """
         activities = []
         for aid in activity_ids:
-            activity = self.get_activity(aid)
+            activity = self.get_activity(aid, fields)
             if activity:
                 activities.append(activity)
         return activities
     
-    def search_activities(self, query: str) -> List[ActivityMeta]:
+    def search_activities(
+        self,
+        query: str,
+        fuzzy: bool = True,
+        page: int = 1,
+        limit: int = 20
+    ) -> Tuple[List[ActivityMeta], int]:
         """
-        搜索活动（按名称）
+        搜索活动（名称、文件名、运动类型、设备名）
+        
+        支持前缀、子串和容错匹配，结果按相关度排序，同分时最新的在前。
         
         Args:
-            query: 搜索关键词
+            query: 搜索关键词，多个词之间为“与”关系
+            fuzzy: 是否允许容错（拼写错误）匹配
+            page: 页码
+            limit: 每页数量
         
         Returns:
-            匹配的活动列表
+            (活动列表, 总数)
         """
-        index = self._load_index()
-        query_lower = query.lower()
-        return [a for a in index.activities if query_lower in a.name.lower()]
+        self._ensure_index()
+        if self._search is None:
+            search = SearchIndex()
+            for meta in list(self._entries.values()):
+                search.put(meta)
+            self._search = search
+        
+        hits = self._search.search(query, fuzzy=fuzzy)
+        start = (page - 1) * limit
+        activities = [self._entries[aid] for aid, _ in hits[start:start + limit] if aid in self._entries]
+        return activities, len(hits)
     
     def get_all_sports(self) -> List[str]:
         """获取所有运动类型"""
@@ -335,26 +1891,184 @@ class DataStore:
         sports = set(a.sport for a in index.activities if a.sport)
         return sorted(list(sports))
     
-    def get_statistics(self) -> Dict[str, Any]:
-        """获取统计信息"""
-        index = self._load_index()
-        activities = index.activities
+    def _get_rollup(self) -> StatsRollup:
+        """统计汇总（首次使用时由内存索引构建）"""
+        self._ensure_index()
+        if self._rollup is None:
+            rollup = StatsRollup()
+            for meta in list(self._entries.values()):
+                rollup.put(meta)
+            self._rollup = rollup
+        return self._rollup
+    
+    def _get_field_index(self) -> FieldIndex:
+        """字段倒排索引（首次使用时由内存索引构建）"""
+        self._ensure_index()
+        if self._field_index is None:
+            field_index = FieldIndex()
+            for meta in list(self._entries.values()):
+                field_index.put(meta)
+            self._field_index = field_index
+        return self._field_index
+    
+    def get_field_union(self, activity_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        一组活动的字段并集（由字段倒排索引计算，不读取活动文件）
+        
+        Args:
+            activity_ids: 活动ID列表，None表示全部活动
+        
+        Returns:
+            {"available_fields": [标准字段], "available_iq_fields": [IQ字段名（不含 iq_ 前缀）],
+             "counts": {API字段名: 包含该字段的活动数}}
+        """
+        counts = self._get_field_index().field_counts(activity_ids)
+        iq_fields = [name for name in counts if name.startswith(IQ_COLUMN_PREFIX) and name not in Record.model_fields]
+        return {
+            "available_fields": [name for name in counts if name not in iq_fields],
+            "available_iq_fields": [name[len(IQ_COLUMN_PREFIX):] for name in iq_fields],
+            "counts": counts,
+        }
+    
+    def _get_lap_index(self) -> LapIndex:
+        """圈索引（首次使用时从缓存文件加载并与内存索引对齐）"""
+        self._ensure_index()
+        if self._lap_index is None:
+            self._lap_index = LapIndex.load(self.data_dir / LAP_CACHE_NAME)
+        if not self._lap_index_synced:
+            self._lap_index.sync(list(self._entries.values()))
+            self._lap_index_synced = True
+        return self._lap_index
+    
+    def _read_laps(self, meta: ActivityMeta) -> List[Dict[str, Any]]:
+        """
+        读取活动头部中的圈数据（JSON形式）
+        
+        冷存储的活动只读取归档中的头部，不解压回热存储；读取失败时视为没有圈。
+        """
+        pending = self._write_behind.get(meta.id) if self._write_behind is not None else None
+        if pending is not None:
+            return [lap.model_dump(mode='json') for lap in pending.laps]
+        directory = self._activity_dir(meta.id)
+        try:
+            cold_file = self._cold_file(meta.id, directory)
+            if cold_file.exists():
+                header = parse_activity_header(read_archive_member(cold_file, f"{meta.id}.json"))
+            else:
+                header = read_activity_header(self._activity_file(meta.id, directory))
+        except FileNotFoundError:
+            return []
+        except Exception as e:
+            print(f"警告: 读取活动 {meta.id} 的圈数据失败: {e}")
+            return []
+        return upgrade_activity_data(header).get('laps') or []
+    
+    def _refresh_lap_index(self) -> LapIndex:
+        """为过期的活动重新读取圈数据，有变化时写回缓存文件"""
+        lap_index = self._get_lap_index()
+        metas = [self._entries[i] for i in lap_index.stale_ids() if i in self._entries]
+        for meta, laps in zip(metas, self._map_bulk_io(self._read_laps, metas)):
+            lap_index.set_laps(meta, laps)
+        try:
+            lap_index.save(self.data_dir / LAP_CACHE_NAME)
+        except OSError as e:
+            print(f"警告: 圈索引缓存写入失败: {e}")
+        return lap_index
+    
+    def query_laps(
+        self,
+        ranges: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+        sport: Optional[str] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        activity_ids: Optional[List[str]] = None,
+        sort_by: Optional[str] = None,
+        order: str = "asc",
+        page: int = 1,
+        limit: int = 50
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        跨活动查询圈（由圈索引计算，只读取圈数据过期的活动的头部）
+        
+        Args:
+            ranges: {字段: (最小值, 最大值)}，包含边界，None表示不限；字段为圈的汇总字段、
+                    pace_sec_per_km（秒/公里）或 iq_ 前缀的IQ圈汇总
+            sport: 只查询该运动类型的活动
+            date_from: 开始日期（包含）
+            date_to: 结束日期（包含）
+            activity_ids: 只查询这些活动
+            sort_by: 排序字段（空值排在最后），None时按活动、圈号顺序
+            order: 排序方向 (asc, desc)
+            page: 页码
+            limit: 每页数量
+        
+        Returns:
+            (圈列表, 总数)，每个圈带 activity_id、activity_name、date、sport
+        """
+        lap_index = self._refresh_lap_index()
+        entries = self._entries
+        wanted = set(activity_ids) if activity_ids is not None else None
         
-        if not activities:
-            return {
-                "total_activities": 0,
-                "total_distance_km": 0,
-                "total_duration_sec": 0,
-                "sports": []
-            }
+        def activity_filter(activity_id: str) -> bool:
+            meta = entries.get(activity_id)
+            if meta is None or (wanted is not None and activity_id not in wanted):
+                return False
+            if sport and meta.sport != sport:
+                return False
+            if date_from and (meta.date is None or meta.date.date() < date_from):
+                return False
+            if date_to and (meta.date is None or meta.date.date() > date_to):
+                return False
+            return True
         
-        total_distance = sum(a.distance_km for a in activities)
-        total_duration = sum(a.duration_sec for a in activities)
-        sports = list(set(a.sport for a in activities))
+        rows = lap_index.query(ranges or {}, activity_filter, sort_by, descending=(order == "desc"))
+        total = len(rows)
+        start = (page - 1) * limit
+        rows = rows[start:start + limit]
+        for row in rows:
+            meta = entries.get(row["activity_id"])
+            if meta is not None:
+                row["activity_name"] = meta.name
+                row["date"] = meta.date.isoformat() if meta.date else None
+                row["sport"] = meta.sport
+        return rows, total
+    
+    def get_statistics(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        lifetime = self._get_rollup().lifetime()
         
         return {
-            "total_activities": len(activities),
-            "total_distance_km": round(total_distance, 2),
-            "total_duration_sec": round(total_duration, 1),
-            "sports": sports
+            "total_activities": sum(t["count"] for t in lifetime.values()),
+            "total_distance_km": round(sum(t["distance_km"] for t in lifetime.values()), 2),
+            "total_duration_sec": round(sum(t["duration_sec"] for t in lifetime.values()), 1),
+            "sports": list(lifetime)
         }
+    
+    def get_statistics_rollup(
+        self,
+        period: str = "week",
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        sport: Optional[str] = None,
+        by_sport: bool = False
+    ) -> Dict[str, Any]:
+        """
+        按日/周/月汇总的统计（预聚合，不扫描活动列表）
+        
+        Args:
+            period: day / week / month
+            date_from: 开始日期（包含其所在的整个周期）
+            date_to: 结束日期（包含其所在的整个周期）
+            sport: 只统计该运动类型
+            by_sport: 每个周期额外返回按运动类型拆分的统计
+        
+        Returns:
+            见 StatsRollup.query()
+        """
+        return self._get_rollup().query(
+            period,
+            date_from=date_from.date() if date_from else None,
+            date_to=date_to.date() if date_to else None,
+            sport=sport,
+            by_sport=by_sport
+        )
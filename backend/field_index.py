@@ -0,0 +1,159 @@
+"""
+FIT跑步数据分析器 - 字段倒排索引
+字段名 -> 包含该字段的活动集合，按字段筛选活动（如所有带 iq_dr_gct 的活动、所有心率合并活动）
+和求一组活动的字段并集时无需扫描全部活动。
+
+- 字段名与API字段名一致：标准字段直接使用字段名，IQ字段加 iq_ 前缀（如 iq_dr_gct）
+- 活动ID映射为递增的序号，每个字段的活动集合保存为位图（Python整数的二进制位），
+  交集/并集/计数都是整数按位运算；几千个活动的位图只有几百字节
+- 序号不复用，已删除的序号超过在用序号时整体重新编号
+
+索引只保存在内存中，随活动索引的 put/del 操作增量维护。
+"""
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+from column_store import IQ_COLUMN_PREFIX
+from models import ActivityMeta
+
+
+# 重新编号前至少累积的已删除序号数
+COMPACT_MIN_FREED = 64
+# 字段名以该后缀结尾时按前缀匹配（如 iq_imported_* 匹配所有心率合并字段）
+PREFIX_WILDCARD = "*"
+
+
+def fields_of(meta: ActivityMeta) -> List[str]:
+    """活动包含的字段（API字段名）"""
+    return list(meta.available_fields) + [IQ_COLUMN_PREFIX + key for key in meta.available_iq_fields]
+
+
+def _bit_count(bitmap: int) -> int:
+    return bin(bitmap).count("1")
+
+
+class FieldIndex:
+    """
+    字段 -> 活动位图
+
+    线程安全：后台迁移线程会在API查询的同时更新索引。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 活动ID -> 序号；序号 -> 活动ID（已删除为None）
+        self._ordinals: Dict[str, int] = {}
+        self._ids: List[Optional[str]] = []
+        self._freed = 0
+        # 字段名 -> 位图（第 n 位为1表示序号为 n 的活动包含该字段）
+        self._postings: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._ordinals)
+
+    def put(self, meta: ActivityMeta, old: Optional[ActivityMeta] = None):
+        """添加活动；更新已有活动时传入旧的元数据以先移除其字段"""
+        with self._lock:
+            if old is not None:
+                self._unset(old)
+            ordinal = self._ordinals.get(meta.id)
+            if ordinal is None:
+                ordinal = self._ordinals[meta.id] = len(self._ids)
+                self._ids.append(meta.id)
+            bit = 1 << ordinal
+            for field in fields_of(meta):
+                self._postings[field] = self._postings.get(field, 0) | bit
+
+    def remove(self, meta: ActivityMeta):
+        with self._lock:
+            self._unset(meta)
+            ordinal = self._ordinals.pop(meta.id, None)
+            if ordinal is None:
+                return
+            self._ids[ordinal] = None
+            self._freed += 1
+            if self._freed >= max(COMPACT_MIN_FREED, len(self._ordinals)):
+                self._compact()
+
+    def _unset(self, meta: ActivityMeta):
+        ordinal = self._ordinals.get(meta.id)
+        if ordinal is None:
+            return
+        mask = ~(1 << ordinal)
+        for field in fields_of(meta):
+            bitmap = self._postings.get(field, 0) & mask
+            if bitmap:
+                self._postings[field] = bitmap
+            else:
+                self._postings.pop(field, None)
+
+    def _compact(self):
+        """按现有顺序重新编号，去掉已删除的序号"""
+        remap = {}
+        ids: List[Optional[str]] = []
+        for ordinal, activity_id in enumerate(self._ids):
+            if activity_id is not None:
+                remap[ordinal] = len(ids)
+                ids.append(activity_id)
+        self._postings = {
+            field: sum(1 << remap[ordinal] for ordinal in self._ordinals_of(bitmap))
+            for field, bitmap in self._postings.items()
+        }
+        self._ids = ids
+        self._ordinals = {activity_id: ordinal for ordinal, activity_id in enumerate(ids)}
+        self._freed = 0
+
+    @staticmethod
+    def _ordinals_of(bitmap: int) -> Iterable[int]:
+        while bitmap:
+            low = bitmap & -bitmap
+            yield low.bit_length() - 1
+            bitmap ^= low
+
+    def _posting(self, field: str) -> int:
+        """字段的位图；以 PREFIX_WILDCARD 结尾时为所有匹配前缀的字段位图的并集"""
+        if not field.endswith(PREFIX_WILDCARD):
+            return self._postings.get(field, 0)
+        prefix = field[:-len(PREFIX_WILDCARD)]
+        bitmap = 0
+        for name, posting in self._postings.items():
+            if name.startswith(prefix):
+                bitmap |= posting
+        return bitmap
+
+    def matching(self, fields: List[str]) -> Set[str]:
+        """包含所有指定字段的活动ID（字段可以是 iq_imported_* 这样的前缀）"""
+        with self._lock:
+            bitmap = -1
+            for field in fields:
+                bitmap &= self._posting(field)
+                if not bitmap:
+                    return set()
+            if bitmap == -1:
+                return set(self._ordinals)
+            return {self._ids[ordinal] for ordinal in self._ordinals_of(bitmap)}
+
+    def field_counts(self, activity_ids: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """
+        字段并集及每个字段出现的活动数
+
+        Args:
+            activity_ids: 只统计这些活动，None表示全部（不存在的ID被忽略）
+
+        Returns:
+            {字段名: 活动数}，按字段名排序
+        """
+        with self._lock:
+            mask = -1
+            if activity_ids is not None:
+                mask = 0
+                for activity_id in activity_ids:
+                    ordinal = self._ordinals.get(activity_id)
+                    if ordinal is not None:
+                        mask |= 1 << ordinal
+            counts = {}
+            for field in sorted(self._postings):
+                count = _bit_count(self._postings[field] & mask)
+                if count:
+                    counts[field] = count
+            return counts
@@ -3,13 +3,16 @@ FIT跑步数据分析器 - FIT文件解析器
 动态提取所有字段，包括IQ扩展字段
 """
 import fitdecode
+import hashlib
+import sys
+from functools import lru_cache
 from datetime import datetime, timezone
 from typing import Dict, List, Any, Optional, Tuple
 from pathlib import Path
 import math
 
 from models import Activity, Record, Lap, Session
-from field_units import normalize_field_value, normalize_vertical_oscillation
+from field_units import IQ_FIELD_UNITS, STANDARD_FIELD_UNITS, normalize_field_value, normalize_vertical_oscillation
 
 
 # Garmin FIT 使用的坐标转换常量
@@ -23,6 +26,10 @@ def semicircles_to_degrees(semicircles: int) -> float:
     return semicircles * SEMICIRCLE_TO_DEGREE
 
 
+# 解析逻辑版本：解析结果会因代码修改而变化时加1（字段映射与单位配置的变化由 parser_fingerprint 自动识别）
+PARSER_VERSION = 1
+
+
 # 注意: normalize_vertical_oscillation() 已移至 field_units.py 模块
 # 现在使用 normalize_field_value() 进行所有字段的单位转换
 
@@ -77,8 +84,29 @@ DR_FIELD_MAPPING = {
 }
 
 
+@lru_cache(maxsize=None)
+def parser_fingerprint() -> str:
+    """
+    解析器版本标识: "<PARSER_VERSION>-<映射哈希>"
+    
+    映射哈希覆盖 DR_FIELD_MAPPING 与 field_units 的单位配置，
+    修改映射或单位后标识随之变化，已有活动可据此重新解析（见 reprocess.py）。
+    """
+    units = [
+        (config.field_name, config.fit_unit.value, config.display_unit.value, config.scale_factor, config.reasonable_range)
+        for table in (STANDARD_FIELD_UNITS, IQ_FIELD_UNITS)
+        for config in table.values()
+    ]
+    digest = hashlib.sha256(repr((sorted(DR_FIELD_MAPPING.items()), units)).encode("utf-8")).hexdigest()
+    return f"{PARSER_VERSION}-{digest[:12]}"
+
+
 def extract_developer_fields(frame) -> Dict[str, Any]:
-    """提取开发者字段（IQ扩展字段），包括龙豆跑步dr_字段"""
+    """
+    提取开发者字段（IQ扩展字段），包括龙豆跑步dr_字段
+    
+    字段名经过 sys.intern，同一活动所有记录的 iq_fields 共用同一组键字符串。
+    """
     iq_fields = {}
     try:
         if hasattr(frame, 'fields'):
@@ -93,7 +121,7 @@ def extract_developer_fields(frame) -> Dict[str, Any]:
                     field_value = field.value
                     
                     # 所有DR字段统一由配置系统处理，不做特殊转换
-                    iq_fields[mapped_name] = field_value
+                    iq_fields[sys.intern(mapped_name)] = field_value
                     continue
                 
                 # 方法2: 检查 is_dev_field 属性
@@ -115,7 +143,7 @@ def extract_developer_fields(frame) -> Dict[str, Any]:
                 
                 if is_dev and field.value is not None:
                     # 清理字段名
-                    clean_name = field_name_raw.replace(' ', '_').replace('(', '').replace(')', '').lower()
+                    clean_name = sys.intern(field_name_raw.replace(' ', '_').replace('(', '').replace(')', '').lower())
                     
                     # IQ字段特殊处理：v_osc垂直振幅转换
                     if clean_name == 'v_osc':
@@ -387,7 +415,8 @@ def parse_fit_file(file_path: str, activity_id: str, activity_name: str = None)
         laps=laps,
         records=records,
         available_fields=available_fields,
-        available_iq_fields=available_iq_fields
+        available_iq_fields=available_iq_fields,
+        parser_version=parser_fingerprint()
     )
     
     return activity
@@ -476,7 +505,8 @@ def parse_fit_bytes(file_bytes: bytes, file_name: str, activity_id: str, activit
         laps=laps,
         records=records,
         available_fields=available_fields,
-        available_iq_fields=available_iq_fields
+        available_iq_fields=available_iq_fields,
+        parser_version=parser_fingerprint()
     )
     
     return activity
@@ -28,6 +28,10 @@ except Exception:  # pragma: no cover
     app_config = None
 
 
+# IQ key prefix of merged HR columns: imported_<device>_hr
+IMPORTED_IQ_PREFIX = "imported_"
+
+
 def sanitize_device_name(device_name: Optional[str]) -> str:
     """Clean device name to be a valid field identifier.
     
@@ -45,6 +49,11 @@ def sanitize_device_name(device_name: Optional[str]) -> str:
     return cleaned if cleaned else "default"
 
 
+def imported_hr_key(device_name: Optional[str]) -> str:
+    """IQ field key the merge writes for a device, e.g. "imported_polar_h10_hr"."""
+    return f"{IMPORTED_IQ_PREFIX}{sanitize_device_name(device_name)}_hr"
+
+
 @dataclass(frozen=True)
 class HrSample:
     t: datetime
@@ -495,8 +504,7 @@ def merge_offline_hr_csv_into_activity(
         method = "metadata_align"
 
     # Decide IQ key with sanitized device name
-    sanitized_device = sanitize_device_name(parsed.device_name)
-    iq_key = f"imported_{sanitized_device}_hr"
+    iq_key = imported_hr_key(parsed.device_name)
 
     # Merge values into records
     dropped = 0
@@ -0,0 +1,119 @@
+"""
+FIT跑步数据分析器 - 索引追加日志
+索引 = 快照文件(index.json) + 追加日志(index.journal)
+
+- 每次变更只向日志追加一行JSON（put/del操作），不再整体重写索引
+- 加载时先读快照，再按顺序重放日志
+- 日志过长时压缩：原子写入新快照（临时文件 + rename），再清空日志
+- 操作是幂等的（put覆盖、del删除），快照与日志之间的任何崩溃点都可以安全重放
+- 追加与压缩由调用方在跨进程锁内执行
+"""
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from serializer import dumps, loads
+from store_io import atomic_write_bytes, file_signature
+
+
+class IndexJournal:
+    """快照 + 追加日志存储"""
+
+    def __init__(self, snapshot_file: Path, journal_file: Path):
+        self.snapshot_file = Path(snapshot_file)
+        self.journal_file = Path(journal_file)
+        # 日志中最后一个完整行的结束位置，之后的字节视为崩溃残留
+        self._valid_offset = 0
+        # 当前日志中的操作数（用于判断是否需要压缩）
+        self.op_count = 0
+
+    @property
+    def offset(self) -> int:
+        """已读取/写入的日志有效偏移"""
+        return self._valid_offset
+
+    def journal_size(self) -> int:
+        """日志文件当前大小（不存在时为0）"""
+        try:
+            return os.path.getsize(self.journal_file)
+        except FileNotFoundError:
+            return 0
+
+    def snapshot_signature(self):
+        """快照文件签名，用于检测其他进程的压缩/重写"""
+        return file_signature(self.snapshot_file)
+
+    def read_snapshot(self) -> Optional[Dict[str, Any]]:
+        """读取快照，文件不存在时返回None（JSON损坏时抛出JSONDecodeError）"""
+        try:
+            with open(self.snapshot_file, 'rb') as f:
+                return loads(f.read())
+        except FileNotFoundError:
+            return None
+
+    def read_ops(self, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        从指定偏移读取日志操作
+
+        末尾不完整或无法解析的行（写入中途崩溃）会被忽略，
+        返回的偏移停在最后一个完整行之后。
+
+        Returns:
+            (操作列表, 新的有效偏移)
+        """
+        ops: List[Dict[str, Any]] = []
+        if offset == 0:
+            self.op_count = 0
+        try:
+            with open(self.journal_file, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            self._valid_offset = 0
+            return ops, 0
+
+        pos = 0
+        while True:
+            end = data.find(b'\n', pos)
+            if end < 0:
+                break
+            line = data[pos:end]
+            if line.strip():
+                try:
+                    ops.append(loads(line))
+                except json.JSONDecodeError:
+                    print(f"警告: 索引日志在偏移 {offset + pos} 处损坏，忽略其后的内容")
+                    break
+            pos = end + 1
+
+        self._valid_offset = offset + pos
+        self.op_count += len(ops)
+        return ops, self._valid_offset
+
+    def append(self, ops: List[Dict[str, Any]]):
+        """追加一批操作，整批只做一次fsync"""
+        if not ops:
+            return
+        payload = b''.join(dumps(op) + b'\n' for op in ops)
+        with open(self.journal_file, 'ab') as f:
+            # 截掉上次崩溃留下的半行，避免新记录与残留拼接
+            if f.tell() > self._valid_offset:
+                f.truncate(self._valid_offset)
+                f.seek(self._valid_offset)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+            self._valid_offset = f.tell()
+        self.op_count += len(ops)
+
+    def write_snapshot(self, payload: Dict[str, Any]):
+        """原子写入新快照并清空日志（压缩）"""
+        atomic_write_bytes(self.snapshot_file, dumps(payload, indent=True))
+
+        # 快照已包含全部操作；此处崩溃只会导致重放幂等操作
+        with open(self.journal_file, 'wb') as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self._valid_offset = 0
+        self.op_count = 0
@@ -0,0 +1,366 @@
+"""
+FIT跑步数据分析器 - 存储完整性检查
+并行检查所有活动文件的结构，与索引对账，可选修复：
+
+- orphan    磁盘上有完整活动但索引中没有       -> 重新加入索引
+- dangling  索引中有活动但磁盘上没有有效文件   -> 从索引删除
+- corrupt   头部/记录文件无法解析或记录数不符  -> 移入隔离目录
+- partial   只有记录/包络/元数据文件、没有头部（保存中断或删除残留） -> 移入隔离目录
+- duplicate 同一活动在多个目录中都有完整文件（分片迁移中断） -> 保留读取路径上的一份，其余隔离
+- missing_base 合并活动（覆盖层）引用的基础活动不存在（或其基础活动链断开），无法读取 -> 移入隔离目录并从索引删除
+- tier      索引中的存储层级与磁盘不符         -> 更正索引
+- temp      原子写入中断遗留的临时文件         -> 删除
+- raw       不再被任何活动引用的原始FIT文件（raw/）  -> 移入隔离目录
+
+隔离目录为 data/quarantine/<时间戳>/，保留原相对路径，不会被重建索引扫描到。
+最近 GRACE_SEC 秒内修改过的文件可能属于正在进行的保存，不判定为 partial/temp。
+"""
+import shutil
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from cold_storage import COLD_SUFFIX, read_archive_member
+from column_store import read_column_pack
+from data_store import (
+    METADATA_SUFFIX, DataStore, apply_metadata, overlays_missing_base, parse_activity_header, read_activity_header,
+    read_metadata_sidecar
+)
+from migrations import upgrade_activity_data
+from models import Activity, ActivityMeta
+
+
+ACTIVITY_SUFFIXES = (".json", ".rec", ".lod", COLD_SUFFIX, METADATA_SUFFIX)
+GRACE_SEC = 300
+QUARANTINE_DIR_NAME = "quarantine"
+
+
+def _check_activity(item: Tuple[str, str, Dict[str, str]]) -> Dict[str, Any]:
+    """
+    检查一个目录中同一活动的文件（可在子进程中运行）
+
+    只解析头部和列式文件的目录区，不读取记录数据。
+
+    Args:
+        item: (目录, 活动ID, {后缀: 文件路径})
+
+    Returns:
+        {"dir", "id", "files", "status": ok|corrupt|partial, "error", "meta", "tier"}
+    """
+    directory, activity_id, files = item
+    result = {
+        "dir": directory, "id": activity_id, "files": sorted(files.values()),
+        "status": "ok", "error": None, "meta": None, "tier": "hot",
+    }
+    try:
+        if COLD_SUFFIX in files:
+            # 冻结/解冻中断时两种文件可能并存，读取时以归档为准
+            header = parse_activity_header(read_archive_member(Path(files[COLD_SUFFIX]), f"{activity_id}.json"))
+            result["tier"] = "cold"
+        elif ".json" in files:
+            header = read_activity_header(Path(files[".json"]))
+            version = header.get("schema_version", 1)
+            if version >= 2:
+                if ".rec" not in files:
+                    raise ValueError("缺少记录文件 .rec")
+                count, _ = read_column_pack(Path(files[".rec"]), [])
+                if count != header.get("record_count"):
+                    raise ValueError(f"记录数不一致: 头部 {header.get('record_count')}, 记录文件 {count}")
+            if ".lod" in files:
+                read_column_pack(Path(files[".lod"]), [])
+        else:
+            result["status"] = "partial"
+            result["error"] = "缺少头部文件"
+            return result
+
+        if header.get("id") != activity_id:
+            raise ValueError(f"头部中的活动ID不一致: {header.get('id')}")
+        if METADATA_SUFFIX in files:
+            apply_metadata(header, read_metadata_sidecar(Path(files[METADATA_SUFFIX])))
+        activity = Activity(**upgrade_activity_data(header))
+        result["meta"] = DataStore._activity_to_meta(activity).model_dump(mode='json')
+    except Exception as e:
+        result["status"] = "corrupt"
+        result["error"] = str(e)
+    return result
+
+
+def _collect_files(store: DataStore, grace_cutoff: float) -> Tuple[Dict[Tuple[str, str], Dict[str, str]], List[Path]]:
+    """按 (目录, 活动ID) 分组活动文件，并找出过期的临时文件"""
+    groups: Dict[Tuple[str, str], Dict[str, str]] = defaultdict(dict)
+    temp_files = []
+    recent = set()
+    for path in store.activities_dir.rglob("*"):
+        if not path.is_file():
+            continue
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            continue
+        if path.suffix == ".tmp":
+            if mtime < grace_cutoff:
+                temp_files.append(path)
+            continue
+        if path.suffix not in ACTIVITY_SUFFIXES:
+            continue
+        key = (str(path.parent), path.stem)
+        groups[key][path.suffix] = str(path)
+        if mtime >= grace_cutoff:
+            recent.add(key)
+
+    # 只有记录/包络文件且刚被修改：可能是正在进行的保存，本次不检查
+    for key in recent:
+        if not {".json", COLD_SUFFIX} & groups[key].keys():
+            del groups[key]
+    return groups, temp_files
+
+
+def scan_store(
+    store: DataStore,
+    repair: bool = False,
+    max_workers: Optional[int] = None,
+    throttle_sec: float = 0.0,
+    stop_event: Optional[threading.Event] = None
+) -> Dict[str, Any]:
+    """
+    检查存储完整性，可选修复
+
+    Args:
+        store: 数据存储
+        repair: 是否修复发现的问题
+        max_workers: 并行工作进程数，None表示CPU核数
+        throttle_sec: 大于0时在当前线程逐个检查并在每个活动后休眠（低优先级后台任务）
+        stop_event: 设置后停止检查，不执行修复
+
+    Returns:
+        {"scanned", "ok", "orphans", "dangling", "corrupt", "partial", "duplicates", "tier_mismatch",
+         "missing_base", "temp_files", "raw_orphans", "repaired", "quarantine_dir", "stopped", "duration_sec"}
+    """
+    started = time.time()
+    store.flush()
+    groups, temp_files = _collect_files(store, started - GRACE_SEC)
+    items = [(directory, activity_id, files) for (directory, activity_id), files in groups.items()]
+
+    results: List[Dict[str, Any]] = []
+    stopped = False
+    if throttle_sec > 0:
+        for item in items:
+            if stop_event is not None and stop_event.is_set():
+                stopped = True
+                break
+            results.append(_check_activity(item))
+            time.sleep(throttle_sec)
+    else:
+        # 打包版本(PyInstaller)中不使用子进程，避免重复启动应用
+        if len(items) >= DataStore.REBUILD_PARALLEL_MIN_FILES and not getattr(sys, 'frozen', False):
+            executor = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            executor = ThreadPoolExecutor(max_workers=1)
+        with executor:
+            results = list(executor.map(_check_activity, items, chunksize=16))
+
+    report = _reconcile(store, results)
+    report.update(
+        scanned=len({r["id"] for r in results}),
+        temp_files=[str(p.relative_to(store.data_dir)) for p in temp_files],
+        raw_orphans=_unreferenced_raw_files(store, report, started - GRACE_SEC),
+        repaired=False,
+        quarantine_dir=None,
+        stopped=stopped,
+    )
+    if repair and not stopped:
+        report["quarantine_dir"] = _repair(store, report, temp_files)
+        report["repaired"] = True
+    report["duration_sec"] = round(time.time() - started, 3)
+    return report
+
+
+def _reconcile(store: DataStore, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """把检查结果与索引对账"""
+    entries = {meta.id: meta for meta in store.iter_entries()}
+    by_id: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for result in results:
+        by_id[result["id"]].append(result)
+
+    report: Dict[str, Any] = {
+        "ok": 0, "orphans": [], "dangling": [], "corrupt": [], "partial": [], "duplicates": [], "tier_mismatch": [],
+        "missing_base": [],
+    }
+    kept: Dict[str, Dict[str, Any]] = {}
+    for activity_id, group in by_id.items():
+        valid = [r for r in group if r["status"] == "ok"]
+        for r in group:
+            if r["status"] != "ok":
+                report[r["status"]].append(_issue(store, r))
+
+        keep = None
+        if valid:
+            # 保留读取时会用到的一份（见 DataStore.activity_dir），其余为重复
+            read_dir = str(store.activity_dir(activity_id))
+            keep = next((r for r in valid if r["dir"] == read_dir), valid[0])
+            report["duplicates"].extend(_issue(store, r) for r in valid if r is not keep)
+            kept[activity_id] = keep
+
+        meta = entries.get(activity_id)
+        if keep is None:
+            if meta is not None:
+                report["dangling"].append(activity_id)
+        elif meta is None:
+            report["orphans"].append({**_issue(store, keep), "meta": keep["meta"], "tier": keep["tier"]})
+        else:
+            report["ok"] += 1
+            if meta.tier != keep["tier"]:
+                report["tier_mismatch"].append({"id": activity_id, "index": meta.tier, "disk": keep["tier"]})
+
+    # 索引中有、磁盘上完全没有文件的活动（写回队列中尚未写入的除外）
+    pending_ids = set()
+    for activity_id in entries:
+        if store.is_write_pending(activity_id):
+            pending_ids.add(activity_id)
+        elif activity_id not in by_id:
+            report["dangling"].append(activity_id)
+
+    orphan_ids = {o["id"] for o in report["orphans"]}
+    base_ids = {activity_id: result["meta"].get("base_id") for activity_id, result in kept.items()}
+    for activity_id, base_id in overlays_missing_base(base_ids, pending_ids).items():
+        report["missing_base"].append({**_issue(store, kept[activity_id]), "base_id": base_id})
+        if activity_id in orphan_ids:
+            report["orphans"] = [o for o in report["orphans"] if o["id"] != activity_id]
+        else:
+            report["ok"] -= 1
+    return report
+
+
+def _unreferenced_raw_files(store: DataStore, report: Dict[str, Any], grace_cutoff: float) -> List[str]:
+    """没有被任何活动（含孤立活动）引用、且不是刚写入的原始文件"""
+    referenced = store.referenced_raw_hashes()
+    referenced.update(o["meta"].get("raw_sha256") for o in report["orphans"])
+    unreferenced = []
+    for path in store.raw_store.iter_files():
+        try:
+            if path.stem in referenced or path.stat().st_mtime >= grace_cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        unreferenced.append(str(path.relative_to(store.data_dir)))
+    return sorted(unreferenced)
+
+
+def _issue(store: DataStore, result: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": result["id"],
+        "files": [str(Path(f).relative_to(store.data_dir)) for f in result["files"]],
+        "error": result["error"],
+    }
+
+
+def _repair(store: DataStore, report: Dict[str, Any], temp_files: List[Path]) -> Optional[str]:
+    """
+    按报告修复（在批次内逐项复核后执行，索引变更合并为一次日志提交）
+
+    Returns:
+        隔离目录（没有隔离文件时为None）
+    """
+    quarantine = store.data_dir / QUARANTINE_DIR_NAME / datetime.now().strftime("%Y%m%d-%H%M%S")
+    moved = False
+    with store.batch():
+        # 在锁内复核：扫描之后基础活动可能已被保存（同一轮中被隔离的覆盖层仍视为缺失）
+        issues = {issue["id"]: issue for issue in report["missing_base"]}
+        base_ids = {activity_id: issue["base_id"] for activity_id, issue in issues.items()}
+        saved = {base_id for base_id in base_ids.values() if base_id not in issues and store.has_activity_files(base_id)}
+        missing_base = {activity_id: issues[activity_id] for activity_id in overlays_missing_base(base_ids, saved)}
+
+        for issue in report["corrupt"] + report["partial"] + report["duplicates"] + list(missing_base.values()):
+            for name in issue["files"]:
+                source = store.data_dir / name
+                if source.exists():
+                    target = quarantine / name
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    shutil.move(str(source), str(target))
+                    moved = True
+
+        store.drop_entries([activity_id for activity_id in report["dangling"] if not store.has_activity_files(activity_id)])
+        store.drop_entries(list(missing_base))
+        puts = []
+        for orphan in report["orphans"]:
+            if store.get_activity_meta(orphan["id"]) is None:
+                puts.append(ActivityMeta(**{**orphan["meta"], "tier": orphan["tier"]}))
+        for mismatch in report["tier_mismatch"]:
+            meta = store.get_activity_meta(mismatch["id"])
+            if meta is not None:
+                puts.append(meta.model_copy(update={"tier": mismatch["disk"]}))
+        store.put_entries(puts)
+
+        # 原始文件在锁内复核：扫描之后保存的活动可能引用了它
+        referenced = store.referenced_raw_hashes()
+        for name in report["raw_orphans"]:
+            source = store.data_dir / name
+            if Path(name).stem not in referenced and source.exists():
+                target = quarantine / name
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.move(str(source), str(target))
+                moved = True
+
+    for path in temp_files:
+        path.unlink(missing_ok=True)
+    if moved:
+        print(f"完整性修复: 已隔离的文件位于 {quarantine}")
+    return str(quarantine) if moved else None
+
+
+class IntegrityJob:
+    """
+    低优先级的后台完整性检查
+
+    单线程逐个检查、每个活动后休眠 throttle_sec，结果通过 status() 获取。
+    """
+
+    def __init__(self, store: DataStore, repair: bool = False, throttle_sec: float = 0.01):
+        self.store = store
+        self.repair = repair
+        self.throttle_sec = throttle_sec
+        self._stop = threading.Event()
+        self._status: Dict[str, Any] = {
+            "state": "pending",  # pending | running | done | stopped | failed
+            "repair": repair,
+            "started_at": None,
+            "finished_at": None,
+            "report": None,
+            "error": None,
+        }
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="store-integrity", daemon=True)
+
+    def start(self):
+        self._update(state="running", started_at=datetime.now().isoformat())
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def is_running(self) -> bool:
+        return self._thread.is_alive()
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._status)
+
+    def _update(self, **changes):
+        with self._lock:
+            self._status.update(changes)
+
+    def _run(self):
+        try:
+            report = scan_store(self.store, self.repair, throttle_sec=self.throttle_sec, stop_event=self._stop)
+            state = "stopped" if report["stopped"] else "done"
+            self._update(state=state, report=report, finished_at=datetime.now().isoformat())
+        except Exception as e:
+            print(f"警告: 完整性检查失败: {e}")
+            self._update(state="failed", error=str(e), finished_at=datetime.now().isoformat())
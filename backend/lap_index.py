@@ -0,0 +1,255 @@
+"""
+FIT跑步数据分析器 - 圈索引
+整个活动库所有圈的紧凑表：每个活动一段列式数据（圈的数值汇总、派生配速、数值型IQ圈汇总），
+跨活动的圈查询（如“约1km、快于4:00/km、平均心率低于170的所有圈”）只在内存中过滤，不读取活动文件。
+
+增量维护:
+- 每个活动的圈数据带签名（由索引元数据中随活动内容变化的字段计算），
+  索引 put 时签名变化才标记为过期；只修改名称/标签、冷热存储切换等不影响圈数据。
+  本进程保存活动时直接标记为过期（只改了圈的活动签名可能不变）
+- 查询前只为过期的活动重新读取头部中的 laps（头部很小，冷存储只读取归档中的头部，不解压全部）
+- 删除活动时直接移除
+- 圈表保存在 data/laps.cache（原子写入），新进程加载后按签名校验，只重新读取变化的活动
+
+活动级信息（名称、日期、运动类型）不在圈表中，查询时从活动索引关联。
+"""
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from column_store import IQ_COLUMN_PREFIX
+from models import ActivityMeta, Lap
+from serializer import loads, dumps
+from store_io import atomic_write_bytes
+
+
+LAP_CACHE_NAME = "laps.cache"
+LAP_CACHE_VERSION = 1
+# 由平均速度派生的配速列（秒/公里）
+PACE_FIELD = "pace_sec_per_km"
+# 圈的数值汇总字段
+LAP_NUMERIC_FIELDS = [
+    name for name in Lap.model_fields
+    if name not in ("lap_number", "start_time", "iq_fields")
+]
+
+LapRange = Tuple[Optional[float], Optional[float]]
+
+
+def lap_signature(meta: ActivityMeta) -> str:
+    """随活动内容（而不是用户可编辑的元数据）变化的索引字段，用于判断圈数据是否过期"""
+    parts = (
+        meta.date.isoformat() if meta.date else None, meta.distance_km, meta.duration_sec,
+        meta.avg_heart_rate, meta.avg_cadence, meta.avg_power, meta.total_ascent,
+        ",".join(meta.available_fields), ",".join(meta.available_iq_fields),
+        meta.raw_sha256, meta.parser_version, meta.base_id,
+    )
+    return "|".join("" if p is None else str(p) for p in parts)
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def laps_to_columns(laps: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """
+    把头部中的 laps（model_dump(mode='json') 的结果）转换为列
+
+    只保留数值列；全为空的列不生成；IQ汇总加 iq_ 前缀。
+    """
+    columns: Dict[str, List[Any]] = {
+        "lap_number": [lap.get("lap_number") for lap in laps],
+        "start_time": [lap.get("start_time") for lap in laps],
+    }
+    for name in LAP_NUMERIC_FIELDS:
+        values = [lap.get(name) for lap in laps]
+        if any(v is not None for v in values):
+            columns[name] = values
+    speeds = columns.get("avg_speed")
+    if speeds is not None:
+        columns[PACE_FIELD] = [round(1000 / v, 1) if v else None for v in speeds]
+
+    iq_keys: Dict[str, None] = {}
+    for lap in laps:
+        for key, value in (lap.get("iq_fields") or {}).items():
+            if _is_number(value):
+                iq_keys.setdefault(key, None)
+    for key in iq_keys:
+        values = [(lap.get("iq_fields") or {}).get(key) for lap in laps]
+        columns[IQ_COLUMN_PREFIX + key] = [v if _is_number(v) else None for v in values]
+    return columns
+
+
+class _Entry:
+    __slots__ = ("signature", "count", "columns")
+
+    def __init__(self, signature: Optional[str], count: int = 0, columns: Optional[Dict[str, List[Any]]] = None):
+        self.signature = signature
+        self.count = count
+        self.columns = columns or {}
+
+
+class LapIndex:
+    """
+    活动库的圈表
+
+    线程安全。签名为None的条目表示尚未读取或已过期。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _Entry] = {}
+        # 已读取的条目（签名与索引一致）
+        self._fresh: Dict[str, str] = {}
+        self._dirty = False
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(entry.count for entry in self._entries.values())
+
+    @classmethod
+    def load(cls, path: Path) -> "LapIndex":
+        """从缓存文件加载（文件不存在或无法解析时为空，圈数据在查询时重新读取）"""
+        index = cls()
+        try:
+            data = loads(path.read_bytes())
+        except FileNotFoundError:
+            return index
+        except Exception as e:
+            print(f"警告: 圈索引缓存无法读取，将重新生成: {e}")
+            return index
+        if data.get("version") != LAP_CACHE_VERSION:
+            return index
+        for activity_id, item in data.get("activities", {}).items():
+            index._entries[activity_id] = _Entry(None, item["count"], item["columns"])
+            index._fresh[activity_id] = item["signature"]
+        return index
+
+    def save(self, path: Path):
+        """写入缓存文件（只写已读取的条目）"""
+        with self._lock:
+            if not self._dirty:
+                return
+            payload = {
+                "version": LAP_CACHE_VERSION,
+                "activities": {
+                    activity_id: {"signature": entry.signature, "count": entry.count, "columns": entry.columns}
+                    for activity_id, entry in self._entries.items() if entry.signature is not None
+                },
+            }
+            self._dirty = False
+        atomic_write_bytes(path, dumps(payload))
+
+    def sync(self, metas: Iterable[ActivityMeta]):
+        """与活动索引整体对齐：去掉已不存在的活动，签名不一致的标记为过期"""
+        with self._lock:
+            seen = set()
+            for meta in metas:
+                seen.add(meta.id)
+                self._mark(meta)
+            for activity_id in [a for a in self._entries if a not in seen]:
+                del self._entries[activity_id]
+                self._dirty = True
+            self._fresh.clear()
+
+    def put(self, meta: ActivityMeta):
+        """活动被保存或修改：签名变化时标记为过期"""
+        with self._lock:
+            self._mark(meta)
+
+    def _mark(self, meta: ActivityMeta):
+        signature = lap_signature(meta)
+        entry = self._entries.get(meta.id)
+        if entry is None:
+            self._entries[meta.id] = _Entry(None)
+        elif entry.signature is None and self._fresh.get(meta.id) == signature:
+            # 从缓存文件加载的条目与索引一致
+            entry.signature = signature
+        elif entry.signature != signature:
+            entry.signature = None
+
+    def invalidate(self, activity_id: str):
+        """活动内容被重写（圈可能变化而索引元数据不变）：标记为过期"""
+        with self._lock:
+            entry = self._entries.get(activity_id)
+            if entry is not None:
+                entry.signature = None
+
+    def remove(self, activity_id: str):
+        with self._lock:
+            if self._entries.pop(activity_id, None) is not None:
+                self._dirty = True
+
+    def stale_ids(self) -> List[str]:
+        """需要重新读取圈数据的活动"""
+        with self._lock:
+            return [activity_id for activity_id, entry in self._entries.items() if entry.signature is None]
+
+    def set_laps(self, meta: ActivityMeta, laps: List[Dict[str, Any]]):
+        """保存重新读取的圈数据（活动已被删除时忽略）"""
+        columns = laps_to_columns(laps)
+        with self._lock:
+            if meta.id not in self._entries:
+                return
+            self._entries[meta.id] = _Entry(lap_signature(meta), len(laps), columns)
+            self._dirty = True
+
+    def query(
+        self,
+        ranges: Dict[str, LapRange],
+        activity_filter: Optional[Callable[[str], bool]] = None,
+        sort_by: Optional[str] = None,
+        descending: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        按字段范围筛选圈
+
+        Args:
+            ranges: {字段: (最小值, 最大值)}，包含边界，None表示不限；圈中该字段为空时不匹配
+            activity_filter: 只查询返回True的活动
+            sort_by: 排序字段（空值排在最后），None时按活动、圈号顺序
+            descending: 是否降序
+
+        Returns:
+            [{"activity_id", "lap_number", "start_time", 各字段...}]，只包含非空字段
+        """
+        rows = []
+        with self._lock:
+            for activity_id, entry in self._entries.items():
+                if entry.signature is None or not entry.count:
+                    continue
+                if activity_filter is not None and not activity_filter(activity_id):
+                    continue
+                columns = entry.columns
+                checks = []
+                for field, (low, high) in ranges.items():
+                    values = columns.get(field)
+                    if values is None:
+                        break
+                    checks.append((values, low, high))
+                else:
+                    for i in range(entry.count):
+                        if all(
+                            values[i] is not None
+                            and (low is None or values[i] >= low)
+                            and (high is None or values[i] <= high)
+                            for values, low, high in checks
+                        ):
+                            row = {name: values[i] for name, values in columns.items() if values[i] is not None}
+                            row["activity_id"] = activity_id
+                            rows.append(row)
+
+        if sort_by is not None:
+            present = [row for row in rows if row.get(sort_by) is not None]
+            present.sort(key=lambda row: row[sort_by], reverse=descending)
+            rows = present + [row for row in rows if row.get(sort_by) is None]
+        return rows
+
+    def fields(self) -> Set[str]:
+        """可查询的字段"""
+        with self._lock:
+            names: Set[str] = set()
+            for entry in self._entries.values():
+                names.update(entry.columns)
+            names.discard("start_time")
+            return names
@@ -0,0 +1,258 @@
+"""
+FIT跑步数据分析器 - 多分辨率细节层级(LOD)
+保存活动时按固定时间桶预计算每个数值字段的 min/max/mean 包络，
+概览图表按像素宽度选择合适的层级，只传输几百个点。
+
+层级数据以列式文件 <id>.lod 存储（复用 column_store 格式），列名:
+    levels              [[桶宽秒数, 点数], ...]
+    {L}/x               每个桶的起始时间(秒)
+    {L}/{字段}/min|max|mean
+"""
+from itertools import repeat
+from operator import add, truediv
+from typing import Any, Dict, List, Tuple, Union
+
+
+# 预计算的层级（桶宽，秒），由细到粗
+LOD_LEVELS_SEC = (5, 30, 300)
+
+# 时间轴字段，用于分桶
+TIME_FIELD = "elapsed_time"
+# 不参与聚合的列
+_SKIP_FIELDS = {"timestamp", TIME_FIELD}
+
+# 桶内记录的选择器：连续区间为切片，时间轴不单调时为记录位置列表
+Selector = Union[slice, List[int]]
+
+
+def _is_numeric_column(values: List[Any]) -> bool:
+    """列中所有非空值均为数字（不含bool）"""
+    kinds = set(map(type, values))
+    kinds.discard(type(None))
+    return bool(kinds) and kinds <= {int, float}
+
+
+def _bucket_segments(times: List[Any], bucket_sec: int) -> List[Tuple[int, int, int]]:
+    """
+    时间轴按桶切分为连续的记录区间 [(桶序号, 起始, 结束)]
+
+    时间为空的记录不属于任何区间；时间轴不单调时同一个桶可能出现在多个区间中。
+    """
+    segments = []
+    current = None
+    start = 0
+    for i, t in enumerate(times):
+        b = int(t // bucket_sec) if t is not None else None
+        if b != current:
+            if current is not None:
+                segments.append((current, start, i))
+            current, start = b, i
+    if current is not None:
+        segments.append((current, start, len(times)))
+    return segments
+
+
+def _bucket_selectors(times: List[Any], bucket_sec: int) -> Tuple[List[int], List[Selector]]:
+    """
+    最细层级的桶与每个桶的记录选择器（所有字段共用）
+
+    Returns:
+        (升序的桶序号, 对应的选择器)：时间轴单调时为切片，否则为记录位置列表
+    """
+    segments = _bucket_segments(times, bucket_sec)
+    if all(a[0] < b[0] for a, b in zip(segments, segments[1:])):
+        return [b for b, _, _ in segments], [slice(start, end) for _, start, end in segments]
+    positions: Dict[int, List[int]] = {}
+    for b, start, end in segments:
+        positions.setdefault(b, []).extend(range(start, end))
+    buckets = sorted(positions)
+    return buckets, [positions[b] for b in buckets]
+
+
+def _group_selectors(buckets: List[int], factor: int) -> Tuple[List[int], List[Selector]]:
+    """把升序的细层级桶按 factor 合并：(粗层级桶序号, 细层级列上的切片)"""
+    groups: List[int] = []
+    selectors: List[Selector] = []
+    start = 0
+    for i, b in enumerate(buckets):
+        key = b // factor
+        if not groups or groups[-1] != key:
+            if groups:
+                selectors.append(slice(start, i))
+            groups.append(key)
+            start = i
+    if groups:
+        selectors.append(slice(start, len(buckets)))
+    return groups, selectors
+
+
+def _parts(values: List[Any], selectors: List[Selector]) -> List[List[Any]]:
+    """按选择器取出每个桶的非空值"""
+    if selectors and isinstance(selectors[0], slice):
+        parts = list(map(values.__getitem__, selectors))
+    else:
+        parts = [list(map(values.__getitem__, s)) for s in selectors]
+    if None in values:
+        parts = [[v for v in part if v is not None] if None in part else part for part in parts]
+    return parts
+
+
+def _reduce(fn, parts: List[List[Any]]) -> List[Any]:
+    """每个桶的 fn(值)，没有值的桶为None"""
+    if all(parts):
+        return list(map(fn, parts))
+    return [fn(part) if part else None for part in parts]
+
+
+def _envelope(parts: List[List[Any]]) -> List[List[Any]]:
+    """[mins, maxs, sums, counts]"""
+    return [_reduce(min, parts), _reduce(max, parts), _reduce(sum, parts), list(map(len, parts))]
+
+
+def _stride(selectors: List[Selector]) -> int:
+    """除首尾两个桶外所有桶都是等宽连续区间时返回该宽度，否则返回0"""
+    inner = selectors[1:-1]
+    if not inner or not isinstance(inner[0], slice):
+        return 0
+    width = inner[0].stop - inner[0].start
+    if inner[-1].stop - inner[0].start != width * len(inner):
+        return 0
+    return width
+
+
+def _strided_envelope(values: List[Any], selectors: List[Selector], width: int) -> List[List[Any]]:
+    """
+    等宽桶且没有空值时的包络：中间的桶按列步长切片后逐元素比较/累加
+
+    累加顺序与按桶 sum 相同，结果一致。
+    """
+    head, tail = values[selectors[0]], values[selectors[-1]]
+    start, stop = selectors[1].start, selectors[-1].start
+    strides = [values[start + j:stop:width] for j in range(width)]
+    if width == 1:
+        mins = maxs = sums = strides[0]
+    else:
+        mins = list(map(min, *strides))
+        maxs = list(map(max, *strides))
+        sums = strides[0]
+        for stride in strides[1:]:
+            sums = list(map(add, sums, stride))
+    return [
+        [min(head), *mins, min(tail)],
+        [max(head), *maxs, max(tail)],
+        [sum(head), *sums, sum(tail)],
+        [len(head), *repeat(width, len(mins)), len(tail)],
+    ]
+
+
+def _merge_envelope(envelope: List[List[Any]], selectors: List[Selector]) -> List[List[Any]]:
+    """由细层级的包络合并出粗层级的包络"""
+    mins, maxs, sums, counts = envelope
+    return [
+        _reduce(min, _parts(mins, selectors)),
+        _reduce(max, _parts(maxs, selectors)),
+        _reduce(sum, _parts(sums, selectors)),
+        list(map(sum, _parts(counts, selectors))),
+    ]
+
+
+def build_lod_columns(columns: Dict[str, List[Any]]) -> Dict[str, List[Any]]:
+    """
+    由记录列计算所有层级的包络列
+
+    只对数值列聚合；没有时间轴时返回空字典。
+    时间轴只分桶一次，各字段按桶整段用 min/max/sum 计算（C实现的批量操作），
+    规则采样的完整列按步长切片逐元素计算；
+    粗层级由上一层级的包络合并得到，不再遍历原始数据。
+    """
+    times = columns.get(TIME_FIELD)
+    if not times or all(t is None for t in times):
+        return {}
+
+    fields = [name for name, values in columns.items()
+              if name not in _SKIP_FIELDS and _is_numeric_column(values)]
+
+    buckets, selectors = _bucket_selectors(times, LOD_LEVELS_SEC[0])
+    width = _stride(selectors)
+    per_field = {}
+    for name in fields:
+        values = columns[name]
+        if width and None not in values:
+            per_field[name] = _strided_envelope(values, selectors, width)
+        else:
+            per_field[name] = _envelope(_parts(values, selectors))
+
+    result: Dict[str, List[Any]] = {}
+    levels = []
+    prev_level = LOD_LEVELS_SEC[0]
+    for level in LOD_LEVELS_SEC:
+        if level != prev_level:
+            buckets, groups = _group_selectors(buckets, level // prev_level)
+            per_field = {name: _merge_envelope(envelope, groups) for name, envelope in per_field.items()}
+            prev_level = level
+
+        result[f"{level}/x"] = [b * level for b in buckets]
+        for name, (mins, maxs, sums, counts) in per_field.items():
+            result[f"{level}/{name}/min"] = mins
+            result[f"{level}/{name}/max"] = maxs
+            if all(counts):
+                means = list(map(round, map(truediv, sums, counts), repeat(4)))
+            else:
+                means = [round(total / count, 4) if count else None for total, count in zip(sums, counts)]
+            result[f"{level}/{name}/mean"] = means
+        levels.append([level, len(buckets)])
+
+    result["levels"] = levels
+    return result
+
+
+def select_lod_level(levels: List[List[int]], raw_count: int, width: int) -> int:
+    """
+    根据像素宽度选择层级
+
+    原始点数不超过宽度时返回0（使用原始数据）；否则返回点数不超过宽度的最细层级，
+    都超过时返回最粗层级。
+    """
+    if raw_count <= width or not levels:
+        return 0
+    for level, count in sorted(levels):
+        if count <= width:
+            return level
+    return max(level for level, _ in levels)
+
+
+def lod_column_names(level: int, fields: List[str]) -> List[str]:
+    """某一层级下指定字段需要读取的列名"""
+    names = [f"{level}/x"]
+    for field in fields:
+        names.extend(f"{level}/{field}/{stat}" for stat in ("min", "max", "mean"))
+    return names
+
+
+def lod_payload(level: int, columns: Dict[str, List[Any]], fields: List[str]) -> Dict[str, Any]:
+    """
+    组装API返回结构
+
+    Returns:
+        {"level_sec": 层级, "points": 点数, "x": [...],
+         "series": {字段: {"min": [...], "max": [...], "mean": [...]}}}
+    """
+    if level == 0:
+        x = columns.get(TIME_FIELD, [])
+        series = {
+            field: {"min": columns[field], "max": columns[field], "mean": columns[field]}
+            for field in fields if field in columns
+        }
+    else:
+        x = columns.get(f"{level}/x", [])
+        series = {
+            field: {stat: columns[f"{level}/{field}/{stat}"] for stat in ("min", "max", "mean")}
+            for field in fields if f"{level}/{field}/mean" in columns
+        }
+    return {"level_sec": level, "points": len(x), "x": x, "series": series}
+
+
+def raw_lod_fields(fields: List[str]) -> List[str]:
+    """原始层级需要读取的记录列"""
+    return [TIME_FIELD] + [f for f in fields if f != TIME_FIELD]
+
@@ -3,8 +3,9 @@ FIT跑步数据分析器 - FastAPI主应用
 """
 import os
 import sys
+import threading
 import uuid
-from copy import deepcopy
+from contextlib import asynccontextmanager
 from datetime import datetime
 from pathlib import Path
 from typing import List, Optional
@@ -12,7 +13,7 @@ from typing import List, Optional
 from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Form
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import Response, StreamingResponse, FileResponse
+from fastapi.responses import Response, StreamingResponse, FileResponse, JSONResponse
 import io
 
 # 添加backend目录到路径
@@ -38,19 +39,71 @@ else:
 
 from models import (
     Activity, ActivityMeta, UploadResponse, ActivityListResponse,
-    CompareRequest, CompareResponse, CompareActivityData, HrMergeOptions
+    CompareRequest, CompareResponse, CompareActivityData, HrMergeOptions,
+    BatchDeleteRequest, BatchUpdateRequest, ReprocessRequest, ActivityMetadataPatch, FieldUnionRequest,
+    LapQueryRequest
 )
-from fit_parser import parse_fit_bytes, speed_to_pace
+from fit_parser import parse_fit_bytes, parser_fingerprint, speed_to_pace
 from data_store import DataStore
 from csv_exporter import export_merged_csv, export_categorized_zip, export_laps_csv
-from hr_csv_merge import merge_offline_hr_csv_into_activity
+from hr_csv_merge import imported_hr_key, merge_offline_hr_csv_into_activity
+from column_store import IQ_COLUMN_PREFIX
 from device_mappings import DeviceRegistry
+from serializer import dumps
+from snapshot import iter_snapshot
+from integrity import IntegrityJob
+from reprocess import ReprocessJob, find_reprocess_candidates
+
+try:
+    import config as app_config
+except Exception:  # pragma: no cover
+    app_config = None
+
+
+class FastJSONResponse(JSONResponse):
+    """使用 serializer 编码的JSON响应（安装了 orjson 时更快）"""
+    
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    启动时在后台把旧格式的活动迁移到最新格式，（配置了 STORE_COLD_AFTER_DAYS 时）把长期未访问的活动移入冷存储，
+    （配置了 STORE_AUTO_REPROCESS 时）用存档的原始文件重新解析由旧版本解析器解析的活动；
+    退出时停止后台任务，并等待写回队列写完
+    """
+    data_store.start_migration()
+    if getattr(app_config, "STORE_AUTO_REPROCESS", False):
+        outdated = find_reprocess_candidates(data_store)
+        if outdated:
+            print(f"解析器已更新: 后台重新解析 {len(outdated)} 个活动")
+            _start_reprocess(outdated)
+    tiering_stop = threading.Event()
+    cold_after_days = getattr(app_config, "STORE_COLD_AFTER_DAYS", None)
+    if cold_after_days:
+        threading.Thread(
+            target=data_store.apply_tiering, args=(cold_after_days, tiering_stop),
+            name="activity-tiering", daemon=True
+        ).start()
+    yield
+    tiering_stop.set()
+    if integrity_job is not None:
+        integrity_job.stop()
+    if reprocess_job is not None:
+        reprocess_job.stop()
+    data_store.stop_migration()
+    data_store.close()
+
 
 # 初始化
 app = FastAPI(
     title="FIT跑步数据分析器",
     description="解析FIT文件，展示趋势图，支持对比分析和CSV导出",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # CORS配置
@@ -62,12 +115,46 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 后台完整性检查（通过 /api/storage/integrity 启动）
+integrity_job: Optional[IntegrityJob] = None
+# 后台重新解析（启动时自动或通过 /api/storage/reprocess 启动）
+reprocess_job: Optional[ReprocessJob] = None
+
 # 数据存储
-data_store = DataStore(str(DATA_DIR))
+data_store = DataStore(
+    str(DATA_DIR),
+    write_behind=getattr(app_config, "STORE_WRITE_BEHIND", False),
+    record_cache_mb=getattr(app_config, "STORE_RECORD_CACHE_MB", None)
+)
 
 
 # ==================== API 路由 ====================
 
+def _parse_upload(file_bytes: bytes, file_name: str, name: Optional[str] = None) -> Activity:
+    """解析上传的FIT文件并存档原始文件（解析器更新后用于重新解析）"""
+    activity_name = name or Path(file_name).stem
+    activity = parse_fit_bytes(file_bytes, file_name, str(uuid.uuid4()), activity_name)
+    activity.raw_sha256 = data_store.raw_store.put(file_bytes)
+    return activity
+
+
+def _upload_response(activity: Activity, meta: ActivityMeta) -> UploadResponse:
+    return UploadResponse(
+        success=True,
+        activity_id=activity.id,
+        message="活动导入成功",
+        summary={
+            "sport": activity.session.sport,
+            "distance_km": meta.distance_km,
+            "duration": f"{int(meta.duration_sec // 60)}:{int(meta.duration_sec % 60):02d}",
+            "records_count": len(activity.records),
+            "laps_count": len(activity.laps),
+            "available_fields": activity.available_fields,
+            "available_iq_fields": activity.available_iq_fields
+        }
+    )
+
+
 @app.post("/api/upload", response_model=UploadResponse)
 async def upload_fit_file(
     file: UploadFile = File(...),
@@ -79,40 +166,43 @@ async def upload_fit_file(
         raise HTTPException(status_code=400, detail="只支持.fit文件")
     
     try:
-        # 读取文件内容
-        file_bytes = await file.read()
-        
-        # 生成活动ID
-        activity_id = str(uuid.uuid4())
-        
-        # 活动名称
-        activity_name = name or Path(file.filename).stem
-        
-        # 解析FIT文件
-        activity = parse_fit_bytes(file_bytes, file.filename, activity_id, activity_name)
+        # 读取并解析文件
+        activity = _parse_upload(await file.read(), file.filename, name)
         
         # 保存活动
         meta = data_store.save_activity(activity)
         
-        return UploadResponse(
-            success=True,
-            activity_id=activity_id,
-            message="活动导入成功",
-            summary={
-                "sport": activity.session.sport,
-                "distance_km": meta.distance_km,
-                "duration": f"{int(meta.duration_sec // 60)}:{int(meta.duration_sec % 60):02d}",
-                "records_count": len(activity.records),
-                "laps_count": len(activity.laps),
-                "available_fields": activity.available_fields,
-                "available_iq_fields": activity.available_iq_fields
-            }
-        )
+        return _upload_response(activity, meta)
     
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"解析FIT文件失败: {str(e)}")
 
 
+@app.post("/api/upload/batch", response_model=List[UploadResponse])
+async def upload_fit_files(files: List[UploadFile] = File(...)):
+    """
+    一次上传多个FIT文件
+    
+    先逐个解析，再在一个索引批次内保存所有活动（只追加一次索引日志）。
+    返回与上传顺序一致的结果，单个文件失败不影响其他文件。
+    """
+    results: List[Optional[UploadResponse]] = [None] * len(files)
+    parsed = []
+    for i, file in enumerate(files):
+        if not file.filename.lower().endswith('.fit'):
+            results[i] = UploadResponse(success=False, message=f"{file.filename}: 只支持.fit文件")
+            continue
+        try:
+            parsed.append((i, _parse_upload(await file.read(), file.filename)))
+        except Exception as e:
+            results[i] = UploadResponse(success=False, message=f"{file.filename}: 解析FIT文件失败: {str(e)}")
+    
+    with data_store.batch():
+        for i, activity in parsed:
+            results[i] = _upload_response(activity, data_store.save_activity(activity))
+    return results
+
+
 @app.get("/api/activities", response_model=ActivityListResponse)
 async def get_activities(
     sort: str = Query("date", description="排序字段"),
@@ -122,6 +212,8 @@ async def get_activities(
     date_to: Optional[str] = Query(None, description="结束日期 YYYY-MM-DD"),
     distance_min: Optional[float] = Query(None, description="最小距离(km)"),
     distance_max: Optional[float] = Query(None, description="最大距离(km)"),
+    tag: Optional[str] = Query(None, description="标签"),
+    field: Optional[List[str]] = Query(None, description="只返回包含这些字段的活动（可重复；iq_imported_* 为前缀匹配）"),
     page: int = Query(1, ge=1, description="页码"),
     limit: int = Query(20, ge=1, le=100, description="每页数量")
 ):
@@ -148,10 +240,72 @@ async def get_activities(
         filter_date_to=filter_date_to,
         filter_distance_min=distance_min,
         filter_distance_max=distance_max,
+        filter_tag=tag,
+        filter_fields=field,
+        page=page,
+        limit=limit
+    )
+    
+    return ActivityListResponse(
+        activities=activities,
+        total=total,
         page=page,
         limit=limit
     )
+
+
+@app.post("/api/activities/fields")
+async def get_activities_field_union(request: FieldUnionRequest):
+    """一组活动的字段并集及每个字段出现的活动数（由字段倒排索引计算）"""
+    return data_store.get_field_union(request.activity_ids)
+
+
+@app.post("/api/laps/query")
+async def query_laps(request: LapQueryRequest):
+    """
+    跨活动查询圈（由圈索引计算）
+    
+    可用字段为圈的汇总字段（total_distance、avg_heart_rate 等）、pace_sec_per_km（秒/公里）
+    和 iq_ 前缀的IQ圈汇总。
+    
+    Returns:
+        {
+            "laps": [
+                {"activity_id": "...", "activity_name": "...", "date": "...", "sport": "running",
+                 "lap_number": 3, "total_distance": 1000.0, "avg_heart_rate": 165, "pace_sec_per_km": 235.0, ...}
+            ],
+            "total": 12, "page": 1, "limit": 50
+        }
+    """
+    try:
+        filter_date_from = datetime.strptime(request.date_from, "%Y-%m-%d").date() if request.date_from else None
+        filter_date_to = datetime.strptime(request.date_to, "%Y-%m-%d").date() if request.date_to else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日期格式应为 YYYY-MM-DD")
     
+    laps, total = data_store.query_laps(
+        ranges={field: (r.min, r.max) for field, r in request.ranges.items()},
+        sport=request.sport,
+        date_from=filter_date_from,
+        date_to=filter_date_to,
+        activity_ids=request.activity_ids,
+        sort_by=request.sort_by,
+        order=request.order,
+        page=request.page,
+        limit=request.limit
+    )
+    return {"laps": laps, "total": total, "page": request.page, "limit": request.limit}
+
+
+@app.get("/api/activities/search", response_model=ActivityListResponse)
+async def search_activities(
+    q: str = Query(..., min_length=1, description="搜索关键词（名称、文件名、运动类型、设备名、标签、备注）"),
+    fuzzy: bool = Query(True, description="是否允许容错匹配"),
+    page: int = Query(1, ge=1, description="页码"),
+    limit: int = Query(20, ge=1, le=100, description="每页数量")
+):
+    """搜索活动，结果按相关度排序"""
+    activities, total = data_store.search_activities(q, fuzzy=fuzzy, page=page, limit=limit)
     return ActivityListResponse(
         activities=activities,
         total=total,
@@ -160,25 +314,119 @@ async def get_activities(
     )
 
 
+RANGE_BY_PATTERN = "^(elapsed_time|distance)$"
+
+
+def _record_range(range_by: str, start: Optional[float], end: Optional[float]):
+    """解析记录范围参数；start/end 都未指定时返回None（完整活动）"""
+    if start is None and end is None:
+        return None
+    if start is not None and end is not None and start > end:
+        raise HTTPException(status_code=400, detail="start 不能大于 end")
+    return (range_by, start, end)
+
+
 @app.get("/api/activity/{activity_id}")
-async def get_activity(activity_id: str):
-    """获取活动详情"""
-    activity = data_store.get_activity(activity_id)
-    if not activity:
+async def get_activity(
+    activity_id: str,
+    fields: Optional[str] = Query(None, description="只返回指定的记录字段，逗号分隔（如 heart_rate,iq_dr_gct）"),
+    start: Optional[float] = Query(None, description="只返回范围内的记录：下限（秒或米，见 range_by）"),
+    end: Optional[float] = Query(None, description="只返回范围内的记录：上限"),
+    range_by: str = Query("elapsed_time", pattern=RANGE_BY_PATTERN, description="范围字段 elapsed_time/distance"),
+    layout: str = Query("records", pattern="^(records|columns|none)$",
+                        description="records: 逐条记录（每条带 iq_fields）；columns: 按列返回，IQ字段只声明一次；"
+                                    "none: 不返回记录，只返回头部和 record_count")
+):
+    """获取活动详情（可只返回某个时间/距离范围内的记录）"""
+    include_fields = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    payload = data_store.get_activity_payload(
+        activity_id, include_fields, _record_range(range_by, start, end), layout=layout
+    )
+    if payload is None:
         raise HTTPException(status_code=404, detail="活动不存在")
     
-    return activity.model_dump(mode='json')
+    # 直接返回响应，跳过 FastAPI 对大列表的 jsonable_encoder 遍历
+    return FastJSONResponse(payload)
+
+
+@app.get("/api/activity/{activity_id}/lod")
+async def get_activity_lod(
+    activity_id: str,
+    fields: str = Query(..., description="字段列表，逗号分隔（如 heart_rate,iq_dr_gct）"),
+    width: int = Query(1000, ge=10, le=20000, description="图表像素宽度（期望的最大点数）"),
+    start: Optional[float] = Query(None, description="缩放范围下限（秒或米，见 range_by）"),
+    end: Optional[float] = Query(None, description="缩放范围上限"),
+    range_by: str = Query("elapsed_time", pattern=RANGE_BY_PATTERN, description="范围字段 elapsed_time/distance")
+):
+    """获取适合图表宽度的多分辨率包络数据（min/max/mean），可只取缩放范围内的数据"""
+    field_list = [f.strip() for f in fields.split(",") if f.strip()]
+    lod = data_store.get_activity_lod(activity_id, field_list, width, _record_range(range_by, start, end))
+    if lod is None:
+        raise HTTPException(status_code=404, detail="活动不存在")
+    return FastJSONResponse(lod)
 
 
 @app.delete("/api/activity/{activity_id}")
 async def delete_activity(activity_id: str):
     """删除活动"""
-    success = data_store.delete_activity(activity_id)
+    try:
+        success = data_store.delete_activity(activity_id)
+    except TimeoutError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     if success:
         return {"success": True, "message": "活动已删除"}
     raise HTTPException(status_code=404, detail="活动不存在")
 
 
+@app.post("/api/activities/delete")
+async def delete_activities(request: BatchDeleteRequest):
+    """批量删除活动（一次请求、一次索引提交），返回每个活动的删除结果"""
+    try:
+        results = data_store.delete_activities(request.activity_ids)
+    except TimeoutError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    deleted_count = sum(1 for ok in results.values() if ok)
+    return {
+        "success": True,
+        "deleted_count": deleted_count,
+        "results": results,
+        "message": f"成功删除{deleted_count}个活动"
+    }
+
+
+@app.patch("/api/activity/{activity_id}", response_model=ActivityMeta)
+async def patch_activity(activity_id: str, patch: ActivityMetadataPatch):
+    """修改单个活动的元数据（名称、运动类型、备注、标签、合并溯源），只写元数据附属文件和索引"""
+    try:
+        results = data_store.update_activities_metadata({activity_id: patch.model_dump(exclude_none=True)})
+    except TimeoutError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if not results[activity_id]:
+        raise HTTPException(status_code=404, detail="活动不存在")
+    return data_store.get_activity_meta(activity_id)
+
+
+@app.patch("/api/activities")
+@app.post("/api/activities/update")
+async def update_activities(request: BatchUpdateRequest):
+    """批量更新活动元数据（名称、运动类型、备注、标签、合并溯源），返回每个活动的更新结果"""
+    updates = {
+        u.id: u.model_dump(exclude={"id"}, exclude_none=True)
+        for u in request.updates
+    }
+    try:
+        results = data_store.update_activities_metadata(updates)
+    except TimeoutError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    updated_count = sum(1 for ok in results.values() if ok)
+    return {
+        "success": True,
+        "updated_count": updated_count,
+        "results": results,
+        "message": f"成功更新{updated_count}个活动"
+    }
+
+
 @app.post("/api/activity/{activity_id}/merge/hr_csv")
 async def merge_hr_csv_into_activity(
     activity_id: str,
@@ -189,21 +437,23 @@ async def merge_hr_csv_into_activity(
     interpolate_max_gap_sec: Optional[float] = Form(None),
     allow_extrapolation: Optional[bool] = Form(None),
 ):
-    """将离线心率CSV合并到指定活动，创建新活动副本（不修改原活动）"""
+    """
+    将离线心率CSV合并到指定活动，创建新活动（不修改原活动）
+
+    新活动保存为覆盖层：引用原活动，只保存合并写入的心率列和合并溯源
+    """
     if file.filename and not file.filename.lower().endswith('.csv'):
         raise HTTPException(status_code=400, detail="只支持.csv文件")
 
-    original_activity = data_store.get_activity(activity_id)
-    if not original_activity:
+    # get_activity 每次返回新构造的对象，直接在其上合并
+    new_activity = data_store.get_activity(activity_id)
+    if not new_activity:
         raise HTTPException(status_code=404, detail="活动不存在")
 
     try:
-        # Create deep copy of original activity
-        new_activity = deepcopy(original_activity)
-        
         # Generate new ID and update name with prefix
         new_activity.id = str(uuid.uuid4())
-        new_activity.name = f"[HR合并]{original_activity.name}"
+        new_activity.name = f"[HR合并]{new_activity.name}"
         new_activity.created_at = datetime.now()
         
         # Read file and merge HR data
@@ -223,7 +473,10 @@ async def merge_hr_csv_into_activity(
             options=options,
         )
 
-        # Save new activity (original activity remains unchanged)
+        # Save as an overlay of the original activity (only the merged HR column is written)
+        device_name = new_activity.merge_provenance.sources[0].device_name
+        new_activity.base_id = activity_id
+        new_activity.overlay_fields = [IQ_COLUMN_PREFIX + imported_hr_key(device_name)]
         data_store.save_activity(new_activity)
         
         return {
@@ -238,48 +491,86 @@ async def merge_hr_csv_into_activity(
         raise HTTPException(status_code=400, detail=f"合并离线心率CSV失败: {str(e)}")
 
 
+def _compare_points_from_lod(lod: dict, request: CompareRequest) -> List[dict]:
+    """将包络数据转换为对比数据点（X轴与字段值均取桶均值）"""
+    series = lod["series"]
+    if request.align_by == "distance":
+        distances = series.get("distance", {}).get("mean") or [None] * lod["points"]
+        xs = [d / 1000 if d else 0 for d in distances]  # km
+    else:
+        xs = [t or 0 for t in lod["x"]]  # 秒
+    
+    points = []
+    for i, x in enumerate(xs):
+        point = {"x": x}
+        for field in request.fields:
+            values = series.get(field, {}).get("mean")
+            point[field] = values[i] if values else None
+        points.append(point)
+    return points
+
+
+def _compare_points_from_table(table: dict, request: CompareRequest) -> List[dict]:
+    """将按列读取的记录转换为对比数据点"""
+    columns = dict(table["columns"])
+    columns.update(("iq_" + key, values) for key, values in zip(table["iq_schema"], table["iq_columns"]))
+    missing = [None] * table["count"]
+    if request.align_by == "distance":
+        xs = [d / 1000 if d else 0 for d in columns.get("distance", missing)]  # km
+    else:
+        xs = [t or 0 for t in columns.get("elapsed_time", missing)]  # 秒
+    
+    series = [(field, columns.get(field, missing)) for field in request.fields]
+    return [{"x": x, **{field: values[i] for field, values in series}} for i, x in enumerate(xs)]
+
+
 @app.post("/api/compare", response_model=CompareResponse)
 async def compare_activities(request: CompareRequest):
     """多活动对比"""
-    activities = data_store.get_activities_for_compare(request.activity_ids)
+    x_field = "distance" if request.align_by == "distance" else "elapsed_time"
+    x_label = "距离 (km)" if request.align_by == "distance" else "时间 (秒)"
     
-    if not activities:
-        raise HTTPException(status_code=404, detail="未找到活动")
+    # 指定了最大点数时使用预计算的多分辨率包络（每个桶取均值）
+    if request.max_points:
+        result_activities = []
+        for activity_id in request.activity_ids:
+            meta = data_store.get_activity_meta(activity_id)
+            lod = data_store.get_activity_lod(activity_id, [x_field] + list(request.fields), request.max_points)
+            if meta is None or lod is None:
+                continue
+            result_activities.append(CompareActivityData(
+                id=meta.id,
+                name=meta.name,
+                date=meta.date,
+                data=_compare_points_from_lod(lod, request)
+            ))
+        
+        if not result_activities:
+            raise HTTPException(status_code=404, detail="未找到活动")
+        
+        return CompareResponse(
+            activities=result_activities,
+            align_by=request.align_by,
+            x_label=x_label,
+            fields=request.fields
+        )
     
+    # 只按列读取X轴和请求的字段，不构造逐条记录
     result_activities = []
-    
-    for activity in activities:
-        # 提取对比数据
-        data = []
-        for record in activity.records:
-            point = {}
-            
-            # X轴值
-            if request.align_by == "distance":
-                point["x"] = record.distance / 1000 if record.distance else 0  # km
-            else:
-                point["x"] = record.elapsed_time or 0  # 秒
-            
-            # 请求的字段
-            for field in request.fields:
-                if field.startswith("iq_"):
-                    # IQ字段
-                    iq_key = field[3:]  # 去掉 "iq_" 前缀
-                    point[field] = record.iq_fields.get(iq_key)
-                else:
-                    # 标准字段
-                    point[field] = getattr(record, field, None)
-            
-            data.append(point)
-        
+    for activity_id in request.activity_ids:
+        meta = data_store.get_activity_meta(activity_id)
+        table = data_store.get_record_table(activity_id, [x_field] + list(request.fields))
+        if meta is None or table is None:
+            continue
         result_activities.append(CompareActivityData(
-            id=activity.id,
-            name=activity.name,
-            date=activity.session.start_time,
-            data=data
+            id=meta.id,
+            name=meta.name,
+            date=meta.date,
+            data=_compare_points_from_table(table, request)
         ))
     
-    x_label = "距离 (km)" if request.align_by == "distance" else "时间 (秒)"
+    if not result_activities:
+        raise HTTPException(status_code=404, detail="未找到活动")
     
     return CompareResponse(
         activities=result_activities,
@@ -294,10 +585,13 @@ async def export_activity(
     activity_id: str,
     mode: str = Query("merged", description="导出模式: merged 或 categorized"),
     fields: Optional[str] = Query(None, description="字段列表，逗号分隔"),
-    data_type: str = Query("records", description="数据类型: records 或 laps")
+    data_type: str = Query("records", description="数据类型: records 或 laps"),
+    start: Optional[float] = Query(None, description="只导出范围内的记录：下限（秒或米，见 range_by）"),
+    end: Optional[float] = Query(None, description="只导出范围内的记录：上限"),
+    range_by: str = Query("elapsed_time", pattern=RANGE_BY_PATTERN, description="范围字段 elapsed_time/distance")
 ):
-    """导出活动数据为CSV"""
-    activity = data_store.get_activity(activity_id)
+    """导出活动数据为CSV（可只导出某个时间/距离范围内的记录）"""
+    activity = data_store.get_activity(activity_id, record_range=_record_range(range_by, start, end))
     if not activity:
         raise HTTPException(status_code=404, detail="活动不存在")
     
@@ -355,6 +649,42 @@ async def get_statistics():
     return stats
 
 
+@app.get("/api/statistics/rollup")
+async def get_statistics_rollup(
+    period: str = Query("week", pattern="^(day|week|month)$", description="统计周期 day/week/month"),
+    date_from: Optional[str] = Query(None, description="开始日期 YYYY-MM-DD"),
+    date_to: Optional[str] = Query(None, description="结束日期 YYYY-MM-DD"),
+    sport: Optional[str] = Query(None, description="运动类型"),
+    by_sport: bool = Query(False, description="是否按运动类型拆分每个周期")
+):
+    """
+    按日/ISO周/月汇总的训练量统计
+    
+    Returns:
+        {
+            "period": "week",
+            "buckets": [
+                {"key": "2025-W22", "start": "2025-05-26", "count": 4, "distance_km": 42.5,
+                 "duration_sec": 14400.0, "total_ascent": 310.0, "avg_heart_rate": 148}
+            ],
+            "totals": {...}
+        }
+    """
+    try:
+        filter_date_from = datetime.strptime(date_from, "%Y-%m-%d") if date_from else None
+        filter_date_to = datetime.strptime(date_to, "%Y-%m-%d") if date_to else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日期格式应为 YYYY-MM-DD")
+    
+    return data_store.get_statistics_rollup(
+        period=period,
+        date_from=filter_date_from,
+        date_to=filter_date_to,
+        sport=sport,
+        by_sport=by_sport
+    )
+
+
 @app.get("/api/device-mappings")
 async def get_device_mappings():
     """
@@ -385,13 +715,190 @@ async def get_device_mappings():
     return DeviceRegistry.get_all_devices_config()
 
 
+@app.get("/api/storage/migration")
+async def get_migration_status():
+    """
+    获取存储格式迁移进度
+    
+    Returns:
+        {
+            "state": "running",      # idle | running | done | stopped
+            "target_version": 3,
+            "total": 120,
+            "migrated": 45,
+            "skipped": 0,
+            "failed": [],
+            "current": "activity_id",
+            "pending": 75            # 磁盘上仍为旧格式的活动数（由迁移进度计算；查找完成前为null）
+        }
+    """
+    return data_store.migration_status()
+
+
+@app.post("/api/storage/migration")
+async def start_migration():
+    """手动启动存储格式迁移（已在运行时返回当前进度）"""
+    return data_store.start_migration()
+
+
+@app.get("/api/storage/write_behind")
+async def get_write_behind_status():
+    """
+    获取写回队列状态
+    
+    Returns:
+        {
+            "enabled": true,         # config.STORE_WRITE_BEHIND
+            "pending": 0,            # 等待写入的活动数
+            "writing": 1,            # 正在写入的活动数
+            "written": 12,
+            "commits": 9,            # 索引日志提交次数（多个活动合并提交）
+            "failed": 0,             # 写入失败次数（含重试）
+            "abandoned": 0,          # 多次写入失败后放弃的活动数
+            "abandoned_ids": [],
+            "last_error": null,
+            "last_commit_at": "..."
+        }
+    """
+    return data_store.write_behind_status()
+
+
+@app.get("/api/storage/cache")
+async def get_record_cache_status():
+    """
+    获取记录缓存状态
+    
+    Returns:
+        {
+            "enabled": true,         # config.STORE_RECORD_CACHE_MB > 0
+            "activities": 35,        # 已缓存的活动数
+            "bytes": 9437184,
+            "max_bytes": 134217728,
+            "hits": 120,
+            "misses": 35,
+            "dtypes": {"B": 40, "h": 60, "i": 50, "q": 35}   # 各紧凑类型的列数
+        }
+    """
+    return data_store.record_cache_status()
+
+
+@app.get("/api/storage/tiers")
+async def get_storage_tiers():
+    """
+    获取热/冷存储的活动数与占用空间
+    
+    Returns:
+        {"hot": {"count": 120, "bytes": 52428800}, "cold": {"count": 800, "bytes": 41943040}}
+    """
+    return data_store.storage_tiers()
+
+
+@app.post("/api/storage/tiers")
+def apply_storage_tiering(
+    cold_after_days: Optional[int] = Query(None, ge=0, description="活动日期与最近访问都早于该天数时归档，默认使用配置值")
+):
+    """立即执行一次冷存储归档（同步函数，在线程池中执行）"""
+    if cold_after_days is None:
+        cold_after_days = getattr(app_config, "STORE_COLD_AFTER_DAYS", None)
+    return data_store.apply_tiering(cold_after_days)
+
+
+@app.get("/api/storage/snapshot")
+def download_snapshot(compress: bool = Query(True, description="是否gzip压缩")):
+    """
+    下载整个数据目录的快照（边生成边传输，不阻塞其他读写）
+    
+    恢复使用命令行: python backend/store_cli.py restore <快照文件>
+    """
+    suffix = "tar.gz" if compress else "tar"
+    filename = f"fitanalysis-snapshot-{datetime.now():%Y%m%d-%H%M%S}.{suffix}"
+    return StreamingResponse(
+        iter_snapshot(data_store, compress),
+        media_type="application/gzip" if compress else "application/x-tar",
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}"
+        }
+    )
+
+
+@app.get("/api/storage/integrity")
+async def get_integrity_status():
+    """
+    获取后台完整性检查的进度与报告
+    
+    Returns:
+        {
+            "state": "done",         # idle | running | done | stopped | failed
+            "repair": false,
+            "report": {"scanned": 120, "ok": 118, "orphans": [...], "dangling": [...],
+                       "corrupt": [...], "partial": [...], "duplicates": [...], "missing_base": [...], ...}
+        }
+    """
+    if integrity_job is None:
+        return {"state": "idle"}
+    return integrity_job.status()
+
+
+@app.post("/api/storage/integrity")
+async def start_integrity_check(repair: bool = Query(False, description="是否修复发现的问题")):
+    """在后台低优先级地检查索引与活动文件是否一致（已在运行时返回当前进度）"""
+    global integrity_job
+    if integrity_job is None or not integrity_job.is_running():
+        integrity_job = IntegrityJob(data_store, repair=repair)
+        integrity_job.start()
+    return integrity_job.status()
+
+
+def _start_reprocess(activity_ids: List[str]) -> ReprocessJob:
+    global reprocess_job
+    reprocess_job = ReprocessJob(
+        data_store, activity_ids, workers=getattr(app_config, "STORE_REPROCESS_WORKERS", 1)
+    )
+    reprocess_job.start()
+    return reprocess_job
+
+
+@app.get("/api/storage/reprocess")
+async def get_reprocess_status():
+    """
+    获取后台重新解析的进度
+    
+    Returns:
+        {
+            "state": "running",      # idle | running | done | stopped
+            "parser_version": "1-3f2a...",
+            "total": 120, "processed": 45, "reprocessed": 44, "skipped": 0,
+            "failed": [{"id": "...", "error": "..."}]
+        }
+    """
+    if reprocess_job is None:
+        return {"state": "idle", "parser_version": parser_fingerprint()}
+    return reprocess_job.status()
+
+
+@app.post("/api/storage/reprocess")
+async def start_reprocess(request: ReprocessRequest):
+    """用存档的原始FIT文件和当前解析器重新解析活动（已在运行时返回当前进度）"""
+    if reprocess_job is not None and reprocess_job.is_running():
+        return reprocess_job.status()
+    return _start_reprocess(find_reprocess_candidates(data_store, request.activity_ids, request.force)).status()
+
+
+@app.post("/api/storage/flush")
+def flush_storage(timeout: Optional[float] = Query(None, ge=0, description="最长等待秒数")):
+    """等待已保存的活动全部写入磁盘（同步函数，在线程池中等待，不阻塞事件循环）"""
+    flushed = data_store.flush(timeout)
+    return {"flushed": flushed, **data_store.write_behind_status()}
+
+
 @app.delete("/api/activities/all")
 async def delete_all_activities():
     """
     删除所有活动数据 (v1.8.0+)
     
     警告: 此操作不可逆！将删除data/activities/目录下的所有JSON文件和data/index.json。
-    用于v1.8.0升级时清理旧数据，要求用户重新上传FIT文件以使用新的字段映射。
+    用于v1.8.0升级时清理旧数据。之后的存储格式与字段映射升级由后台迁移自动完成
+    （见 /api/storage/migration），无需清空后重新上传。
     
     Returns:
         {
@@ -407,6 +914,8 @@ async def delete_all_activities():
             "deleted_count": deleted_count,
             "message": f"成功删除{deleted_count}个活动"
         }
+    except TimeoutError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"删除失败: {str(e)}")
 
@@ -452,7 +961,6 @@ async def index():
 if __name__ == "__main__":
     import uvicorn
     import webbrowser
-    import threading
     import os
     
     # Import config from parent directory
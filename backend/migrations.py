@@ -0,0 +1,221 @@
+"""
+FIT跑步数据分析器 - 活动存储格式迁移
+每个活动头部记录 schema_version；读取时兼容所有旧版本（双读），
+后台线程按节流速度逐个把旧活动重写为最新格式，不阻塞API。
+
+新增迁移步骤：
+- 只改变磁盘布局时，登记一个不带 iq_renames 的 Migration 即可，
+  重写时总是按最新布局写入
+- 解析器字段映射变化（如IQ字段改名）时，在 iq_renames 中登记 {旧名: 新名}，
+  读取旧活动时会在内存中改名，后台迁移时持久化
+"""
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from column_store import IQ_COLUMN_PREFIX
+
+
+@dataclass
+class Migration:
+    """从 from_version 升级到 from_version + 1 的迁移步骤"""
+    from_version: int
+    description: str
+    iq_renames: Dict[str, str] = field(default_factory=dict)  # IQ字段改名 {旧名: 新名}
+
+
+# 迁移步骤，按版本顺序排列
+MIGRATIONS: List[Migration] = [
+    Migration(1, "records 从活动JSON拆分为列式 .rec 文件"),
+    Migration(2, "预计算多分辨率包络 .lod 文件"),
+    Migration(3, "活动文件按日期分片存放到 activities/YYYY/MM/"),
+    Migration(4, "记录文件按10分钟时间块分块，每块带字段最小/最大值（zone map）"),
+    Migration(5, "列数据按特征使用 delta/时间戳/字典编码"),
+]
+
+# 最新的活动文件格式版本
+# 1: <id>.json 包含完整的 records 列表
+# 2: <id>.json 只包含活动头部，records 以列式存储在 <id>.rec
+# 3: 额外保证存在多分辨率包络 <id>.lod
+# 4: 文件按活动日期存放在 activities/YYYY/MM/ 分片目录中
+# 5: <id>.rec 按时间分块存储，支持只读取某个时间/距离范围
+# 6: 列式文件中的列块经过编码（column_codecs），体积更小
+ACTIVITY_SCHEMA_VERSION = MIGRATIONS[-1].from_version + 1
+
+
+def pending_migrations(version: int) -> List[Migration]:
+    """某个版本升级到最新版本需要执行的迁移步骤"""
+    return [m for m in MIGRATIONS if m.from_version >= version]
+
+
+def stored_column_names(version: int, names: List[str]) -> List[str]:
+    """
+    将请求的列名（最新版本的命名）映射回旧版本文件中的列名
+
+    用于只读取部分字段时定位旧文件中改名前的列。
+    """
+    result = []
+    for name in names:
+        for migration in reversed(pending_migrations(version)):
+            for old, new in migration.iq_renames.items():
+                if name == IQ_COLUMN_PREFIX + new:
+                    name = IQ_COLUMN_PREFIX + old
+                    break
+        result.append(name)
+    return result
+
+
+def _rename_keys(values: Dict[str, Any], renames: Dict[str, str], prefix: str = "") -> Dict[str, Any]:
+    """按改名表重命名字典的键（保持原有顺序）"""
+    return {
+        (prefix + renames[key[len(prefix):]] if key.startswith(prefix) and key[len(prefix):] in renames else key): value
+        for key, value in values.items()
+    }
+
+
+def upgrade_activity_data(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    在内存中把活动数据升级到最新版本
+
+    Args:
+        data: 活动头部dict，可带 "columns"（列字典）；缺少 schema_version 视为版本1
+
+    Returns:
+        升级后的同一个dict，schema_version 为最新版本
+    """
+    for migration in pending_migrations(data.get('schema_version', 1)):
+        renames = migration.iq_renames
+        if not renames:
+            continue
+        if 'columns' in data:
+            data['columns'] = _rename_keys(data['columns'], renames, IQ_COLUMN_PREFIX)
+        data['available_iq_fields'] = list(dict.fromkeys(
+            renames.get(name, name) for name in data.get('available_iq_fields', [])
+        ))
+        for summary in [data.get('session') or {}] + list(data.get('laps') or []):
+            if summary.get('iq_fields'):
+                summary['iq_fields'] = _rename_keys(summary['iq_fields'], renames)
+
+    data['schema_version'] = ACTIVITY_SCHEMA_VERSION
+    return data
+
+
+class MigrationWorker:
+    """
+    后台迁移线程
+
+    逐个调用 store.stage_migration() 在锁外读取并写好新文件，每 BATCH_SIZE 个活动调用一次
+    store.commit_staged()（短暂持有索引锁，只做rename和一次索引日志提交），
+    每批之后休眠 throttle_sec，避免长时间占用磁盘。进度通过 status() 获取。
+    未指定 activity_ids 时在线程中调用 store.find_outdated_activities() 查找（读取每个活动的头部），
+    不阻塞调用方；查找完成前 total 为None。
+    """
+
+    # 每批迁移的活动数（合并为一次索引日志提交）
+    BATCH_SIZE = 16
+
+    def __init__(self, store, activity_ids: Optional[List[str]] = None, throttle_sec: float = 0.05):
+        self.store = store
+        self.activity_ids = list(activity_ids) if activity_ids is not None else None
+        self.throttle_sec = throttle_sec
+        self._stop = threading.Event()
+        self._status_lock = threading.Lock()
+        self._status: Dict[str, Any] = {
+            "state": "pending",  # pending | running | done | stopped
+            "target_version": ACTIVITY_SCHEMA_VERSION,
+            "total": len(self.activity_ids) if self.activity_ids is not None else None,
+            "migrated": 0,
+            "skipped": 0,
+            "failed": [],
+            "current": None,
+            "started_at": None,
+            "finished_at": None,
+        }
+        self._thread = threading.Thread(target=self._run, name="activity-migration", daemon=True)
+
+    def start(self):
+        self._update(state="running", started_at=datetime.now().isoformat())
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """请求停止并等待当前活动处理完"""
+        self._stop.set()
+        self.join(timeout)
+
+    def join(self, timeout: Optional[float] = None):
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def is_running(self) -> bool:
+        return self._thread.is_alive()
+
+    def status(self) -> Dict[str, Any]:
+        """进度；pending 为磁盘上仍为旧格式的活动数（由查找结果和进度计算，不重新扫描）"""
+        with self._status_lock:
+            status = dict(self._status)
+            status["failed"] = list(status["failed"])
+        total = status["total"]
+        status["pending"] = total - status["migrated"] - status["skipped"] if total is not None else None
+        return status
+
+    def _update(self, **changes):
+        with self._status_lock:
+            self._status.update(changes)
+
+    def _run(self):
+        if self.activity_ids is None:
+            try:
+                self.activity_ids = self.store.find_outdated_activities()
+            except Exception as e:
+                print(f"警告: 查找需要迁移的活动失败: {e}")
+                self.activity_ids = []
+            self._update(total=len(self.activity_ids))
+        for start in range(0, len(self.activity_ids), self.BATCH_SIZE):
+            if self._stop.is_set():
+                self._update(state="stopped", current=None, finished_at=datetime.now().isoformat())
+                return
+            staged = []
+            for activity_id in self.activity_ids[start:start + self.BATCH_SIZE]:
+                if self._stop.is_set():
+                    break
+                staged.extend(self._stage(activity_id))
+            self._commit(staged)
+            if self.throttle_sec > 0:
+                self._stop.wait(self.throttle_sec)
+
+        self._update(state="done", current=None, finished_at=datetime.now().isoformat())
+
+    def _stage(self, activity_id: str) -> List[Any]:
+        """在锁外准备迁移单个活动，返回待提交的活动（不需要迁移或失败时为空）"""
+        self._update(current=activity_id)
+        try:
+            staged = self.store.stage_migration(activity_id)
+        except Exception as e:
+            self._fail(activity_id, e)
+            return []
+        if staged is None:
+            with self._status_lock:
+                self._status["skipped"] += 1
+            return []
+        return [staged]
+
+    def _commit(self, staged: List[Any]):
+        """一次提交一批已准备好的活动（期间被修改的活动计为跳过）"""
+        if not staged:
+            return
+        try:
+            results = self.store.commit_staged(staged)
+        except Exception as e:
+            for item in staged:
+                item.discard()
+                self._fail(item.meta.id, e)
+            return
+        with self._status_lock:
+            for migrated in results:
+                self._status["migrated" if migrated else "skipped"] += 1
+
+    def _fail(self, activity_id: str, error: Exception):
+        print(f"警告: 迁移活动失败 {activity_id}: {error}")
+        with self._status_lock:
+            self._status["failed"].append({"id": activity_id, "error": str(error)})
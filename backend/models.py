@@ -135,6 +135,12 @@ class Activity(BaseModel):
     available_fields: List[str] = Field(default_factory=list)
     available_iq_fields: List[str] = Field(default_factory=list)
     merge_provenance: Optional[MergeProvenance] = None
+    notes: Optional[str] = None  # 用户备注
+    tags: List[str] = Field(default_factory=list)  # 用户标签
+    raw_sha256: Optional[str] = None  # 原始FIT文件（raw_store）的SHA-256
+    parser_version: Optional[str] = None  # 解析时的解析器版本（fit_parser.parser_fingerprint）
+    base_id: Optional[str] = None  # 合并活动（覆盖层）引用的基础活动ID，其余记录列读取时从基础活动取得
+    overlay_fields: List[str] = Field(default_factory=list)  # 覆盖层自己保存的记录列（列名同列式存储，如 iq_imported_polar_h10_hr）
 
 
 class ActivityMeta(BaseModel):
@@ -152,6 +158,15 @@ class ActivityMeta(BaseModel):
     total_ascent: Optional[float] = None
     available_fields: List[str] = Field(default_factory=list)
     available_iq_fields: List[str] = Field(default_factory=list)
+    file_name: Optional[str] = None
+    devices: List[str] = Field(default_factory=list)  # 设备名（IQ字段来源设备、合并的心率设备）
+    notes: Optional[str] = None  # 用户备注
+    tags: List[str] = Field(default_factory=list)  # 用户标签
+    tier: str = "hot"  # 存储层级: hot（直接读取）/ cold（压缩归档，访问时解压）
+    last_accessed: Optional[datetime] = None  # 最近一次读取活动详情的时间
+    raw_sha256: Optional[str] = None  # 原始FIT文件的SHA-256（没有存档时为空）
+    parser_version: Optional[str] = None  # 解析器版本，与当前版本不同时可重新解析
+    base_id: Optional[str] = None  # 合并活动（覆盖层）引用的基础活动ID
 
 
 class ActivityIndex(BaseModel):
@@ -183,6 +198,7 @@ class CompareRequest(BaseModel):
     activity_ids: List[str]
     fields: List[str]
     align_by: str = "time"  # "time" 或 "distance"
+    max_points: Optional[int] = Field(None, ge=10)  # 指定时按多分辨率包络降采样
 
 
 class CompareActivityData(BaseModel):
@@ -201,6 +217,60 @@ class CompareResponse(BaseModel):
     fields: List[str]
 
 
+class BatchDeleteRequest(BaseModel):
+    """批量删除请求"""
+    activity_ids: List[str]
+
+
+class ActivityMetadataPatch(BaseModel):
+    """单个活动的元数据修改（未提供的字段保持不变）"""
+    name: Optional[str] = Field(None, min_length=1)
+    sport: Optional[str] = Field(None, min_length=1)
+    notes: Optional[str] = None
+    tags: Optional[List[str]] = None
+    merge_provenance: Optional[MergeProvenance] = None
+
+
+class ActivityMetadataUpdate(ActivityMetadataPatch):
+    """批量修改中的单个活动"""
+    id: str
+
+
+class BatchUpdateRequest(BaseModel):
+    """批量元数据更新请求"""
+    updates: List[ActivityMetadataUpdate]
+
+
+class FieldUnionRequest(BaseModel):
+    """字段并集请求"""
+    activity_ids: List[str]
+
+
+class LapRange(BaseModel):
+    """圈查询的字段范围（包含边界，未提供表示不限）"""
+    min: Optional[float] = None
+    max: Optional[float] = None
+
+
+class LapQueryRequest(BaseModel):
+    """跨活动圈查询请求"""
+    ranges: Dict[str, LapRange] = Field(default_factory=dict)  # 字段 -> 范围，如 {"total_distance": {"min": 950, "max": 1050}}
+    sport: Optional[str] = None
+    date_from: Optional[str] = None  # YYYY-MM-DD
+    date_to: Optional[str] = None  # YYYY-MM-DD
+    activity_ids: Optional[List[str]] = None
+    sort_by: Optional[str] = None
+    order: str = Field("asc", pattern="^(asc|desc)$")
+    page: int = Field(1, ge=1)
+    limit: int = Field(50, ge=1, le=500)
+
+
+class ReprocessRequest(BaseModel):
+    """重新解析请求"""
+    activity_ids: Optional[List[str]] = None  # 为空时为所有有原始文件的活动
+    force: bool = False  # 是否包含已是当前解析器版本的活动
+
+
 class ExportRequest(BaseModel):
     """导出请求参数"""
     mode: str = "merged"  # "merged" 或 "categorized"
@@ -0,0 +1,69 @@
+"""
+FIT跑步数据分析器 - 原始FIT文件存档
+上传的FIT文件按内容寻址保存，解析器或字段映射更新后可以直接重新解析，无需重新上传。
+
+目录布局:
+    raw/<sha256前2位>/<sha256>.fit
+
+- 文件名即内容的SHA-256，相同内容只保存一份（重复上传、HR合并副本共用同一个文件）
+- 写入为原子写入，已存在的文件不再重写（只更新修改时间，避免被完整性检查当作刚失去引用的文件）
+- 活动头部的 raw_sha256 指向对应的文件；删除活动不删除原始文件，
+  不再被任何活动引用的文件由完整性检查（integrity.py）移入隔离目录
+"""
+import hashlib
+import os
+from pathlib import Path
+from typing import Iterator, Optional
+
+from store_io import atomic_write_bytes
+
+
+RAW_DIR_NAME = "raw"
+RAW_SUFFIX = ".fit"
+
+
+def content_hash(data: bytes) -> str:
+    """内容的SHA-256（十六进制）"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class RawStore:
+    """按内容寻址的原始FIT文件存档"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def path(self, sha256: str) -> Path:
+        return self.root / sha256[:2] / f"{sha256}{RAW_SUFFIX}"
+
+    def put(self, data: bytes) -> str:
+        """保存原始文件，返回其SHA-256"""
+        sha256 = content_hash(data)
+        path = self.path(sha256)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write_bytes(path, data)
+        return sha256
+
+    def get(self, sha256: str) -> Optional[bytes]:
+        """
+        读取原始文件，不存在或内容与哈希不符时返回None
+        """
+        try:
+            data = self.path(sha256).read_bytes()
+        except FileNotFoundError:
+            return None
+        if content_hash(data) != sha256:
+            print(f"警告: 原始文件内容与哈希不符: {sha256}")
+            return None
+        return data
+
+    def exists(self, sha256: str) -> bool:
+        return self.path(sha256).exists()
+
+    def iter_files(self) -> Iterator[Path]:
+        """存档中的所有原始文件（文件名去掉后缀即SHA-256）"""
+        if self.root.exists():
+            yield from self.root.glob(f"*/*{RAW_SUFFIX}")
@@ -0,0 +1,309 @@
+"""
+FIT跑步数据分析器 - 记录数据缓存
+最近读取的活动记录列以紧凑类型保存在内存中（array，每个值1~8字节），
+而不是Python对象列表（每个float约32字节），读取时再转换为显示单位的Python值。
+
+类型策略（所有转换都是无损的：打包后逐值校验，不能精确还原的列退回更宽的类型）:
+    整数字段（heart_rate、cadence、power、temperature、IQ整数字段等）
+        能容纳取值范围的最小整数类型 int8/uint8/int16/uint16/int32/int64
+    position_lat / position_long
+        int32 semicircles（FIT原始单位，1 semicircle ≈ 8.4e-8°，约9mm）；
+        解析器由 semicircles 换算得到的经纬度可以精确还原，读取时再换算为度
+    其他浮点字段（distance、speed、altitude、dr_ 等IQ字段）
+        按最少的小数位数（最多6位）放大为整数后同整数字段，读取时除以 10^k；
+        设备精度通常为0.1~0.001，放大后多为 int16/int32；不能精确放大时为 float64
+    timestamp
+        相对首条记录的微秒数（int64），读取时格式化为ISO字符串
+    其他（字符串、布尔、混合类型）
+        原样保存列表
+空值位置单独保存（array 'I'）。
+
+缓存按 .rec 文件路径索引，以文件的 (inode, 修改时间, 大小) 判断是否过期，
+其他进程重写活动后自动失效；总大小超过上限时淘汰最久未使用的活动。
+"""
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from column_codecs import float_scale, restore_nulls, split_nulls
+from column_store import read_column_pack
+
+
+SEMICIRCLE_FIELDS = frozenset({"position_lat", "position_long"})
+SEMICIRCLE_DEGREES = 180.0 / (2 ** 31)
+
+# (类型码, 最小值, 最大值)，按每个值的字节数从小到大
+_INT_TYPES = (
+    ("b", -2 ** 7, 2 ** 7 - 1),
+    ("B", 0, 2 ** 8 - 1),
+    ("h", -2 ** 15, 2 ** 15 - 1),
+    ("H", 0, 2 ** 16 - 1),
+    ("i", -2 ** 31, 2 ** 31 - 1),
+    ("q", -2 ** 63, 2 ** 63 - 1),
+)
+# 无法用 array 保存的列表按每个元素的大致占用估算（指针 + 对象）
+_LIST_ITEM_BYTES = 64
+
+
+def _int_array(values: List[int]) -> Optional[array]:
+    """放进能容纳取值范围的最小整数类型"""
+    low, high = min(values), max(values)
+    for typecode, type_min, type_max in _INT_TYPES:
+        if type_min <= low and high <= type_max:
+            return array(typecode, values)
+    return None
+
+
+class CompactColumn:
+    """
+    一列记录数据的紧凑表示
+
+    kind:
+        int         整数
+        scaled      浮点数 = 整数 / scale
+        semicircle  经纬度 = 整数 * SEMICIRCLE_DEGREES
+        float       float64
+        timestamp   ISO字符串 = base + 微秒数（zulu 为True时以Z结尾）
+        list        原样保存
+    """
+    __slots__ = ("kind", "values", "nulls", "scale", "base", "zulu")
+
+    def __init__(self, kind: str, values: Union[array, List[Any]], nulls: List[int],
+                 scale: int = 1, base: Optional[datetime] = None, zulu: bool = False):
+        self.kind = kind
+        self.values = values
+        self.nulls = array("I", nulls)
+        self.scale = scale
+        self.base = base
+        self.zulu = zulu
+
+    @property
+    def typecode(self) -> Optional[str]:
+        return self.values.typecode if isinstance(self.values, array) else None
+
+    def nbytes(self) -> int:
+        """占用内存的估算值"""
+        if isinstance(self.values, array):
+            size = self.values.itemsize * len(self.values)
+        else:
+            size = sys.getsizeof(self.values) + _LIST_ITEM_BYTES * len(self.values)
+        return size + self.nulls.itemsize * len(self.nulls)
+
+    def to_list(self) -> List[Any]:
+        """转换为显示单位的Python值列表"""
+        if self.kind == "list":
+            return list(self.values)
+        values = self.values.tolist()
+        if self.kind == "scaled":
+            scale = self.scale
+            values = [v / scale for v in values]
+        elif self.kind == "semicircle":
+            values = [v * SEMICIRCLE_DEGREES for v in values]
+        elif self.kind == "timestamp":
+            base, suffix = self.base, "Z" if self.zulu else ""
+            values = [(base + timedelta(microseconds=us)).isoformat() + suffix for us in values]
+        return restore_nulls(values, self.nulls.tolist())
+
+
+def _pack(name: str, values: List[Any]) -> CompactColumn:
+    nulls, present = split_nulls(values)
+    if not present:
+        return CompactColumn("list", list(values), [])
+    kinds = {type(v) for v in present}
+
+    if kinds == {int}:
+        packed = _int_array(present)
+        if packed is not None:
+            return CompactColumn("int", packed, nulls)
+    elif kinds == {float}:
+        if name in SEMICIRCLE_FIELDS:
+            semicircles = [round(v / SEMICIRCLE_DEGREES) for v in present]
+            packed = _int_array(semicircles)
+            if packed is not None and packed.typecode in "bBhHi":
+                return CompactColumn("semicircle", packed, nulls)
+        scale = float_scale(present)
+        if scale is not None:
+            packed = _int_array([round(v * scale) for v in present])
+            if packed is not None:
+                return CompactColumn("scaled", packed, nulls, scale=scale)
+        return CompactColumn("float", array("d", present), nulls)
+    elif kinds == {str}:
+        zulu = present[0].endswith("Z")
+        try:
+            parsed = [datetime.fromisoformat(v[:-1] if zulu else v) for v in present]
+            base = parsed[0]
+            offsets = array("q", [(t - base) // timedelta(microseconds=1) for t in parsed])
+            return CompactColumn("timestamp", offsets, nulls, base=base, zulu=zulu)
+        except (ValueError, TypeError, OverflowError):
+            pass
+    return CompactColumn("list", list(values), [])
+
+
+def pack_column(name: str, values: List[Any]) -> CompactColumn:
+    """
+    按类型策略打包一列
+
+    打包结果逐值（含类型）校验，不能精确还原时原样保存列表。
+    """
+    column = _pack(name, values)
+    if column.kind != "list":
+        restored = column.to_list()
+        if restored != values or any(type(a) is not type(b) for a, b in zip(restored, values)):
+            column = CompactColumn("list", list(values), [])
+    return column
+
+
+class _Entry:
+    __slots__ = ("signature", "count", "columns", "absent", "complete", "nbytes")
+
+    def __init__(self, signature: Tuple[int, int, int], count: int):
+        self.signature = signature
+        self.count = count
+        self.columns: Dict[str, CompactColumn] = {}
+        self.absent: set = set()  # 已确认文件中不存在的列
+        self.complete = False     # 已加载文件中的全部列
+        self.nbytes = 0
+
+
+class RecordCache:
+    """
+    活动记录列的LRU缓存
+
+    线程安全；读取文件与打包在锁外进行。
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _signature(path: Path) -> Tuple[int, int, int]:
+        stat = path.stat()
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def read(
+        self,
+        path: Path,
+        names: Optional[List[str]] = None,
+        load: bool = True
+    ) -> Optional[Tuple[int, Dict[str, List[Any]]]]:
+        """
+        读取列式记录文件中的列（同 read_column_pack），命中时不读取文件
+
+        Args:
+            path: .rec 文件路径
+            names: 需要读取的列名，None表示全部
+            load: 未完全命中时是否读取文件并加入缓存；False时返回None
+
+        Returns:
+            (记录数, {列名: 值列表})
+        """
+        key = str(path)
+        signature = self._signature(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.signature != signature:
+                self._drop(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                missing = self._missing(entry, names)
+            else:
+                missing = None if names is None else list(names)
+            hit = entry is not None and missing == []
+            if hit:
+                self._hits += 1
+            elif load:
+                self._misses += 1
+            if hit:
+                return entry.count, self._decode(entry, names)
+        if not load:
+            return None
+
+        count, columns = read_column_pack(path, missing)
+        packed = {name: pack_column(name, values) for name, values in columns.items()}
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.signature != signature:
+                if entry is not None:
+                    self._drop(key)
+                entry = self._entries[key] = _Entry(signature, count)
+            for name, column in packed.items():
+                if name not in entry.columns:
+                    entry.columns[name] = column
+                    size = column.nbytes()
+                    entry.nbytes += size
+                    self._bytes += size
+            if missing is None:
+                entry.complete = True
+            else:
+                entry.absent.update(name for name in missing if name not in columns)
+            self._evict(keep=key)
+        # 刚读出的列直接返回，不再从紧凑类型转换
+        if names is None:
+            return count, columns
+        result = {}
+        for name in names:
+            if name in columns:
+                result[name] = columns[name]
+            elif name in entry.columns:
+                result[name] = entry.columns[name].to_list()
+        return count, result
+
+    @staticmethod
+    def _missing(entry: _Entry, names: Optional[List[str]]) -> Optional[List[str]]:
+        """尚未缓存的列；names为None且未完整加载时返回None（需要读取全部）"""
+        if names is None:
+            return [] if entry.complete else None
+        if entry.complete:
+            return []
+        return [n for n in names if n not in entry.columns and n not in entry.absent]
+
+    @staticmethod
+    def _decode(entry: _Entry, names: Optional[List[str]]) -> Dict[str, List[Any]]:
+        wanted = entry.columns.keys() if names is None else [n for n in names if n in entry.columns]
+        return {name: entry.columns[name].to_list() for name in wanted}
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.nbytes
+
+    def _evict(self, keep: str):
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            if oldest == keep:
+                break
+            self._drop(oldest)
+        if self._bytes > self.max_bytes and keep in self._entries:
+            # 单个活动超过上限时不缓存
+            self._drop(keep)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def status(self) -> Dict[str, Any]:
+        """{"activities", "bytes", "max_bytes", "hits", "misses", "dtypes": {类型: 列数}}"""
+        with self._lock:
+            dtypes: Dict[str, int] = {}
+            for entry in self._entries.values():
+                for column in entry.columns.values():
+                    label = column.typecode or column.kind
+                    dtypes[label] = dtypes.get(label, 0) + 1
+            return {
+                "activities": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "dtypes": dtypes,
+            }
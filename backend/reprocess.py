@@ -0,0 +1,265 @@
+"""
+FIT跑步数据分析器 - 重新解析活动
+用存档的原始FIT文件（raw_store）和当前解析器重新生成活动，解析器、DR_FIELD_MAPPING
+或 field_units 更新后无需重新上传即可应用到整个活动库。
+
+重新解析时保留:
+- 活动ID、名称、创建时间、运动类型、备注、标签（可能被用户修改过）
+- 原始文件引用与心率合并溯源（merge_provenance）
+- 心率合并写入的IQ列（imported_<设备>_hr），按记录时间戳对应到新解析的记录
+合并活动（覆盖层）不单独解析，读取时直接使用重新解析后的基础活动。
+
+后台任务在进程池中解析（fitdecode 为纯Python，解析受GIL限制），
+在任务线程中不持有索引锁写好新文件（store.stage_activity），每 BATCH_SIZE 个一批
+调用 store.commit_staged()（短暂持有索引锁，一次索引日志提交），每批之后休眠 throttle_sec。
+"""
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from data_store import DataStore, StagedActivity
+from fit_parser import parse_fit_bytes, parser_fingerprint
+from hr_csv_merge import IMPORTED_IQ_PREFIX
+from models import Activity
+from raw_store import RawStore
+
+
+def find_reprocess_candidates(
+    store: DataStore,
+    activity_ids: Optional[List[str]] = None,
+    force: bool = False
+) -> List[str]:
+    """
+    需要重新解析的活动ID（有原始文件存档、不是覆盖层的活动，按索引顺序）
+
+    Args:
+        activity_ids: 只在这些活动中选择，None表示全部
+        force: 为True时包含已是当前解析器版本的活动
+    """
+    current = parser_fingerprint()
+    wanted = set(activity_ids) if activity_ids is not None else None
+    return [
+        meta.id for meta in store.iter_entries()
+        if meta.raw_sha256 and meta.base_id is None and (wanted is None or meta.id in wanted)
+        and (force or meta.parser_version != current)
+    ]
+
+
+def _parse_raw(raw_root: str, sha256: str, file_name: str, activity_id: str, name: str) -> Activity:
+    """读取原始文件并解析（可在子进程中运行）"""
+    data = RawStore(raw_root).get(sha256)
+    if data is None:
+        raise ValueError(f"原始文件缺失或已损坏: {sha256}")
+    activity = parse_fit_bytes(data, file_name, activity_id, name)
+    activity.raw_sha256 = sha256
+    return activity
+
+
+def apply_reparsed(old: Activity, parsed: Activity) -> Activity:
+    """
+    把旧活动中需要保留的信息带到新解析的活动上（修改并返回 parsed）
+    """
+    parsed.id = old.id
+    parsed.name = old.name
+    parsed.file_name = old.file_name
+    parsed.created_at = old.created_at
+    parsed.session.sport = old.session.sport
+    parsed.notes = old.notes
+    parsed.tags = old.tags
+    parsed.raw_sha256 = old.raw_sha256
+    parsed.merge_provenance = old.merge_provenance
+
+    overlay_keys = [key for key in old.available_iq_fields if key.startswith(IMPORTED_IQ_PREFIX)]
+    if not overlay_keys:
+        return parsed
+
+    overlay = [{key: r.iq_fields[key] for key in overlay_keys if key in r.iq_fields} for r in old.records]
+    by_time = {r.timestamp: values for r, values in zip(old.records, overlay) if r.timestamp is not None}
+    same_length = len(old.records) == len(parsed.records)
+    for i, record in enumerate(parsed.records):
+        values = by_time.get(record.timestamp) if record.timestamp is not None else None
+        if values is None and same_length:
+            values = overlay[i]
+        if values:
+            record.iq_fields.update(values)
+    parsed.available_iq_fields = sorted(set(parsed.available_iq_fields) | set(overlay_keys))
+    return parsed
+
+
+def _stage_reparsed(store: DataStore, parsed: Activity) -> Optional[StagedActivity]:
+    """
+    合并旧活动的保留信息并在锁外写好新文件（由 store.commit_staged() 提交）；
+    活动已被删除或原始文件已变化时返回None
+
+    读取旧活动前记下索引条目，期间活动被修改（如元数据修改）时提交会放弃重写，不会丢失修改。
+    """
+    expected = store.get_activity_meta(parsed.id)
+    if expected is None:
+        return None
+    old = store.get_activity(parsed.id)
+    if old is None or old.raw_sha256 != parsed.raw_sha256:
+        return None
+    return store.stage_activity(apply_reparsed(old, parsed), expected)
+
+
+def reprocess_activity(store: DataStore, activity_id: str) -> bool:
+    """
+    用当前解析器重新解析单个活动
+
+    Returns:
+        是否已重新解析（活动不存在或没有原始文件时为False）
+
+    Raises:
+        ValueError: 原始文件缺失或已损坏
+    """
+    meta = store.get_activity_meta(activity_id)
+    if meta is None or not meta.raw_sha256:
+        return False
+    parsed = _parse_raw(str(store.raw_store.root), meta.raw_sha256, meta.file_name or "", meta.id, meta.name)
+    staged = _stage_reparsed(store, parsed)
+    return staged is not None and store.commit_staged([staged])[0]
+
+
+class ReprocessJob:
+    """
+    后台重新解析任务
+
+    workers > 1 时在进程池中解析（同时最多 workers 个；打包版本中不使用子进程），
+    解析结果在任务线程中写为临时文件，按批用 store.commit_staged() 提交；
+    每批保存后休眠 throttle_sec。进度通过 status() 获取。
+    """
+
+    # 每批保存的活动数（合并为一次索引日志提交）
+    BATCH_SIZE = 16
+
+    def __init__(self, store: DataStore, activity_ids: List[str], workers: int = 1, throttle_sec: float = 0.05):
+        self.store = store
+        self.activity_ids = list(activity_ids)
+        self.workers = max(1, workers)
+        self.throttle_sec = throttle_sec
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._status: Dict[str, Any] = {
+            "state": "idle",  # idle | running | done | stopped
+            "parser_version": parser_fingerprint(),
+            "total": len(self.activity_ids),
+            "processed": 0,
+            "reprocessed": 0,
+            "skipped": 0,
+            "failed": [],
+            "started_at": None,
+            "finished_at": None,
+        }
+        # 已解析、等待批量保存的结果
+        self._parsed: List[tuple] = []
+        self._thread = threading.Thread(target=self._run, name="activity-reprocess", daemon=True)
+
+    def start(self):
+        self._update(state="running", started_at=datetime.now().isoformat())
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """请求停止并等待正在处理的活动完成"""
+        self._stop.set()
+        self.join(timeout)
+
+    def join(self, timeout: Optional[float] = None):
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def is_running(self) -> bool:
+        return self._thread.is_alive()
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            status = dict(self._status)
+            status["failed"] = list(status["failed"])
+            return status
+
+    def _update(self, **changes):
+        with self._lock:
+            self._status.update(changes)
+
+    def _task(self, activity_id: str) -> Optional[tuple]:
+        meta = self.store.get_activity_meta(activity_id)
+        if meta is None or not meta.raw_sha256:
+            return None
+        return (str(self.store.raw_store.root), meta.raw_sha256, meta.file_name or "", meta.id, meta.name)
+
+    def _finish(self, activity_id: str, parse):
+        """parse() 返回解析结果（或抛出解析错误）；结果累积到 BATCH_SIZE 个后一起保存"""
+        try:
+            parsed = parse()
+        except Exception as e:
+            self._fail(activity_id, e)
+            return
+        self._parsed.append((activity_id, parsed))
+        if len(self._parsed) >= self.BATCH_SIZE:
+            self._save_batch()
+
+    def _save_batch(self):
+        """在锁外写好已解析活动的新文件，再一次提交并更新进度"""
+        batch, self._parsed = self._parsed, []
+        if not batch:
+            return
+        staged = []
+        skipped = 0
+        for activity_id, parsed in batch:
+            try:
+                item = _stage_reparsed(self.store, parsed) if parsed is not None else None
+            except Exception as e:
+                self._fail(activity_id, e)
+                continue
+            if item is None:
+                skipped += 1
+            else:
+                staged.append(item)
+
+        results = []
+        try:
+            results = self.store.commit_staged(staged) if staged else []
+        except Exception as e:
+            for item in staged:
+                item.discard()
+                self._fail(item.meta.id, e)
+        with self._lock:
+            self._status["reprocessed"] += sum(results)
+            self._status["skipped"] += skipped + results.count(False)
+            self._status["processed"] += skipped + len(results)
+        if self.throttle_sec > 0:
+            self._stop.wait(self.throttle_sec)
+
+    def _fail(self, activity_id: str, error: Exception):
+        print(f"警告: 重新解析活动失败 {activity_id}: {error}")
+        with self._lock:
+            self._status["failed"].append({"id": activity_id, "error": str(error)})
+            self._status["processed"] += 1
+
+    def _run(self):
+        # 打包版本(PyInstaller)中不使用子进程，避免重复启动应用
+        if self.workers == 1 or getattr(sys, 'frozen', False):
+            for activity_id in self.activity_ids:
+                if self._stop.is_set():
+                    break
+                task = self._task(activity_id)
+                self._finish(activity_id, lambda: _parse_raw(*task) if task is not None else None)
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                pending = list(self.activity_ids)
+                inflight = []
+                while (pending or inflight) and not self._stop.is_set():
+                    while pending and len(inflight) < self.workers:
+                        activity_id = pending.pop(0)
+                        task = self._task(activity_id)
+                        inflight.append((activity_id, pool.submit(_parse_raw, *task) if task is not None else None))
+                    activity_id, future = inflight.pop(0)
+                    self._finish(activity_id, future.result if future is not None else lambda: None)
+                for _, future in inflight:
+                    if future is not None:
+                        future.cancel()
+        self._save_batch()
+
+        state = "stopped" if self._stop.is_set() else "done"
+        self._update(state=state, finished_at=datetime.now().isoformat())
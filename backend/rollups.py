@@ -0,0 +1,177 @@
+"""
+FIT跑步数据分析器 - 统计汇总(rollup)
+按运动类型 × 日/ISO周/月 预聚合距离、时长、次数、爬升和按时长加权的平均心率，
+随活动索引的 put/del 操作增量维护，日历与训练量图表查询时无需扫描全部活动。
+"""
+import threading
+from datetime import date
+from typing import Any, Dict, Optional
+
+from models import ActivityMeta
+
+
+ROLLUP_PERIODS = ("day", "week", "month")
+
+
+def period_key(period: str, day: date) -> str:
+    """日期所在统计周期的键（可按字符串排序）：2025-06-01 / 2025-W22 / 2025-06"""
+    if period == "day":
+        return day.isoformat()
+    if period == "week":
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    if period == "month":
+        return f"{day.year}-{day.month:02d}"
+    raise ValueError(f"未知的统计周期: {period}")
+
+
+def period_start(period: str, key: str) -> date:
+    """统计周期键对应的起始日期"""
+    if period == "day":
+        return date.fromisoformat(key)
+    if period == "week":
+        year, week = key.split("-W")
+        return date.fromisocalendar(int(year), int(week), 1)
+    if period == "month":
+        year, month = key.split("-")
+        return date(int(year), int(month), 1)
+    raise ValueError(f"未知的统计周期: {period}")
+
+
+class _Totals:
+    """可加减的累加器"""
+    __slots__ = ("count", "distance_km", "duration_sec", "total_ascent", "hr_sum", "hr_duration")
+
+    def __init__(self):
+        self.count = 0
+        self.distance_km = 0.0
+        self.duration_sec = 0.0
+        self.total_ascent = 0.0
+        # 平均心率按时长加权：sum(avg_hr * duration) / sum(duration)
+        self.hr_sum = 0.0
+        self.hr_duration = 0.0
+
+    def add(self, meta: ActivityMeta, sign: int = 1):
+        self.count += sign
+        self.distance_km += sign * meta.distance_km
+        self.duration_sec += sign * meta.duration_sec
+        self.total_ascent += sign * (meta.total_ascent or 0)
+        if meta.avg_heart_rate:
+            self.hr_sum += sign * meta.avg_heart_rate * meta.duration_sec
+            self.hr_duration += sign * meta.duration_sec
+
+    def merge(self, other: "_Totals"):
+        for name in self.__slots__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def to_dict(self) -> Dict[str, Any]:
+        avg_hr = round(self.hr_sum / self.hr_duration) if self.hr_duration > 0 else None
+        return {
+            "count": self.count,
+            "distance_km": round(self.distance_km, 2),
+            "duration_sec": round(self.duration_sec, 1),
+            "total_ascent": round(self.total_ascent, 1),
+            "avg_heart_rate": avg_hr,
+        }
+
+
+class StatsRollup:
+    """
+    按周期和运动类型聚合的统计
+
+    线程安全：后台迁移线程会在API查询的同时更新统计。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 周期 -> {周期键: {运动类型: 累加器}}
+        self._buckets: Dict[str, Dict[str, Dict[str, _Totals]]] = {p: {} for p in ROLLUP_PERIODS}
+        # 全部活动（含没有日期的活动）按运动类型的累计
+        self._lifetime: Dict[str, _Totals] = {}
+
+    def put(self, meta: ActivityMeta, old: Optional[ActivityMeta] = None):
+        """添加活动；更新已有活动时传入旧的元数据以先减去"""
+        with self._lock:
+            if old is not None:
+                self._apply(old, -1)
+            self._apply(meta, 1)
+
+    def remove(self, meta: ActivityMeta):
+        with self._lock:
+            self._apply(meta, -1)
+
+    def _apply(self, meta: ActivityMeta, sign: int):
+        sport = meta.sport or "running"
+        self._add_to(self._lifetime, sport, meta, sign)
+        if meta.date is None:
+            return
+        day = meta.date.date()
+        for period in ROLLUP_PERIODS:
+            buckets = self._buckets[period]
+            key = period_key(period, day)
+            by_sport = buckets.setdefault(key, {})
+            self._add_to(by_sport, sport, meta, sign)
+            if not by_sport:
+                del buckets[key]
+
+    @staticmethod
+    def _add_to(by_sport: Dict[str, _Totals], sport: str, meta: ActivityMeta, sign: int):
+        totals = by_sport.get(sport)
+        if totals is None:
+            totals = by_sport[sport] = _Totals()
+        totals.add(meta, sign)
+        if totals.count <= 0:
+            del by_sport[sport]
+
+    def lifetime(self) -> Dict[str, Dict[str, Any]]:
+        """{运动类型: 累计统计}"""
+        with self._lock:
+            return {sport: totals.to_dict() for sport, totals in sorted(self._lifetime.items())}
+
+    def query(
+        self,
+        period: str,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        sport: Optional[str] = None,
+        by_sport: bool = False
+    ) -> Dict[str, Any]:
+        """
+        查询日期范围内的周期统计
+
+        Args:
+            period: day / week / month
+            date_from: 开始日期（包含其所在的整个周期）
+            date_to: 结束日期（包含其所在的整个周期）
+            sport: 只统计该运动类型
+            by_sport: 每个周期额外返回按运动类型拆分的统计
+
+        Returns:
+            {"period", "buckets": [{"key", "start", "count", "distance_km", "duration_sec",
+             "total_ascent", "avg_heart_rate", ["sports"]}], "totals": {...}}，按时间升序
+        """
+        if period not in ROLLUP_PERIODS:
+            raise ValueError(f"未知的统计周期: {period}")
+        key_from = period_key(period, date_from) if date_from else None
+        key_to = period_key(period, date_to) if date_to else None
+
+        with self._lock:
+            result = []
+            grand = _Totals()
+            for key in sorted(self._buckets[period]):
+                if (key_from and key < key_from) or (key_to and key > key_to):
+                    continue
+                sports = {s: t for s, t in self._buckets[period][key].items() if sport is None or s == sport}
+                if not sports:
+                    continue
+                bucket = _Totals()
+                for totals in sports.values():
+                    bucket.merge(totals)
+                grand.merge(bucket)
+
+                item = {"key": key, "start": period_start(period, key).isoformat(), **bucket.to_dict()}
+                if by_sport:
+                    item["sports"] = {s: t.to_dict() for s, t in sorted(sports.items())}
+                result.append(item)
+
+        return {"period": period, "buckets": result, "totals": grand.to_dict()}
@@ -0,0 +1,258 @@
+"""
+FIT跑步数据分析器 - 活动搜索索引
+对活动名称、文件名、运动类型、设备名、标签、备注建立三元组(trigram)倒排索引，
+支持前缀匹配、子串匹配与容错（拼写错误）匹配，按相关度排序。
+
+索引只保存在内存中，随活动索引的 put/del 操作增量维护。
+"""
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+from models import ActivityMeta
+
+
+# 参与搜索的字段及权重
+SEARCH_FIELD_WEIGHTS = {
+    "name": 3.0,
+    "file_name": 2.0,
+    "sport": 1.0,
+    "devices": 1.0,
+    "tags": 2.0,
+    "notes": 1.0,
+}
+
+# 容错匹配：查询词的三元组至少有该比例出现在文档中；过短的词不做容错匹配
+FUZZY_MIN_SIMILARITY = 0.5
+FUZZY_MIN_TERM_LENGTH = 4
+
+# 缓存的查询结果数
+SEARCH_CACHE_SIZE = 64
+
+# 匹配类型得分（乘以字段权重）
+_SCORE_EXACT = 1.0
+_SCORE_FIELD_PREFIX = 0.9
+_SCORE_WORD_PREFIX = 0.8
+_SCORE_SUBSTRING = 0.6
+_SCORE_FUZZY = 0.5
+
+_WORD_SPLIT = re.compile(r"[^\w]+|_+")
+
+
+def normalize_text(text: str) -> str:
+    """小写并把分隔符（空格、下划线、标点）统一为单个空格"""
+    return " ".join(w for w in _WORD_SPLIT.split(text.lower()) if w)
+
+
+def trigrams(text: str) -> Set[str]:
+    """
+    按词生成三元组，词首补两个空格、词尾补一个空格
+
+    补位使得短词也能生成三元组，词首/词尾的差异会计入容错匹配的相似度。
+    """
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class SearchIndex:
+    """
+    活动搜索的倒排索引
+
+    线程安全：后台迁移线程会在API查询的同时更新索引。
+    查询结果按查询串缓存（索引变更时清空），翻页与逐字输入时复用之前的结果。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 活动ID -> {字段: 规范化文本}
+        self._docs: Dict[str, Dict[str, str]] = {}
+        # 活动ID -> 全部字段拼接后的文本 / 三元组集合 / 各字段的三元组集合
+        self._texts: Dict[str, str] = {}
+        self._grams: Dict[str, Set[str]] = {}
+        self._field_grams: Dict[str, Dict[str, Set[str]]] = {}
+        # 三元组 -> 活动ID集合
+        self._postings: Dict[str, Set[str]] = {}
+        # 活动ID -> 插入顺序（越大越新），用于同分时排序
+        self._order: Dict[str, int] = {}
+        self._counter = 0
+        # (查询串, fuzzy) -> 排好序的结果；查询词 -> 子串命中的活动ID
+        self._result_cache: Dict[Tuple[str, bool], List[Tuple[str, float]]] = {}
+        self._term_hits: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    @staticmethod
+    def _fields_of(meta: ActivityMeta) -> Dict[str, str]:
+        texts = {
+            "name": meta.name or "",
+            "file_name": meta.file_name or "",
+            "sport": meta.sport or "",
+            "devices": " ".join(meta.devices),
+            "tags": " ".join(meta.tags),
+            "notes": meta.notes or "",
+        }
+        return {field: normalize_text(text) for field, text in texts.items() if text}
+
+    def put(self, meta: ActivityMeta):
+        """添加或更新一个活动"""
+        with self._lock:
+            self._remove(meta.id)
+            fields = self._fields_of(meta)
+            field_grams = {field: trigrams(text) for field, text in fields.items()}
+            grams = set().union(*field_grams.values())
+            self._docs[meta.id] = fields
+            self._texts[meta.id] = " ".join(fields.values())
+            self._grams[meta.id] = grams
+            self._field_grams[meta.id] = field_grams
+            self._counter += 1
+            self._order[meta.id] = self._counter
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(meta.id)
+
+    def remove(self, activity_id: str):
+        """移除一个活动"""
+        with self._lock:
+            self._remove(activity_id)
+
+    def _remove(self, activity_id: str):
+        self._result_cache.clear()
+        self._term_hits.clear()
+        if self._docs.pop(activity_id, None) is None:
+            return
+        self._texts.pop(activity_id, None)
+        self._field_grams.pop(activity_id, None)
+        self._order.pop(activity_id, None)
+        for gram in self._grams.pop(activity_id, ()):
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(activity_id)
+                if not ids:
+                    del self._postings[gram]
+
+    def search(self, query: str, fuzzy: bool = True) -> List[Tuple[str, float]]:
+        """
+        搜索活动
+
+        多个查询词之间为“与”关系，每个词都必须以子串、前缀或容错方式匹配。
+
+        Args:
+            query: 查询字符串
+            fuzzy: 是否允许容错匹配
+
+        Returns:
+            [(活动ID, 得分)]，按得分降序、同分时最新的在前
+        """
+        terms = normalize_text(query).split()
+        if not terms:
+            return []
+
+        with self._lock:
+            key = (" ".join(terms), fuzzy)
+            cached = self._result_cache.get(key)
+            if cached is not None:
+                return cached
+
+            scores: Optional[Dict[str, float]] = None
+            for term in terms:
+                term_scores = self._score_term(term, fuzzy, scores)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {aid: scores[aid] + s for aid, s in term_scores.items()}
+                if not scores:
+                    break
+
+            # 先按新旧排序，再按得分稳定排序，同分时保持最新的在前
+            newest_first = sorted(scores, key=self._order.__getitem__, reverse=True)
+            ranked = sorted(newest_first, key=scores.__getitem__, reverse=True)
+            result = [(aid, scores[aid]) for aid in ranked]
+            if len(self._result_cache) >= SEARCH_CACHE_SIZE:
+                self._result_cache.pop(next(iter(self._result_cache)))
+            self._result_cache[key] = result
+            return result
+
+    def _substring_hits(self, term: str) -> Set[str]:
+        """包含查询词（子串）的活动ID"""
+        hits = self._term_hits.get(term)
+        if hits is not None:
+            return hits
+
+        # 逐字输入时，新词包含上一个词，只需在上一个词的结果中过滤
+        pool = None
+        for i in range(len(term) - 1, 0, -1):
+            pool = self._term_hits.get(term[:i])
+            if pool is not None:
+                break
+
+        if pool is None and len(term) >= 3:
+            # 包含查询词全部三元组的活动（从最小的倒排集合开始取交集）
+            postings = sorted((self._postings.get(term[i:i + 3], set()) for i in range(len(term) - 2)), key=len)
+            pool = postings[0]
+            for ids in postings[1:]:
+                pool = pool & ids
+                if not pool:
+                    break
+        elif pool is None:
+            # 1~2个字符可能出现在词中间，无法用三元组定位，直接扫描
+            pool = self._texts.keys()
+
+        texts = self._texts
+        hits = {aid for aid in pool if term in texts[aid]}
+        if len(self._term_hits) >= SEARCH_CACHE_SIZE:
+            self._term_hits.pop(next(iter(self._term_hits)))
+        self._term_hits[term] = hits
+        return hits
+
+    def _score_term(self, term: str, fuzzy: bool, within: Optional[Dict[str, float]]) -> Dict[str, float]:
+        """计算单个查询词对候选活动的得分（within 不为空时只在其中查找）"""
+        candidates = self._substring_hits(term)
+        if within is not None:
+            candidates = candidates & within.keys()
+
+        docs = self._docs
+        scores = {aid: self._match_score(term, docs[aid]) for aid in candidates}
+
+        if fuzzy and len(term) >= FUZZY_MIN_TERM_LENGTH:
+            # 只有首字母的三元组几乎出现在所有活动中，不参与容错匹配
+            grams = trigrams(term) - {"  " + term[0]}
+            if within is not None:
+                pool = (aid for aid in within if aid not in scores)
+                similar = {aid: len(grams & self._grams[aid]) / len(grams) for aid in pool}
+            else:
+                counts = Counter()
+                for gram in grams:
+                    counts.update(self._postings.get(gram, ()))
+                similar = {aid: n / len(grams) for aid, n in counts.items() if aid not in scores}
+            for aid, similarity in similar.items():
+                if similarity >= FUZZY_MIN_SIMILARITY:
+                    scores[aid] = _SCORE_FUZZY * similarity * self._best_weight(grams, self._field_grams[aid])
+        return scores
+
+    @staticmethod
+    def _match_score(term: str, fields: Dict[str, str]) -> float:
+        """精确/前缀/子串匹配得分，取各字段最高分"""
+        best = 0.0
+        for field, text in fields.items():
+            if term not in text:
+                continue
+            if text == term:
+                kind = _SCORE_EXACT
+            elif text.startswith(term):
+                kind = _SCORE_FIELD_PREFIX
+            elif " " + term in text:
+                kind = _SCORE_WORD_PREFIX
+            else:
+                kind = _SCORE_SUBSTRING
+            best = max(best, kind * SEARCH_FIELD_WEIGHTS[field])
+        return best
+
+    @staticmethod
+    def _best_weight(grams: Set[str], field_grams: Dict[str, Set[str]]) -> float:
+        """容错匹配时使用与查询词三元组重合最多的字段的权重"""
+        best_field = max(field_grams, key=lambda f: (len(grams & field_grams[f]), SEARCH_FIELD_WEIGHTS[f]))
+        return SEARCH_FIELD_WEIGHTS[best_field]
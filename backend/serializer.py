@@ -0,0 +1,67 @@
+"""
+FIT跑步数据分析器 - JSON序列化
+存储文件与API响应统一经由这里编解码：安装了 orjson 时使用 orjson，否则退回标准库 json。
+orjson 是 requirements.txt 中的依赖，打包时由 fitanalysis.spec 收入；标准库 json 只作为缺失时的后备。
+
+两种实现的输出兼容：
+- UTF-8 编码、不转义非ASCII字符
+- datetime/date 输出 ISO 8601 字符串
+- NumPy 数组与标量输出为列表/数字
+- 其他无法识别的类型输出 str(obj)
+"""
+import json
+from datetime import date, datetime
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+try:
+    import numpy
+except ImportError:  # 可选依赖
+    numpy = None
+
+
+JSON_ENGINE = "orjson" if orjson is not None else "json"
+
+
+def _default(obj: Any) -> Any:
+    """orjson/json 无法直接序列化的类型"""
+    if numpy is not None:
+        if isinstance(obj, numpy.ndarray):
+            return obj.tolist()
+        if isinstance(obj, numpy.generic):
+            return obj.item()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    return str(obj)
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj: Any, indent: bool = False) -> bytes:
+        """序列化为UTF-8编码的JSON，indent=True 时缩进2个空格"""
+        option = _ORJSON_OPTIONS | orjson.OPT_INDENT_2 if indent else _ORJSON_OPTIONS
+        return orjson.dumps(obj, default=_default, option=option)
+
+    def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+        """解析JSON（解析失败时抛出 json.JSONDecodeError 的子类）"""
+        return orjson.loads(data)
+
+else:
+    def dumps(obj: Any, indent: bool = False) -> bytes:
+        """序列化为UTF-8编码的JSON，indent=True 时缩进2个空格"""
+        if indent:
+            text = json.dumps(obj, ensure_ascii=False, indent=2, default=_default)
+        else:
+            text = json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default)
+        return text.encode("utf-8")
+
+    def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+        """解析JSON（解析失败时抛出 json.JSONDecodeError）"""
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
@@ -0,0 +1,349 @@
+"""
+FIT跑步数据分析器 - 数据库快照与恢复
+把整个数据目录导出为单个 tar.gz 文件（可边生成边下载），或从快照恢复到新的数据目录。
+
+快照结构:
+    activities/YYYY/MM/<id>.json|.rec|.lod|.cold   活动文件（相对数据目录的路径）
+    raw/xx/<sha256>.fit                            快照中的活动引用的原始FIT文件
+    index.json                                     与活动文件完全对应的索引
+    manifest.json                                  格式、版本、活动数等信息
+
+- 每个活动在索引锁内连同其索引条目一起读取，写入方只会被单个活动的读取短暂阻塞
+- 快照期间被删除的活动不出现在快照中，被修改的活动以读取时的版本为准
+- 合并活动（覆盖层）与尚未读取的基础活动在同一把锁内读取，快照中每个覆盖层的基础活动都存在；
+  恢复时基础活动缺失的覆盖层与无效活动一样被跳过
+- 恢复时先解压到临时目录并校验，全部完成后再替换目标目录
+"""
+import gzip
+import io
+import shutil
+import sys
+import tarfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path, PurePosixPath
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from column_store import read_column_pack
+from cold_storage import COLD_SUFFIX
+from data_store import (
+    METADATA_SUFFIX, DataStore, _read_meta_for_rebuild, overlays_missing_base, read_activity_header
+)
+from migrations import ACTIVITY_SCHEMA_VERSION
+from models import ActivityIndex, ActivityMeta
+from raw_store import RAW_DIR_NAME, RAW_SUFFIX
+from serializer import dumps, loads
+from store_io import atomic_write_bytes
+
+
+SNAPSHOT_FORMAT = "fitanalysis-snapshot"
+SNAPSHOT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+INDEX_NAME = "index.json"
+ACTIVITY_SUFFIXES = (".json", ".rec", ".lod", COLD_SUFFIX, METADATA_SUFFIX)
+# gzip 压缩级别（.rec/.lod 为JSON文本，压缩率高；.cold 已压缩）
+SNAPSHOT_COMPRESS_LEVEL = 6
+# 恢复时同时在写入的文件数上限（限制内存占用）
+RESTORE_MAX_INFLIGHT = 64
+
+
+class _ChunkBuffer:
+    """tarfile/gzip 的输出目标：累积写入的数据，由生成器分块取出"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def _add_file(tar: tarfile.TarFile, name: str, data: bytes, mtime: float):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(mtime)
+    tar.addfile(info, io.BytesIO(data))
+
+
+def iter_snapshot(store: DataStore, compress: bool = True, manifest: Optional[Dict[str, Any]] = None) -> Iterator[bytes]:
+    """
+    逐块生成数据目录的快照（tar，compress=True 时为 tar.gz）
+
+    Args:
+        store: 数据存储
+        compress: 是否 gzip 压缩
+        manifest: 传入dict时，生成结束后填入快照的 manifest 内容
+
+    Yields:
+        快照文件的数据块
+    """
+    started = datetime.now()
+    store.flush()
+    ids = [meta.id for meta in store.iter_entries()]
+
+    buffer = _ChunkBuffer()
+    stream = gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=SNAPSHOT_COMPRESS_LEVEL) if compress else buffer
+    tar = tarfile.open(fileobj=stream, mode="w|")
+    now = time.time()
+
+    included: Dict[str, ActivityMeta] = {}
+    for activity_id in ids:
+        if activity_id in included:
+            continue
+        for meta, files in store.read_activity_files(activity_id, skip=included.keys()):
+            for name, data in files:
+                _add_file(tar, name, data, now)
+            included[meta.id] = meta
+        yield buffer.drain()
+
+    for sha256 in dict.fromkeys(meta.raw_sha256 for meta in included.values() if meta.raw_sha256):
+        path = store.raw_store.path(sha256)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            continue
+        _add_file(tar, path.relative_to(store.data_dir).as_posix(), data, now)
+        yield buffer.drain()
+
+    # 与索引顺序一致；快照开始后新保存、作为基础活动被读入的活动排在最后
+    ordered = [included.pop(aid) for aid in ids if aid in included] + list(included.values())
+    index = ActivityIndex(activities=ordered, updated_at=started)
+    _add_file(tar, INDEX_NAME, dumps(index.model_dump(mode='json'), indent=True), now)
+    info = {
+        "format": SNAPSHOT_FORMAT,
+        "version": SNAPSHOT_VERSION,
+        "schema_version": ACTIVITY_SCHEMA_VERSION,
+        "created_at": started.isoformat(),
+        "activity_count": len(ordered),
+    }
+    _add_file(tar, MANIFEST_NAME, dumps(info, indent=True), now)
+    if manifest is not None:
+        manifest.update(info)
+    tar.close()
+    if compress:
+        stream.close()
+    yield buffer.drain()
+
+
+def write_snapshot(store: DataStore, output: Path, compress: bool = True) -> Dict[str, Any]:
+    """
+    把快照写入文件（原子写入：先写临时文件，完成后重命名）
+
+    Returns:
+        {"path", "bytes", "activity_count", "duration_sec"}
+    """
+    output = Path(output)
+    started = time.time()
+    tmp = output.with_name(f".{output.name}.{uuid.uuid4().hex}.tmp")
+    size = 0
+    manifest: Dict[str, Any] = {}
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in iter_snapshot(store, compress, manifest):
+                f.write(chunk)
+                size += len(chunk)
+        tmp.replace(output)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+    return {
+        "path": str(output),
+        "bytes": size,
+        "activity_count": manifest["activity_count"],
+        "duration_sec": round(time.time() - started, 3),
+    }
+
+
+def _safe_member_name(name: str) -> Optional[str]:
+    """快照成员的相对路径；不是快照应包含的文件时返回None"""
+    path = PurePosixPath(name)
+    if path.is_absolute() or ".." in path.parts:
+        return None
+    if path.as_posix() in (MANIFEST_NAME, INDEX_NAME):
+        return path.as_posix()
+    if path.parts[:1] == ("activities",) and path.suffix in ACTIVITY_SUFFIXES:
+        return path.as_posix()
+    if path.parts[:1] == (RAW_DIR_NAME,) and path.suffix == RAW_SUFFIX:
+        return path.as_posix()
+    return None
+
+
+def _validate_activity(header_file: str) -> Tuple[str, Optional[Dict[str, Any]], Optional[str]]:
+    """
+    校验单个恢复的活动（可在子进程中运行）
+
+    在重建索引的解析之外，检查列式记录文件的记录数与头部一致。
+
+    Returns:
+        (活动文件路径, 元数据dict, 错误信息)
+    """
+    path = Path(header_file)
+    _, meta, error = _read_meta_for_rebuild(header_file)
+    if meta is None:
+        return header_file, None, error
+    if path.suffix == ".json":
+        try:
+            header = read_activity_header(path)
+            if header.get("schema_version", 1) >= 2:
+                count, _ = read_column_pack(path.with_suffix(".rec"), [])
+                if count != header.get("record_count"):
+                    return header_file, None, f"记录数不一致: 头部 {header.get('record_count')}, 记录文件 {count}"
+        except Exception as e:
+            return header_file, None, str(e)
+    return header_file, meta, None
+
+
+def restore_snapshot(
+    archive: Path,
+    data_dir: Path,
+    force: bool = False,
+    max_workers: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    从快照恢复数据目录
+
+    先解压到与目标同级的临时目录（并行写入文件），再并行校验每个活动，
+    生成索引后替换目标目录。校验失败的活动被删除并写入报告。
+
+    Args:
+        archive: 快照文件（tar 或 tar.gz）
+        data_dir: 目标数据目录
+        force: 目标目录已有活动时是否覆盖（原目录重命名为 <目录名>.bak-时间戳 保留）
+        max_workers: 并行工作数，None表示CPU核数
+
+    Returns:
+        {"restored", "skipped": [{"file", "error"}], "backup", "duration_sec"}
+
+    Raises:
+        ValueError: 快照格式不正确，或目标目录已有活动且未指定 force
+    """
+    started = time.time()
+    data_dir = Path(data_dir)
+    if not force and _has_activities(data_dir):
+        raise ValueError(f"目标数据目录已有活动: {data_dir}（使用 force 覆盖）")
+
+    staging = data_dir.parent / f".{data_dir.name}.restore-{uuid.uuid4().hex[:8]}"
+    staging.mkdir(parents=True)
+    try:
+        manifest, archived_index = _extract(Path(archive), staging, max_workers)
+        if manifest.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError("不是有效的快照文件（缺少 manifest.json）")
+        if manifest.get("version", 0) > SNAPSHOT_VERSION or manifest.get("schema_version", 0) > ACTIVITY_SCHEMA_VERSION:
+            raise ValueError("快照由更新版本的程序创建，请先升级")
+
+        index, skipped = _validate_and_index(staging, archived_index, max_workers)
+        DataStore(str(staging)).replace_index(index.activities)
+
+        backup = None
+        if _has_activities(data_dir):
+            backup = data_dir.with_name(f"{data_dir.name}.bak-{datetime.now():%Y%m%d-%H%M%S}")
+            data_dir.rename(backup)
+        elif data_dir.exists():
+            shutil.rmtree(data_dir)
+        staging.rename(data_dir)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    return {
+        "restored": len(index.activities),
+        "skipped": skipped,
+        "backup": str(backup) if backup else None,
+        "duration_sec": round(time.time() - started, 3),
+    }
+
+
+def _has_activities(data_dir: Path) -> bool:
+    activities_dir = data_dir / "activities"
+    return activities_dir.exists() and any(p.is_file() for p in activities_dir.rglob("*"))
+
+
+def _extract(archive: Path, staging: Path, max_workers: Optional[int]) -> Tuple[Dict[str, Any], Optional[ActivityIndex]]:
+    """顺序读取快照流，并行写出文件；返回 (manifest, 快照中的索引)"""
+    manifest: Dict[str, Any] = {}
+    archived_index = None
+    with open(archive, "rb") as f, tarfile.open(fileobj=f, mode="r|*") as tar, \
+            ThreadPoolExecutor(max_workers=max_workers) as pool:
+        inflight = []
+        for member in tar:
+            name = _safe_member_name(member.name) if member.isfile() else None
+            if name is None:
+                continue
+            data = tar.extractfile(member).read()
+            if name == MANIFEST_NAME:
+                manifest = loads(data)
+            elif name == INDEX_NAME:
+                archived_index = ActivityIndex(**loads(data))
+            else:
+                target = staging / name
+                target.parent.mkdir(parents=True, exist_ok=True)
+                inflight.append(pool.submit(atomic_write_bytes, target, data))
+                if len(inflight) >= RESTORE_MAX_INFLIGHT:
+                    for future in inflight:
+                        future.result()
+                    inflight = []
+        for future in inflight:
+            future.result()
+    return manifest, archived_index
+
+
+def _validate_and_index(
+    staging: Path,
+    archived_index: Optional[ActivityIndex],
+    max_workers: Optional[int]
+) -> Tuple[ActivityIndex, List[Dict[str, str]]]:
+    """并行校验恢复的活动并生成索引（保留快照索引中的顺序与访问时间），基础活动缺失的覆盖层视为无效"""
+    activities_dir = staging / "activities"
+    headers = [p for pattern in ("*.json", "*" + COLD_SUFFIX) for p in activities_dir.rglob(pattern)]
+
+    # 打包版本(PyInstaller)中不使用子进程，避免重复启动应用
+    if len(headers) >= DataStore.REBUILD_PARALLEL_MIN_FILES and not getattr(sys, 'frozen', False):
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+    else:
+        executor = ThreadPoolExecutor(max_workers=1)
+
+    valid: Dict[str, ActivityMeta] = {}
+    header_paths: Dict[str, Path] = {}
+    skipped = []
+    with executor:
+        for header_file, meta, error in executor.map(_validate_activity, map(str, headers), chunksize=16):
+            path = Path(header_file)
+            if meta is None:
+                print(f"警告: 恢复的活动无效 {path.name}: {error}")
+                skipped.append({"file": path.relative_to(staging).as_posix(), "error": error})
+                for suffix in ACTIVITY_SUFFIXES:
+                    path.with_suffix(suffix).unlink(missing_ok=True)
+                continue
+            meta = ActivityMeta(**meta)
+            if path.suffix == COLD_SUFFIX:
+                meta.tier = "cold"
+            valid[meta.id] = meta
+            header_paths[meta.id] = path
+
+    for activity_id, base_id in overlays_missing_base({aid: meta.base_id for aid, meta in valid.items()}).items():
+        path = header_paths[activity_id]
+        error = f"合并活动引用的基础活动不存在: {base_id}"
+        print(f"警告: 恢复的活动无效 {path.name}: {error}")
+        del valid[activity_id]
+        skipped.append({"file": path.relative_to(staging).as_posix(), "error": error})
+        for suffix in ACTIVITY_SUFFIXES:
+            path.with_suffix(suffix).unlink(missing_ok=True)
+
+    # 快照中的索引条目与文件对应同一版本，优先使用；其余按日期排在后面
+    ordered = []
+    if archived_index is not None:
+        for meta in archived_index.activities:
+            if valid.pop(meta.id, None) is not None:
+                ordered.append(meta)
+    rest = sorted(valid.values(), key=lambda a: a.date.timestamp() if a.date else 0, reverse=True)
+    return ActivityIndex(activities=ordered + rest), skipped
@@ -0,0 +1,111 @@
+"""
+FIT跑步数据分析器 - 数据存储命令行工具
+
+用法:
+    python backend/store_cli.py snapshot backup.tar.gz         # 导出快照（服务运行时也可执行）
+    python backend/store_cli.py restore backup.tar.gz          # 从快照恢复（需先停止服务）
+    python backend/store_cli.py restore backup.tar.gz --force  # 覆盖已有数据（原目录保留为备份）
+    python backend/store_cli.py check                          # 检查索引与活动文件是否一致
+    python backend/store_cli.py check --repair                 # 检查并修复（损坏文件移入 data/quarantine/）
+    python backend/store_cli.py reprocess                      # 用存档的原始FIT文件重新解析旧版本解析的活动
+    python backend/store_cli.py reprocess --force              # 重新解析所有有原始文件的活动
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from data_store import DataStore
+from integrity import scan_store
+from reprocess import ReprocessJob, find_reprocess_candidates
+from snapshot import restore_snapshot, write_snapshot
+from serializer import dumps
+
+
+DEFAULT_DATA_DIR = Path(__file__).parent.parent / "data"
+
+
+def _print_report(report):
+    print(dumps(report, indent=True).decode("utf-8"))
+
+
+def cmd_snapshot(args) -> int:
+    store = DataStore(str(args.data_dir))
+    report = write_snapshot(store, Path(args.output), compress=not args.no_compress)
+    _print_report(report)
+    return 0
+
+
+def cmd_restore(args) -> int:
+    try:
+        report = restore_snapshot(Path(args.archive), Path(args.data_dir), force=args.force, max_workers=args.workers)
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 1
+    _print_report(report)
+    return 0 if not report["skipped"] else 2
+
+
+def cmd_check(args) -> int:
+    store = DataStore(str(args.data_dir))
+    report = scan_store(store, repair=args.repair, max_workers=args.workers)
+    _print_report(report)
+    problems = sum(len(report[key]) for key in (
+        "orphans", "dangling", "corrupt", "partial", "duplicates", "tier_mismatch", "missing_base", "temp_files",
+        "raw_orphans"
+    ))
+    return 0 if problems == 0 or report["repaired"] else 2
+
+
+def cmd_reprocess(args) -> int:
+    store = DataStore(str(args.data_dir))
+    job = ReprocessJob(
+        store, find_reprocess_candidates(store, args.ids or None, args.force),
+        workers=args.workers, throttle_sec=0
+    )
+    job.start()
+    job.join()
+    store.close()
+    status = job.status()
+    _print_report(status)
+    return 0 if not status["failed"] else 2
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="FIT跑步数据分析器 数据存储工具")
+    parser.add_argument("--data-dir", default=str(DEFAULT_DATA_DIR), help="数据目录（默认: 项目下的 data/）")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    snapshot = commands.add_parser("snapshot", help="导出整个数据目录的快照")
+    snapshot.add_argument("output", help="快照文件路径（.tar.gz）")
+    snapshot.add_argument("--no-compress", action="store_true", help="不压缩（输出 .tar）")
+    snapshot.set_defaults(func=cmd_snapshot)
+
+    restore = commands.add_parser("restore", help="从快照恢复数据目录（需先停止服务）")
+    restore.add_argument("archive", help="快照文件路径")
+    restore.add_argument("--force", action="store_true", help="数据目录已有活动时覆盖（原目录重命名保留）")
+    restore.add_argument("--workers", type=int, default=None, help="并行工作数（默认: CPU核数）")
+    restore.set_defaults(func=cmd_restore)
+
+    check = commands.add_parser("check", help="检查索引与活动文件的完整性")
+    check.add_argument("--repair", action="store_true", help="修复：重建缺失的索引条目、删除无效条目、隔离损坏文件")
+    check.add_argument("--workers", type=int, default=None, help="并行工作数（默认: CPU核数）")
+    check.set_defaults(func=cmd_check)
+
+    reprocess = commands.add_parser("reprocess", help="用存档的原始FIT文件和当前解析器重新解析活动")
+    reprocess.add_argument("ids", nargs="*", help="只重新解析这些活动（默认: 全部）")
+    reprocess.add_argument("--force", action="store_true", help="包含已是当前解析器版本的活动")
+    reprocess.add_argument("--workers", type=int, default=1, help="并行解析进程数（默认: 1）")
+    reprocess.set_defaults(func=cmd_reprocess)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+FIT跑步数据分析器 - 存储文件I/O工具
+原子写入与跨进程文件锁，保证多worker/多进程同时访问数据目录时的安全
+"""
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def atomic_write_bytes(path: Path, data: bytes):
+    """
+    原子写入文件：先写同目录下的临时文件并fsync，再rename覆盖目标
+
+    读取方要么看到旧文件，要么看到完整的新文件，不会读到写了一半的内容。
+    """
+    tmp_name = write_temp_file(path, data)
+    try:
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+
+
+def write_temp_file(path: Path, data: bytes) -> str:
+    """
+    把内容写入目标同目录下的临时文件并fsync，返回临时文件路径
+
+    由调用方 os.replace 到目标（原子替换）或删除；atomic_write_bytes 的前半步，
+    用于先在锁外写好、再在锁内只做rename。
+    """
+    path = Path(path)
+    fd, tmp_name = tempfile.mkstemp(dir=str(path.parent), prefix=path.name + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+    return tmp_name
+
+
+def file_signature(path: Path) -> Tuple[int, int, int]:
+    """文件身份签名 (inode, 大小, 修改时间)，文件不存在时返回全0"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return (0, 0, 0)
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+class FileLock:
+    """
+    可重入的跨进程建议锁
+
+    进程内用 RLock 串行化线程，进程间用 flock（POSIX）或 msvcrt.locking（Windows）
+    锁定一个专用的锁文件。只有最外层的 acquire/release 会真正操作文件锁。
+    """
+
+    def __init__(self, lock_file: Path, poll_interval: float = 0.05):
+        self.lock_file = Path(lock_file)
+        self.poll_interval = poll_interval
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+        self._owner = None
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                self._fd = os.open(str(self.lock_file), os.O_RDWR | os.O_CREAT, 0o644)
+                self._lock_fd(self._fd)
+            except BaseException:
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+                self._thread_lock.release()
+                raise
+            self._owner = threading.get_ident()
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            self._owner = None
+            try:
+                self._unlock_fd(self._fd)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+        self._thread_lock.release()
+
+    def held_by_current_thread(self) -> bool:
+        """当前线程是否持有锁"""
+        return self._owner == threading.get_ident()
+
+    def _lock_fd(self, fd: int):
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            return
+        # msvcrt 的阻塞模式只重试10次，这里自行轮询
+        while True:
+            try:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                return
+            except OSError:
+                time.sleep(self.poll_interval)
+
+    def _unlock_fd(self, fd: int):
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
@@ -0,0 +1,185 @@
+"""
+FIT跑步数据分析器 - 写回(write-behind)队列
+上传/合并时活动先放入内存队列并立即返回，后台线程把活动文件写入磁盘，
+同一轮写入的所有索引变更合并为一次日志提交。
+
+- 写入磁盘前，读取活动时直接使用队列中的对象
+- 同一活动在写入前被多次保存时只写最新版本
+- flush() 是显式的持久化点：返回时，调用前提交的活动都已写入磁盘（或已被放弃）
+- 连续写入失败 max_attempts 次的活动被放弃，内存索引回到磁盘上的状态，
+  避免磁盘已满、路径错误等持续性错误让 flush() 永远等待
+- close() 在退出时等待队列写完
+"""
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from models import Activity, ActivityMeta
+
+
+class WriteBehindQueue:
+    """
+    活动写回队列
+
+    后台线程调用 store._write_activity_files() 写入活动文件（不持有索引锁），
+    再调用 store._commit_written() 一次性提交本轮所有活动的索引变更。
+    写入失败的活动留在队列中，retry_sec 秒后重试；连续失败 max_attempts 次后放弃，
+    由 store._discard_unwritten() 丢弃内存索引中未持久化的版本。
+    """
+
+    def __init__(self, store, retry_sec: float = 1.0, max_attempts: int = 5):
+        self.store = store
+        self.retry_sec = retry_sec
+        self.max_attempts = max_attempts
+        self._cond = threading.Condition()
+        # 活动ID -> (提交序号, 活动, 元数据)：等待写入 / 本轮正在写入
+        self._pending: Dict[str, Tuple[int, Activity, ActivityMeta]] = {}
+        self._writing: Dict[str, Tuple[int, Activity, ActivityMeta]] = {}
+        # 已放弃、正在从内存索引中丢弃的条目（完成前 flush() 继续等待）
+        self._discarding: Dict[str, Tuple[int, Activity, ActivityMeta]] = {}
+        # 提交序号 -> 失败次数
+        self._attempts: Dict[int, int] = {}
+        self._seq = 0
+        self._closed = False
+        self._stats: Dict[str, Any] = {
+            "written": 0,
+            "commits": 0,
+            "failed": 0,
+            "abandoned": 0,
+            "abandoned_ids": [],
+            "last_error": None,
+            "last_commit_at": None,
+        }
+        self._thread = threading.Thread(target=self._run, name="activity-write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, activity: Activity, meta: ActivityMeta):
+        """加入写入队列（同一活动尚未写入的旧版本被替换）"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("写回队列已关闭")
+            self._seq += 1
+            self._pending[activity.id] = (self._seq, activity, meta)
+            self._cond.notify_all()
+
+    def get(self, activity_id: str) -> Optional[Activity]:
+        """尚未写入磁盘的活动（最新版本），不在队列中时返回None"""
+        with self._cond:
+            entry = self._pending.get(activity_id) or self._writing.get(activity_id)
+            return entry[1] if entry is not None else None
+
+    def pending_metas(self) -> List[ActivityMeta]:
+        """尚未提交到索引日志的活动元数据，按提交顺序排列"""
+        with self._cond:
+            entries = {**self._writing, **self._pending}
+            return [meta for _, _, meta in sorted(entries.values(), key=lambda e: e[0])]
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待调用前提交的活动全部写入，返回是否在超时前完成"""
+        with self._cond:
+            target = self._seq
+            return self._cond.wait_for(lambda: self._oldest_seq() > target, timeout)
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """停止接收新活动，等待队列写完后结束后台线程，返回是否已写完"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def status(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "writing": len(self._writing),
+                "closed": self._closed,
+                **self._stats,
+                "abandoned_ids": list(self._stats["abandoned_ids"]),
+            }
+
+    def _oldest_seq(self) -> float:
+        entries = list(self._pending.values()) + list(self._writing.values()) + list(self._discarding.values())
+        return min((seq for seq, _, _ in entries), default=float("inf"))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                self._writing, self._pending = self._pending, {}
+                batch = dict(self._writing)
+
+            failed = self._write(batch)
+
+            with self._cond:
+                self._writing = {}
+                failed_seqs = {entry[0] for entry in failed.values()}
+                for seq, _, _ in batch.values():
+                    if seq not in failed_seqs:
+                        self._attempts.pop(seq, None)
+                for activity_id, entry in failed.items():
+                    attempts = self._attempts[entry[0]] = self._attempts.get(entry[0], 0) + 1
+                    if activity_id in self._pending:
+                        # 等待期间已有更新的版本时丢弃失败的旧版本
+                        self._attempts.pop(entry[0], None)
+                    elif attempts >= self.max_attempts:
+                        self._attempts.pop(entry[0], None)
+                        self._discarding[activity_id] = entry
+                    else:
+                        self._pending[activity_id] = entry
+                discarding = dict(self._discarding)
+
+            if discarding:
+                self._discard(discarding)
+
+            with self._cond:
+                self._discarding = {}
+                self._cond.notify_all()
+                if failed:
+                    self._cond.wait(self.retry_sec)
+
+    def _write(self, batch: Dict[str, Tuple[int, Activity, ActivityMeta]]) -> Dict[str, Tuple[int, Activity, ActivityMeta]]:
+        """写入一轮活动并提交索引，返回失败的条目"""
+        failed = {}
+        written = {}
+        for activity_id, entry in batch.items():
+            try:
+                self.store._write_activity_files(entry[1])
+                written[activity_id] = entry
+            except Exception as e:
+                print(f"警告: 写入活动失败 {activity_id}: {e}")
+                failed[activity_id] = entry
+                self._record_error(e)
+
+        if written:
+            try:
+                self.store._commit_written([meta for _, _, meta in written.values()])
+            except Exception as e:
+                print(f"警告: 提交索引失败: {e}")
+                failed.update(written)
+                self._record_error(e)
+            else:
+                with self._cond:
+                    self._stats["written"] += len(written)
+                    self._stats["commits"] += 1
+                    self._stats["last_commit_at"] = datetime.now().isoformat()
+        return failed
+
+    def _discard(self, entries: Dict[str, Tuple[int, Activity, ActivityMeta]]):
+        """放弃多次写入失败的活动"""
+        print(f"警告: 活动多次写入失败，已放弃: {', '.join(entries)}")
+        with self._cond:
+            self._stats["abandoned"] += len(entries)
+            self._stats["abandoned_ids"].extend(entries)
+        try:
+            self.store._discard_unwritten()
+        except Exception as e:
+            print(f"警告: 重新加载索引失败: {e}")
+            self._record_error(e)
+
+    def _record_error(self, error: Exception):
+        with self._cond:
+            self._stats["failed"] += 1
+            self._stats["last_error"] = str(error)
@@ -49,3 +49,24 @@ HR_MERGE_INTERPOLATE_MAX_GAP_SEC = 5
 
 # 是否允许对CSV覆盖范围之外进行外推（默认不允许）
 HR_MERGE_ALLOW_EXTRAPOLATION = False
+
+# ==================== 存储配置 ====================
+# 写回模式：上传/合并后立即返回，活动文件与索引日志由后台线程写入磁盘，
+# 适合数据目录位于慢速网络盘的情况。正常退出时会等待写完；进程崩溃时可能丢失尚未写入的活动。
+STORE_WRITE_BEHIND = False
+
+# 冷存储：活动日期与最近访问时间都早于该天数的活动，启动时会被打包压缩归档，
+# 再次打开时自动解压（首次打开需要解压，约慢几百毫秒）。默认 None 不自动归档，
+# 适合数据目录很大、磁盘空间紧张时设为如 180。新上传或导入的活动视为刚访问过。
+STORE_COLD_AFTER_DAYS = None
+
+# 记录缓存上限（MB）：最近查看的活动的记录数据以紧凑类型缓存在内存中，
+# 每个小时级活动约占 0.1~0.3MB。设为 0 关闭缓存。
+STORE_RECORD_CACHE_MB = 128
+
+# 重新解析：上传的FIT文件原样存档在 data/raw/。解析器或字段映射（DR_FIELD_MAPPING、field_units）
+# 更新后，可通过 POST /api/storage/reprocess 用存档重新解析旧版本解析的活动（保留活动ID与心率合并数据）。
+# 设为 True 时每次启动自动在后台重新解析，默认 False 不自动运行。
+STORE_AUTO_REPROCESS = False
+# 重新解析的并行进程数（1 表示在后台线程中逐个解析，不启动进程池）
+STORE_REPROCESS_WORKERS = 1
@@ -39,6 +39,7 @@ a = Analysis(
         'uvicorn.lifespan.on',
         'fitdecode',
         'pandas',
+        'orjson',
         'backend.models',
         'backend.fit_parser',
         'backend.data_store',
@@ -46,6 +47,25 @@ a = Analysis(
         'backend.device_mappings',
         'backend.field_units',
         'backend.hr_csv_merge',
+        'backend.index_journal',
+        'backend.store_io',
+        'backend.column_store',
+        'backend.lod',
+        'backend.migrations',
+        'backend.search_index',
+        'backend.rollups',
+        'backend.serializer',
+        'backend.write_behind',
+        'backend.cold_storage',
+        'backend.snapshot',
+        'backend.store_cli',
+        'backend.integrity',
+        'backend.column_codecs',
+        'backend.record_cache',
+        'backend.raw_store',
+        'backend.reprocess',
+        'backend.field_index',
+        'backend.lap_index',
     ],
     hookspath=[],
     hooksconfig={},
@@ -16,10 +16,15 @@ const state = {
         dateFrom: null,
         dateTo: null,
         distMin: null,
-        distMax: null
+        distMax: null,
+        query: ''
     }
 };
 
+// 搜索框输入防抖（毫秒）
+const SEARCH_DEBOUNCE_MS = 200;
+let searchDebounceTimer = null;
+
 // ==================== 初始化 ====================
 document.addEventListener('DOMContentLoaded', async () => {
     initEventListeners();
@@ -51,6 +56,7 @@ function initEventListeners() {
     document.getElementById('sortOrder').addEventListener('change', loadActivities);
     document.getElementById('applyFilter').addEventListener('click', applyFilters);
     document.getElementById('resetFilter').addEventListener('click', resetFilters);
+    document.getElementById('searchQuery').addEventListener('input', handleSearchInput);
     
     // 分页
     document.getElementById('prevPage').addEventListener('click', () => changePage(-1));
@@ -228,8 +234,14 @@ function switchView(view) {
 
 // ==================== 文件上传 ====================
 async function handleFileUpload(e) {
-    const file = e.target.files[0];
-    if (!file) return;
+    const files = Array.from(e.target.files);
+    if (files.length === 0) return;
+    if (files.length > 1) {
+        await handleBatchUpload(files);
+        e.target.value = '';
+        return;
+    }
+    const file = files[0];
     
     const formData = new FormData();
     formData.append('file', file);
@@ -258,6 +270,35 @@ async function handleFileUpload(e) {
     }
 }
 
+// 多个文件一次上传，由后端在一个索引批次内保存
+async function handleBatchUpload(files) {
+    const formData = new FormData();
+    files.forEach(file => formData.append('files', file));
+    
+    showStatus(`正在上传和解析 ${files.length} 个FIT文件...`);
+    
+    try {
+        const response = await fetch(`${API_BASE}/upload/batch`, {
+            method: 'POST',
+            body: formData
+        });
+        const results = await response.json();
+        if (!response.ok) {
+            throw new Error(results.detail || '上传失败');
+        }
+        
+        const failed = results.filter(r => !r.success);
+        if (failed.length === 0) {
+            showStatus(`✓ 已导入 ${results.length} 个活动`, 'success');
+        } else {
+            showStatus(`已导入 ${results.length - failed.length} 个活动，${failed.length} 个失败: ${failed.map(r => r.message).join('; ')}`, 'error');
+        }
+        loadActivities();
+    } catch (error) {
+        showStatus(`✗ 上传失败: ${error.message}`, 'error');
+    }
+}
+
 // ==================== 加载活动列表 ====================
 async function loadActivities() {
     const sortBy = document.getElementById('sortBy').value;
@@ -276,9 +317,23 @@ async function loadActivities() {
     if (state.filters.distMin !== null) params.append('distance_min', state.filters.distMin);
     if (state.filters.distMax !== null) params.append('distance_max', state.filters.distMax);
     
+    // 有搜索词时改用搜索接口（按相关度排序，忽略其他过滤条件）
+    let url = `${API_BASE}/activities?${params}`;
+    if (state.filters.query) {
+        const searchParams = new URLSearchParams({
+            q: state.filters.query,
+            page: state.currentPage,
+            limit: 20
+        });
+        url = `${API_BASE}/activities/search?${searchParams}`;
+    }
+    
     try {
-        const response = await fetch(`${API_BASE}/activities?${params}`);
+        const query = state.filters.query;
+        const response = await fetch(url);
         const data = await response.json();
+        // 输入过程中旧请求可能晚于新请求返回，丢弃过期结果
+        if (query !== state.filters.query) return;
         
         renderActivityTable(data.activities);
         updatePagination(data.page, data.total, data.limit);
@@ -375,6 +430,15 @@ function applyFilters() {
     loadActivities();
 }
 
+function handleSearchInput(e) {
+    clearTimeout(searchDebounceTimer);
+    searchDebounceTimer = setTimeout(() => {
+        state.filters.query = e.target.value.trim();
+        state.currentPage = 1;
+        loadActivities();
+    }, SEARCH_DEBOUNCE_MS);
+}
+
 function resetFilters() {
     state.filters = {
         sortBy: 'date',
@@ -382,9 +446,11 @@ function resetFilters() {
         dateFrom: null,
         dateTo: null,
         distMin: null,
-        distMax: null
+        distMax: null,
+        query: ''
     };
     
+    document.getElementById('searchQuery').value = '';
     document.getElementById('filterDateFrom').value = '';
     document.getElementById('filterDateTo').value = '';
     document.getElementById('filterDistMin').value = '';
@@ -459,7 +525,8 @@ async function viewActivityDetail(activityId) {
     state.currentActivityId = activityId;
     
     try {
-        const response = await fetch(`${API_BASE}/activity/${activityId}`);
+        // 只加载头部（汇总、单圈），趋势图数据按需从 /lod 和缩放范围加载
+        const response = await fetch(`${API_BASE}/activity/${activityId}?layout=none`);
         const activity = await response.json();
         
         state.currentActivity = activity;
@@ -718,16 +785,29 @@ async function deleteActivity(activityId) {
 async function deleteSelectedActivities() {
     if (!confirm(`确定要删除选中的 ${state.selectedActivityIds.size} 个活动吗？`)) return;
     
-    for (const id of state.selectedActivityIds) {
-        try {
-            await fetch(`${API_BASE}/activity/${id}`, { method: 'DELETE' });
-        } catch (error) {
-            console.error(`Failed to delete ${id}:`, error);
+    try {
+        const response = await fetch(`${API_BASE}/activities/delete`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ activity_ids: Array.from(state.selectedActivityIds) })
+        });
+        
+        if (!response.ok) {
+            throw new Error('删除失败');
         }
+        
+        const result = await response.json();
+        Object.entries(result.results || {})
+            .filter(([, ok]) => !ok)
+            .forEach(([id]) => console.error(`Failed to delete ${id}`));
+        
+        showStatus(`已删除 ${result.deleted_count || 0} 个活动`, 'success');
+    } catch (error) {
+        console.error('Batch delete failed:', error);
+        showStatus('删除失败', 'error');
     }
     
     state.selectedActivityIds.clear();
-    showStatus('已删除选中的活动', 'success');
     loadActivities();
 }
 
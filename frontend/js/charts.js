@@ -1045,13 +1045,121 @@ function renderFieldSelector(standardFields, iqFields) {
 }
 
 // ==================== 更新趋势图 ====================
-function updateTrendChart(activity, selectedFields) {
-    if (!activity || !activity.records || activity.records.length === 0) {
+// 详情页只加载活动头部（layout=none）：概览由服务端预计算的多分辨率包络绘制（每个桶取均值），
+// 放大后只加载缩放范围内的完整分辨率记录
+let trendRequestSeq = 0;
+
+/**
+ * 按图表宽度加载降采样数据，转换为records结构
+ * @param {Object} activity - 当前活动
+ * @param {Array} selectedFields - 选中的字段
+ * @returns {Promise<Array>} records
+ */
+async function loadTrendLodRecords(activity, selectedFields) {
+    const width = document.getElementById('trendChart').clientWidth || 1000;
+    const fields = ['distance', ...selectedFields.filter(f => f !== 'distance')];
+    const params = new URLSearchParams({ fields: fields.join(','), width: width });
+    
+    const response = await fetch(`${API_BASE}/activity/${activity.id}/lod?${params}`);
+    if (!response.ok) {
+        throw new Error('加载降采样数据失败');
+    }
+    const lod = await response.json();
+    
+    return lod.x.map((x, i) => {
+        const record = { elapsed_time: x, iq_fields: {} };
+        fields.forEach(field => {
+            const values = lod.series[field] ? lod.series[field].mean : null;
+            const value = values ? values[i] : null;
+            if (field.startsWith('iq_')) {
+                record.iq_fields[field.substring(3)] = value;
+            } else {
+                record[field] = value;
+            }
+        });
+        return record;
+    });
+}
+
+/**
+ * 加载完整分辨率的记录（只包含选中的字段）
+ * @param {Object} activity - 当前活动
+ * @param {Array} selectedFields - 选中的字段
+ * @param {Array|null} range - [start, end]，按当前X轴（时间秒/距离米）；null为整个活动
+ * @returns {Promise<Array>} records
+ */
+async function loadTrendRecords(activity, selectedFields, range = null) {
+    const fields = ['elapsed_time', 'distance', ...selectedFields.filter(f => f !== 'elapsed_time' && f !== 'distance')];
+    const params = new URLSearchParams({ fields: fields.join(',') });
+    if (range) {
+        params.append('range_by', xAxisMode === 'distance' ? 'distance' : 'elapsed_time');
+        params.append('start', range[0]);
+        params.append('end', range[1]);
+    }
+    
+    const response = await fetch(`${API_BASE}/activity/${activity.id}?${params}`);
+    if (!response.ok) {
+        throw new Error('加载记录失败');
+    }
+    const data = await response.json();
+    return data.records;
+}
+
+/**
+ * 放大时加载缩放范围内的完整记录，双击还原时回到概览
+ * @param {Array|null} loadedRange - 当前已加载完整记录的范围（在该范围内继续放大无需重新加载）
+ */
+function bindTrendZoom(activity, selectedFields, loadedRange) {
+    const chart = document.getElementById('trendChart');
+    chart.on('plotly_relayout', event => {
+        if (event['xaxis.autorange']) {
+            updateTrendChart(activity, selectedFields);
+            return;
+        }
+        const start = event['xaxis.range[0]'];
+        const end = event['xaxis.range[1]'];
+        if (start === undefined || end === undefined) return;
+        if (loadedRange && start >= loadedRange[0] && end <= loadedRange[1]) return;
+        
+        const seq = ++trendRequestSeq;
+        loadTrendRecords(activity, selectedFields, [start, end]).then(records => {
+            if (seq === trendRequestSeq) {
+                updateTrendChart(activity, selectedFields, records, [start, end]);
+            }
+        }).catch(error => console.error('Failed to load zoomed records:', error));
+    });
+}
+
+/**
+ * 绘制趋势图
+ * @param {Object} activity - 当前活动（详情页加载的头部，带 record_count）
+ * @param {Array} selectedFields - 选中的字段
+ * @param {Array|null} records - 要绘制的记录；null时加载概览
+ * @param {Array|null} xRange - records 为缩放范围内的完整记录时的X轴范围
+ */
+function updateTrendChart(activity, selectedFields, records = null, xRange = null) {
+    if (!activity || !activity.record_count) {
         document.getElementById('trendChart').innerHTML = '<p class="text-center text-muted">无数据</p>';
         return;
     }
     
-    const records = activity.records;
+    // 概览：只加载与图表宽度相当的点数，失败时退回（只含选中字段的）完整记录
+    if (records === null) {
+        const seq = ++trendRequestSeq;
+        loadTrendLodRecords(activity, selectedFields)
+            .catch(error => {
+                console.error('LOD trend chart failed:', error);
+                return loadTrendRecords(activity, selectedFields);
+            })
+            .then(loaded => {
+                if (seq === trendRequestSeq) {
+                    updateTrendChart(activity, selectedFields, loaded);
+                }
+            })
+            .catch(error => console.error('Failed to load trend data:', error));
+        return;
+    }
+    
     const traces = [];
     
     // 根据X轴模式选择数据源
@@ -1273,7 +1381,13 @@ function updateTrendChart(activity, selectedFields) {
     // 配置选项
     const config = createPlotlyConfig(`${activity.name}_trend`);
     
-    Plotly.newPlot('trendChart', traces, layout, config);
+    if (xRange) {
+        layout.xaxis.range = xRange;
+    }
+    
+    Plotly.newPlot('trendChart', traces, layout, config).then(() => {
+        bindTrendZoom(activity, selectedFields, xRange);
+    });
 }
 
 // ==================== 渲染每圈数据表格 ====================
@@ -1384,27 +1498,21 @@ async function loadCompareFieldSelector() {
     container.innerHTML = '<p class="text-muted">正在加载字段...</p>';
     
     try {
-        // 获取所有选中活动的元数据
+        // 所有选中活动的字段并集（后端由字段索引计算，不加载活动数据）
         const activityIds = Array.from(state.selectedActivityIds);
-        const metadataPromises = activityIds.map(id => 
-            fetch(`${API_BASE}/activity/${id}`).then(r => r.json())
-        );
-        
-        const activities = await Promise.all(metadataPromises);
-        
-        // 合并所有字段（并集）
-        const allFieldsSet = new Set();
-        const allIQFieldsSet = new Set();
-        activities.forEach(activity => {
-            if (activity.available_fields) {
-                activity.available_fields.forEach(field => allFieldsSet.add(field));
-            }
-            if (activity.available_iq_fields) {
-                activity.available_iq_fields.forEach(field => allIQFieldsSet.add('iq_' + field));
-            }
+        const response = await fetch(`${API_BASE}/activities/fields`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ activity_ids: activityIds })
         });
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        const union = await response.json();
         
-        const allFields = Array.from(allFieldsSet).concat(Array.from(allIQFieldsSet));
+        const allFields = union.available_fields.concat(
+            union.available_iq_fields.map(field => 'iq_' + field)
+        );
         
         if (allFields.length === 0) {
             container.innerHTML = '<p class="text-muted">没有可用的字段</p>';
@@ -1481,7 +1589,8 @@ async function updateCompareChart() {
             body: JSON.stringify({
                 activity_ids: Array.from(state.selectedActivityIds),
                 fields: selectedFields,
-                align_by: alignBy
+                align_by: alignBy,
+                max_points: Math.max(200, document.getElementById('compareChart').clientWidth || 1000)
             })
         });
         
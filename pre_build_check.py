@@ -90,6 +90,25 @@ def run_checks():
         'backend/csv_exporter.py',
         'backend/models.py',
         'backend/hr_csv_merge.py',
+        'backend/index_journal.py',
+        'backend/store_io.py',
+        'backend/column_store.py',
+        'backend/lod.py',
+        'backend/migrations.py',
+        'backend/search_index.py',
+        'backend/rollups.py',
+        'backend/serializer.py',
+        'backend/write_behind.py',
+        'backend/cold_storage.py',
+        'backend/snapshot.py',
+        'backend/store_cli.py',
+        'backend/integrity.py',
+        'backend/column_codecs.py',
+        'backend/record_cache.py',
+        'backend/raw_store.py',
+        'backend/reprocess.py',
+        'backend/field_index.py',
+        'backend/lap_index.py',
     ]
     
     for module in backend_modules:
@@ -138,6 +157,7 @@ def run_checks():
             'backend.fit_parser',
             'backend.data_store',
             'backend.csv_exporter',
+            'orjson',
         ]
         
         for imp in required_imports:
@@ -0,0 +1,62 @@
+"""
+Backend unit tests for cold_storage.py
+Tests packing activity files into compressed archives and restoring them
+"""
+import io
+import sys
+import tarfile
+from pathlib import Path
+
+import pytest
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'backend'))
+
+from cold_storage import pack_archive, read_archive_member, unpack_archive
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = []
+    for name, data in (("a1.json", b'{"id": "a1"}'), ("a1.rec", b"FCOL" + b"[1,2,3]" * 1000)):
+        path = tmp_path / name
+        path.write_bytes(data)
+        paths.append(path)
+    return paths
+
+
+class TestColdArchive:
+    """Archives are compressed and restore the original bytes"""
+
+    def test_pack_and_unpack_roundtrip(self, tmp_path, files):
+        archive = tmp_path / "a1.cold"
+        pack_archive(archive, files)
+        assert archive.stat().st_size < sum(p.stat().st_size for p in files)
+
+        target = tmp_path / "restored"
+        target.mkdir()
+        written = unpack_archive(archive, target)
+        assert [p.name for p in written] == ["a1.rec", "a1.json"]  # header last
+        for original in files:
+            assert (target / original.name).read_bytes() == original.read_bytes()
+
+    def test_read_member_without_extracting(self, tmp_path, files):
+        archive = tmp_path / "a1.cold"
+        pack_archive(archive, files)
+        assert read_archive_member(archive, "a1.json") == b'{"id": "a1"}'
+        with pytest.raises(KeyError):
+            read_archive_member(archive, "a1.lod")
+
+    def test_unpack_ignores_member_paths(self, tmp_path):
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+            info = tarfile.TarInfo("../../evil.json")
+            info.size = 2
+            tar.addfile(info, io.BytesIO(b"{}"))
+        archive = tmp_path / "evil.cold"
+        archive.write_bytes(buffer.getvalue())
+
+        target = tmp_path / "out"
+        target.mkdir()
+        unpack_archive(archive, target)
+        assert [p.name for p in target.iterdir()] == ["evil.json"]
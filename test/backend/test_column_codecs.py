@@ -0,0 +1,138 @@
+"""
+Backend unit tests for column_codecs.py
+Tests lossless per-column encodings of record data
+"""
+import random
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'backend'))
+
+import column_codecs
+from column_codecs import decode_column, encode_column
+from column_store import read_column_pack, records_to_columns, write_column_pack
+from models import Record
+from serializer import dumps
+
+
+@pytest.fixture(autouse=True)
+def verify_encoding(monkeypatch):
+    monkeypatch.setattr(column_codecs, "VERIFY_ENCODING", True)
+
+
+def roundtrip(values):
+    encoded = encode_column(values)
+    decoded = decode_column(encoded)
+    assert decoded == values
+    assert [type(v) for v in decoded] == [type(v) for v in values]
+    return encoded
+
+
+class TestEncodings:
+    """Each column gets the shortest lossless encoding"""
+
+    def test_monotonic_floats_use_delta(self):
+        encoded = roundtrip([round(i * 0.1, 1) for i in range(1000)])
+        assert encoded["c"] == "delta"
+        assert encoded["s"] == 10
+        assert len(dumps(encoded)) < 100
+
+    def test_steady_intervals_collapse(self):
+        assert len(dumps(roundtrip([float(i) for i in range(3600)]))) < 100
+        accelerating = roundtrip([i * i for i in range(1000)])
+        assert accelerating["o"] == 2
+
+    def test_slowly_changing_ints(self):
+        random.seed(0)
+        hr = [140]
+        for _ in range(2000):
+            hr.append(hr[-1] + random.choice([-1, 0, 0, 1]))
+        encoded = roundtrip(hr)
+        assert len(dumps(encoded)) * 5 < len(dumps(hr))
+
+    def test_timestamps(self):
+        start = datetime(2025, 6, 1, 7, 0, 0)
+        plain = [(start + timedelta(seconds=i)).isoformat() for i in range(600)]
+        encoded = roundtrip(plain)
+        assert encoded["c"] == "ts"
+        assert len(dumps(encoded)) < 100
+
+        roundtrip([(start + timedelta(seconds=i, microseconds=i * 250)).isoformat() + "Z" for i in range(600)])
+        roundtrip([(start + timedelta(seconds=i)).isoformat() + "+08:00" for i in range(600)])
+
+    def test_low_cardinality_uses_dictionary(self):
+        encoded = roundtrip(["run", "walk", "run", None] * 100)
+        assert encoded["c"] == "dict"
+
+    def test_nulls_preserved(self):
+        values = [None, 1.5, 2.0, None, None, 3.25] * 50
+        assert roundtrip(values)["c"] in ("delta", "dict")
+
+    def test_full_precision_floats(self):
+        random.seed(1)
+        roundtrip([random.random() for _ in range(500)])
+
+    def test_int_and_float_types_kept(self):
+        roundtrip([1, 1.0, 2, 2.0] * 20)
+        roundtrip([True, False, 1, 0] * 20)
+
+    def test_wide_ranges_and_negative_values(self):
+        roundtrip([(-1) ** i * i * 10 ** 9 for i in range(100)])
+        roundtrip([-i for i in range(100)])
+
+    def test_verification_falls_back_to_plain(self, monkeypatch, capsys):
+        values = list(range(100))
+        monkeypatch.setitem(column_codecs._DECODERS, "delta", lambda encoded: values[::-1])
+        assert encode_column(values) == values
+        assert "警告" in capsys.readouterr().out
+
+        monkeypatch.setattr(column_codecs, "VERIFY_ENCODING", False)
+        assert encode_column(values)["c"] == "delta"
+
+    def test_short_and_unencodable_columns_stay_plain(self):
+        assert encode_column([1, 2, 3]) == [1, 2, 3]
+        nested = [[5, 10]] * 20
+        assert encode_column(nested) == nested
+        assert decode_column([1, None]) == [1, None]
+
+
+class TestPackSize:
+    """Encoded packs are much smaller than plain JSON columns"""
+
+    def test_typical_activity_shrinks(self, tmp_path):
+        random.seed(2)
+        start = datetime(2025, 6, 1, 7, 0, 0)
+        distance, heart_rate = 0.0, 140
+        records = []
+        for i in range(3600):
+            distance = round(distance + random.uniform(2.8, 3.0), 2)
+            heart_rate += random.choice([-1, 0, 0, 0, 1])
+            records.append(Record(
+                timestamp=start + timedelta(seconds=i),
+                elapsed_time=float(i),
+                distance=distance,
+                heart_rate=heart_rate,
+                cadence=random.choice([88, 89, 90]),
+                altitude=round(100 + i * 0.01, 1),
+                iq_fields={"dr_gct": random.randint(235, 245)},
+            ))
+        columns = records_to_columns(records)
+        path = tmp_path / "a.rec"
+        write_column_pack(path, columns, len(records), chunked=True)
+
+        assert read_column_pack(path) == (len(records), columns)
+        plain_size = sum(len(dumps(values)) for values in columns.values())
+        assert path.stat().st_size * 5 < plain_size
+
+    def test_unencoded_pack_still_readable(self, tmp_path, monkeypatch):
+        import column_store
+        monkeypatch.setattr(column_store, "encode_column", lambda values: values)
+        columns = {"heart_rate": list(range(100))}
+        write_column_pack(tmp_path / "a.rec", columns, 100, chunked=True)
+        monkeypatch.undo()
+
+        assert read_column_pack(tmp_path / "a.rec") == (100, columns)
@@ -0,0 +1,1156 @@
+"""
+Backend unit tests for data_store.py
+Tests index persistence (snapshot + journal) and activity storage
+"""
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'backend'))
+
+import data_store
+from data_store import DataStore
+from migrations import ACTIVITY_SCHEMA_VERSION
+from models import Activity, Record, Session
+
+
+def make_activity(activity_id: str, name: str = "run", seconds: int = 60) -> Activity:
+    """Build a small synthetic activity"""
+    start = datetime(2025, 6, 1, 7, 0, 0)
+    records = [
+        Record(
+            timestamp=start + timedelta(seconds=i),
+            elapsed_time=float(i),
+            distance=float(i * 3),
+            heart_rate=140 + i % 10,
+            iq_fields={"dr_gct": 240 + i % 5},
+        )
+        for i in range(seconds + 1)
+    ]
+    return Activity(
+        id=activity_id,
+        name=name,
+        file_name=f"{name}.fit",
+        created_at=start,
+        session=Session(start_time=start, total_elapsed_time=float(seconds),
+                        total_distance=float(seconds * 3), avg_speed=3.0),
+        records=records,
+        available_fields=["distance", "elapsed_time", "heart_rate"],
+        available_iq_fields=["dr_gct"],
+    )
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DataStore(str(tmp_path / "data"))
+
+
+def shard_dir(store: DataStore) -> Path:
+    """Date shard holding activities built by make_activity()"""
+    return store.activities_dir / "2025" / "06"
+
+
+def stored_files(store: DataStore):
+    return [p for p in store.activities_dir.rglob("*") if p.is_file()]
+
+
+class TestIndexJournal:
+    """Index mutations are journaled and replayed on load"""
+
+    def test_save_appends_to_journal_without_rewriting_snapshot(self, store):
+        snapshot_before = store.index_file.read_bytes()
+        store.save_activity(make_activity("a1"))
+        store.save_activity(make_activity("a2"))
+
+        assert store.index_file.read_bytes() == snapshot_before
+        lines = store.journal_file.read_text(encoding='utf-8').splitlines()
+        assert [json.loads(l)["op"] for l in lines] == ["put", "put"]
+
+    def test_journal_replayed_on_load(self, store):
+        store.save_activity(make_activity("a1", "first"))
+        store.save_activity(make_activity("a2", "second"))
+        store.delete_activity("a1")
+        store.save_activity(make_activity("a2", "renamed"))
+
+        reopened = DataStore(str(store.data_dir))
+        activities, total = reopened.list_activities()
+        assert total == 1
+        assert activities[0].id == "a2"
+        assert activities[0].name == "renamed"
+
+    def test_torn_journal_tail_is_ignored_and_overwritten(self, store):
+        store.save_activity(make_activity("a1"))
+        with open(store.journal_file, 'ab') as f:
+            f.write(b'{"op": "put", "meta": {"id": "bro')
+
+        reopened = DataStore(str(store.data_dir))
+        assert [a.id for a in reopened.list_activities()[0]] == ["a1"]
+
+        reopened.save_activity(make_activity("a2"))
+        again = DataStore(str(store.data_dir))
+        assert sorted(a.id for a in again.list_activities()[0]) == ["a1", "a2"]
+
+    def test_compaction_writes_snapshot_and_clears_journal(self, store):
+        store.INDEX_COMPACT_MIN_OPS = 3
+        for i in range(3):
+            store.save_activity(make_activity(f"a{i}"))
+
+        assert store.journal_file.read_bytes() == b""
+        snapshot = json.loads(store.index_file.read_text(encoding='utf-8'))
+        assert [a["id"] for a in snapshot["activities"]] == ["a2", "a1", "a0"]
+
+    def test_batch_commits_with_single_journal_append(self, store, monkeypatch):
+        activities = [make_activity(f"a{i}") for i in range(5)]
+        calls = []
+        real_append = store._journal.append
+        monkeypatch.setattr(store._journal, "append", lambda ops: (calls.append(len(ops)), real_append(ops)))
+
+        with store.batch():
+            for activity in activities:
+                store.save_activity(activity)
+
+        assert calls == [5]
+        reopened = DataStore(str(store.data_dir))
+        assert reopened.list_activities()[1] == 5
+
+    def test_put_and_drop_entries_leave_files_alone(self, store):
+        store.save_activity(make_activity("a"))
+        meta = store.get_activity_meta("a")
+        assert store.drop_entries(["a", "missing"]) == ["a"]
+        assert list(store.iter_entries()) == []
+        assert (shard_dir(store) / "a.json").exists()
+
+        store.put_entries([meta])
+        assert store.has_activity_files("a")
+        reopened = DataStore(str(store.data_dir))
+        assert [m.id for m in reopened.iter_entries()] == ["a"]
+
+    def test_new_activities_listed_first(self, store):
+        store.save_activity(make_activity("old"))
+        store.save_activity(make_activity("new"))
+        index = store._load_index()
+        assert [a.id for a in index.activities] == ["new", "old"]
+
+
+def _save_many(data_dir: str, prefix: str, count: int):
+    """Worker process: import activities into a shared store"""
+    store = DataStore(data_dir)
+    for i in range(count):
+        store.save_activity(make_activity(f"{prefix}{i}", seconds=5))
+
+
+class TestMultiProcess:
+    """Several DataStore instances/processes share one data directory"""
+
+    def test_other_instance_changes_are_detected(self, store):
+        other = DataStore(str(store.data_dir))
+        assert other.list_activities()[1] == 0
+
+        store.save_activity(make_activity("a1"))
+        assert [a.id for a in other.list_activities()[0]] == ["a1"]
+
+        other.delete_activity("a1")
+        assert store.list_activities()[1] == 0
+
+    def test_compaction_by_other_instance_is_detected(self, store):
+        other = DataStore(str(store.data_dir))
+        store.save_activity(make_activity("a1"))
+        other.INDEX_COMPACT_MIN_OPS = 1
+        other.save_activity(make_activity("a2"))
+        assert other.journal_file.read_bytes() == b""
+
+        store.save_activity(make_activity("a3"))
+        assert sorted(a.id for a in store.list_activities()[0]) == ["a1", "a2", "a3"]
+
+    def test_activity_files_written_atomically(self, store):
+        store.save_activity(make_activity("a1"))
+        leftovers = [p.name for p in store.activities_dir.iterdir() if p.suffix == ".tmp"]
+        assert leftovers == []
+        assert store.get_activity("a1").name == "run"
+
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="requires fork")
+    def test_concurrent_processes_do_not_lose_updates(self, store):
+        ctx = multiprocessing.get_context("fork")
+        workers = [
+            ctx.Process(target=_save_many, args=(str(store.data_dir), prefix, 15))
+            for prefix in ("p", "q", "r")
+        ]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join(timeout=60)
+            assert w.exitcode == 0
+
+        reopened = DataStore(str(store.data_dir))
+        assert reopened.list_activities(limit=100)[1] == 45
+
+
+class TestFieldSelectiveLoading:
+    """Record data is stored column-wise and can be loaded per field"""
+
+    def test_roundtrip_preserves_records(self, store):
+        original = make_activity("a1")
+        store.save_activity(original)
+
+        loaded = store.get_activity("a1")
+        assert loaded.model_dump() == original.model_dump()
+
+    def test_header_file_has_no_records(self, store):
+        store.save_activity(make_activity("a1"))
+        header = json.loads((shard_dir(store) / "a1.json").read_text(encoding='utf-8'))
+        assert "records" not in header
+        assert header["schema_version"] == ACTIVITY_SCHEMA_VERSION
+        assert header["record_count"] == 61
+        assert (shard_dir(store) / "a1.rec").exists()
+
+    def test_get_activity_with_field_subset(self, store):
+        store.save_activity(make_activity("a1"))
+
+        loaded = store.get_activity("a1", fields=["heart_rate", "iq_dr_gct"])
+        assert len(loaded.records) == 61
+        assert loaded.records[3].heart_rate == 143
+        assert loaded.records[3].iq_fields == {"dr_gct": 243}
+        assert loaded.records[3].distance is None
+        assert loaded.records[3].timestamp is None
+
+    def test_get_record_columns_reads_only_requested(self, store):
+        store.save_activity(make_activity("a1"))
+        columns = store.get_record_columns("a1", ["distance", "iq_dr_gct", "power"])
+        assert set(columns) == {"distance", "iq_dr_gct"}
+        assert columns["distance"][:3] == [0.0, 3.0, 6.0]
+        assert store.get_record_columns("missing", ["distance"]) is None
+
+    def test_legacy_single_file_activity_still_readable(self, store):
+        legacy = make_activity("old")
+        (store.activities_dir / "old.json").write_text(
+            json.dumps(legacy.model_dump(mode='json')), encoding='utf-8'
+        )
+
+        assert store.get_activity("old").model_dump() == legacy.model_dump()
+        assert store.get_record_columns("old", ["heart_rate"])["heart_rate"][0] == 140
+
+    def test_payload_matches_model_dump(self, store):
+        store.save_activity(make_activity("a1"))
+
+        expected = store.get_activity("a1").model_dump(mode='json')
+        assert store.get_activity_payload("a1") == expected
+        subset = store.get_activity_payload("a1", fields=["heart_rate", "iq_dr_gct"])
+        assert subset == store.get_activity("a1", fields=["heart_rate", "iq_dr_gct"]).model_dump(mode='json')
+        assert store.get_activity_payload("missing") is None
+
+    def test_payload_validates_header_missing_fields(self, store):
+        store.save_activity(make_activity("a1"))
+        header_file = shard_dir(store) / "a1.json"
+        header = json.loads(header_file.read_text(encoding='utf-8'))
+        del header["available_iq_fields"]
+        header_file.write_text(json.dumps(header), encoding='utf-8')
+
+        payload = store.get_activity_payload("a1")
+        assert payload["available_iq_fields"] == []
+        assert payload == store.get_activity("a1").model_dump(mode='json')
+
+    def test_delete_removes_record_file(self, store):
+        store.save_activity(make_activity("a1"))
+        store.delete_activity("a1")
+        assert stored_files(store) == []
+
+
+class TestIqSchema:
+    """IQ field names are declared once per activity, not once per record"""
+
+    def test_columns_to_table(self):
+        from column_store import columns_to_table
+        columns = {"heart_rate": [140, 141, 142], "iq_dr_gct": [240, None, 242], "iq_dr_vo": [None, 8.1, None]}
+        assert columns_to_table(columns, 3) == {
+            "count": 3,
+            "columns": {"heart_rate": [140, 141, 142]},
+            "iq_schema": ["dr_gct", "dr_vo"],
+            "iq_columns": [[240, None, 242], [None, 8.1, None]],
+        }
+
+    def test_iq_keys_shared_across_records(self, store):
+        store.save_activity(make_activity("a1"))
+        records = store.get_activity("a1").records
+        keys = [next(iter(record.iq_fields)) for record in records]
+        assert all(key is keys[0] for key in keys)
+
+    def test_columns_layout_matches_records(self, store):
+        store.save_activity(make_activity("a1"))
+        records = store.get_activity_payload("a1")["records"]
+        payload = store.get_activity_payload("a1", fields=["heart_rate", "iq_dr_gct"], layout="columns")
+
+        table = payload["records"]
+        assert table["count"] == 61
+        assert table["iq_schema"] == ["dr_gct"]
+        assert table["iq_columns"] == [[r["iq_fields"]["dr_gct"] for r in records]]
+        assert table["columns"] == {"heart_rate": [r["heart_rate"] for r in records]}
+        assert payload["available_iq_fields"] == ["dr_gct"]
+
+    def test_none_layout_skips_records(self, store):
+        store.save_activity(make_activity("a1"))
+        full = store.get_activity_payload("a1")
+        payload = store.get_activity_payload("a1", layout="none")
+        assert (payload["records"], payload["record_count"]) == ([], 61)
+        assert payload["session"] == full["session"]
+
+    def test_record_table_in_range(self, store):
+        store.save_activity(make_activity("a1"))
+        table = store.get_record_table("a1", ["elapsed_time", "iq_dr_gct"], ("elapsed_time", 10, 12))
+        assert table["columns"]["elapsed_time"] == [10.0, 11.0, 12.0]
+        assert table["iq_columns"] == [[240, 241, 242]]
+        assert store.get_record_table("missing") is None
+
+
+class TestTrustedLoad:
+    """Store-written records skip revalidation; anything else is fully validated"""
+
+    def test_trusted_load_matches_validated_load(self, store, monkeypatch):
+        store.save_activity(make_activity("a1"))
+        assert store._read_activity_data("a1", check_trusted=True)["trusted"] is True
+        trusted = store.get_activity("a1")
+
+        monkeypatch.setattr(DataStore, "TRUSTED_LOAD", False)
+        assert trusted.model_dump() == store.get_activity("a1").model_dump()
+
+    def test_utc_timestamps_restored(self):
+        from column_store import columns_to_records
+        columns = {"timestamp": ["2025-06-01T07:00:00Z", None], "heart_rate": [140, 141]}
+        trusted = columns_to_records(columns, 2, trusted=True)
+        assert [r.model_dump() for r in trusted] == [r.model_dump() for r in columns_to_records(columns, 2)]
+
+    def test_slot_setters_self_check(self, monkeypatch):
+        import column_store
+        assert column_store._SLOT_SETTERS is not None
+        columns = {"timestamp": ["2025-06-01T07:00:00Z"], "heart_rate": [140], "iq_dr_gct": [250.0]}
+        fast = column_store.columns_to_records(columns, 1, trusted=True)
+
+        monkeypatch.setattr(column_store, "_SLOT_SETTERS", None)
+        assert column_store.columns_to_records(columns, 1, trusted=True) == fast
+
+    def test_checksum_mismatch_falls_back_to_validation(self, store):
+        store.save_activity(make_activity("a1"))
+        header_file = shard_dir(store) / "a1.json"
+        header = json.loads(header_file.read_text(encoding='utf-8'))
+        header["records_checksum"] += 1
+        header_file.write_text(json.dumps(header), encoding='utf-8')
+
+        assert store._read_activity_data("a1", check_trusted=True)["trusted"] is False
+        assert store.get_activity("a1").model_dump() == make_activity("a1").model_dump()
+
+    def test_header_without_checksum_is_not_trusted(self, store):
+        store.save_activity(make_activity("a1"))
+        header_file = shard_dir(store) / "a1.json"
+        header = json.loads(header_file.read_text(encoding='utf-8'))
+        del header["records_checksum"]
+        header_file.write_text(json.dumps(header), encoding='utf-8')
+
+        assert store._read_activity_data("a1", check_trusted=True)["trusted"] is False
+
+    def test_corrupted_records_fail_safely(self, tmp_path):
+        store = DataStore(str(tmp_path / "data"), record_cache_mb=0)
+        store.save_activity(make_activity("a1"))
+        records_file = shard_dir(store) / "a1.rec"
+        raw = bytearray(records_file.read_bytes())
+        raw[-2] ^= 0x01
+        records_file.write_bytes(bytes(raw))
+
+        assert store.get_activity("a1") is None
+
+
+class TestIndexRebuild:
+    """Index rebuild reads headers only and can run in a worker pool"""
+
+    def _write_legacy(self, store, activity):
+        (store.activities_dir / f"{activity.id}.json").write_text(
+            json.dumps(activity.model_dump(mode='json'), ensure_ascii=False, indent=2), encoding='utf-8'
+        )
+
+    def test_read_activity_header_skips_legacy_records(self, store):
+        from data_store import read_activity_header
+        self._write_legacy(store, make_activity("old"))
+
+        header = read_activity_header(store.activities_dir / "old.json")
+        assert "records" not in header
+        assert header["available_iq_fields"] == ["dr_gct"]
+
+    @pytest.mark.parametrize("parallel_min_files", [1, 1000])
+    def test_rebuild_reports_progress_and_skipped(self, store, parallel_min_files):
+        store.save_activity(make_activity("new"))
+        self._write_legacy(store, make_activity("old"))
+        (store.activities_dir / "broken.json").write_text("{not json", encoding='utf-8')
+
+        store.REBUILD_PARALLEL_MIN_FILES = parallel_min_files
+        progress = []
+        index, report = store.rebuild_index(max_workers=2, progress_callback=lambda d, t: progress.append((d, t)))
+
+        assert sorted(a.id for a in index.activities) == ["new", "old"]
+        assert report["rebuilt"] == 2
+        assert [s["file"] for s in report["skipped"]] == ["broken.json"]
+        assert progress[-1] == (3, 3)
+
+    def test_corrupted_index_is_rebuilt_on_load(self, store):
+        store.save_activity(make_activity("a1"))
+        store.index_file.write_text("{corrupted", encoding='utf-8')
+        store.journal_file.write_bytes(b"")
+
+        reopened = DataStore(str(store.data_dir))
+        assert [a.id for a in reopened.list_activities()[0]] == ["a1"]
+
+
+class TestBulkMutations:
+    """Batch delete and bulk metadata updates use one index commit"""
+
+    def test_delete_missing_activity_returns_false(self, store):
+        assert store.delete_activity("missing") is False
+
+    def test_delete_activities_reports_per_id(self, store, monkeypatch):
+        for i in range(4):
+            store.save_activity(make_activity(f"a{i}"))
+        calls = []
+        real_append = store._journal.append
+        monkeypatch.setattr(store._journal, "append", lambda ops: (calls.append(len(ops)), real_append(ops)))
+
+        results = store.delete_activities(["a0", "a2", "missing", "a2"])
+
+        assert results == {"a0": True, "a2": True, "missing": False}
+        assert calls == [2]
+        assert sorted(a.id for a in store.list_activities()[0]) == ["a1", "a3"]
+        assert sorted(p.stem for p in stored_files(store)) == ["a1", "a1", "a1", "a3", "a3", "a3"]
+
+    def test_update_metadata_writes_sidecar_only(self, store):
+        store.save_activity(make_activity("a1"))
+        store.save_activity(make_activity("a2"))
+        rec_before = (shard_dir(store) / "a1.rec").stat().st_mtime_ns
+        header_before = (shard_dir(store) / "a1.json").read_bytes()
+
+        results = store.update_activities_metadata({
+            "a1": {"name": "Tempo", "sport": "trail_running", "id": "ignored"},
+            "missing": {"name": "x"},
+        })
+
+        assert results == {"a1": True, "missing": False}
+        assert (shard_dir(store) / "a1.rec").stat().st_mtime_ns == rec_before
+        assert (shard_dir(store) / "a1.json").read_bytes() == header_before
+        assert (shard_dir(store) / "a1.meta").exists()
+        meta = {a.id: a for a in store.list_activities()[0]}["a1"]
+        assert (meta.name, meta.sport) == ("Tempo", "trail_running")
+        activity = store.get_activity("a1")
+        assert activity.name == "Tempo"
+        assert activity.session.sport == "trail_running"
+        assert len(activity.records) == 61
+
+    def test_update_metadata_leaves_legacy_file_alone(self, store):
+        legacy = make_activity("old")
+        legacy_file = store.activities_dir / "old.json"
+        legacy_file.write_text(json.dumps(legacy.model_dump(mode='json')), encoding='utf-8')
+        before = legacy_file.read_bytes()
+        store.rebuild_index()
+
+        assert store.update_activities_metadata({"old": {"name": "renamed"}}) == {"old": True}
+        assert legacy_file.read_bytes() == before
+        activity = store.get_activity("old")
+        assert activity.name == "renamed"
+        assert activity.records == legacy.records
+
+
+class TestLevelOfDetail:
+    """Envelopes are precomputed on save and served by pixel width"""
+
+    def test_lod_file_written_on_save(self, store):
+        store.save_activity(make_activity("a1", seconds=600))
+        assert (shard_dir(store) / "a1.lod").exists()
+
+    def test_lod_picks_level_for_width(self, store):
+        store.save_activity(make_activity("a1", seconds=600))
+
+        lod = store.get_activity_lod("a1", ["heart_rate", "iq_dr_gct"], width=50)
+        assert lod["level_sec"] == 30
+        assert lod["points"] == 21
+        assert len(lod["series"]["iq_dr_gct"]["max"]) == 21
+
+    def test_lod_returns_raw_when_small(self, store):
+        store.save_activity(make_activity("a1", seconds=60))
+        lod = store.get_activity_lod("a1", ["heart_rate"], width=1000)
+        assert lod["level_sec"] == 0
+        assert lod["points"] == 61
+        assert lod["series"]["heart_rate"]["mean"][:2] == [140, 141]
+
+    def test_lod_computed_for_legacy_activity(self, store):
+        legacy = make_activity("old", seconds=600)
+        (store.activities_dir / "old.json").write_text(
+            json.dumps(legacy.model_dump(mode='json')), encoding='utf-8'
+        )
+        assert store.get_activity_lod("old", ["heart_rate"], width=50)["level_sec"] == 30
+        assert store.get_activity_lod("missing", ["heart_rate"], width=50) is None
+
+
+class TestChunkedRecords:
+    """Record files are split into time chunks with zone maps for range reads"""
+
+    def test_records_split_into_time_chunks(self, store):
+        store.save_activity(make_activity("a1", seconds=1800))
+        with open(shard_dir(store) / "a1.rec", "rb") as f:
+            raw = f.read()
+        header = json.loads(raw[8:8 + int.from_bytes(raw[4:8], "little")])
+
+        assert header["count"] == 1801
+        assert [(c["start"], c["count"]) for c in header["chunks"]] == [(0, 600), (600, 600), (1200, 600), (1800, 1)]
+        assert header["chunks"][1]["zones"]["elapsed_time"] == [600.0, 1199.0]
+        assert header["chunks"][1]["zones"]["distance"] == [1800.0, 3597.0]
+        assert "timestamp" not in header["chunks"][1]["zones"]
+
+    def test_range_read_skips_other_chunks(self, store, monkeypatch):
+        import column_store
+        store.save_activity(make_activity("a1", seconds=1800))
+        loaded = []
+        real_loads = column_store.loads
+        monkeypatch.setattr(column_store, "loads", lambda data: loaded.append(len(data)) or real_loads(data))
+
+        columns = store.get_record_columns("a1", ["heart_rate"], ("elapsed_time", 650, 700))
+        assert len(columns["heart_rate"]) == 51
+        assert columns["heart_rate"][0] == 140
+        # file header + elapsed_time and heart_rate of the single overlapping chunk
+        assert len(loaded) == 3
+
+    def test_range_payload_matches_full_payload_slice(self, store):
+        store.save_activity(make_activity("a1", seconds=1800))
+        full = store.get_activity_payload("a1")
+
+        payload = store.get_activity_payload("a1", record_range=("elapsed_time", 590.0, 1210.0))
+        assert payload["records"] == full["records"][590:1211]
+        by_distance = store.get_activity_payload("a1", record_range=("distance", 3000.0, None))
+        assert by_distance["records"] == full["records"][1000:]
+        assert store.get_activity("a1", record_range=("elapsed_time", None, 9.5)).records == \
+            store.get_activity("a1").records[:10]
+
+    def test_range_on_unchunked_and_legacy_files(self, store):
+        import column_store
+        activity = make_activity("a1", seconds=1200)
+        store.save_activity(activity)
+        columns = column_store.records_to_columns(activity.records)
+        column_store.write_column_pack(shard_dir(store) / "a1.rec", columns, len(activity.records))
+        write_legacy_activity(store, make_activity("old", seconds=1200))
+
+        for activity_id in ("a1", "old"):
+            columns = store.get_record_columns(activity_id, ["elapsed_time"], ("elapsed_time", 700, 800))
+            assert columns["elapsed_time"] == [float(t) for t in range(700, 801)]
+
+    def test_lod_for_zoom_range(self, store):
+        store.save_activity(make_activity("a1", seconds=3600))
+
+        lod = store.get_activity_lod("a1", ["heart_rate"], width=1000, record_range=("elapsed_time", 600, 900))
+        assert lod["level_sec"] == 0
+        assert lod["x"][0] == 600 and lod["x"][-1] == 900
+        zoomed = store.get_activity_lod("a1", ["heart_rate"], width=50, record_range=("elapsed_time", 600, 1800))
+        assert zoomed["level_sec"] == 30
+        assert zoomed["x"][0] == 600
+
+
+def write_legacy_activity(store: DataStore, activity: Activity):
+    """Write an activity in the schema 1 layout (full JSON with records)"""
+    (store.activities_dir / f"{activity.id}.json").write_text(
+        json.dumps(activity.model_dump(mode='json'), indent=2), encoding='utf-8'
+    )
+
+
+class TestMigration:
+    """Old activities stay readable and are rewritten in the background"""
+
+    def test_find_outdated_activities(self, store):
+        store.save_activity(make_activity("new"))
+        write_legacy_activity(store, make_activity("old"))
+        store.rebuild_index()
+
+        assert store.find_outdated_activities() == ["old"]
+
+    def test_migrate_legacy_activity(self, store):
+        original = make_activity("old")
+        write_legacy_activity(store, original)
+        store.rebuild_index()
+
+        assert store.migrate_activity("old") is True
+        header = json.loads((shard_dir(store) / "old.json").read_text(encoding='utf-8'))
+        assert header["schema_version"] == ACTIVITY_SCHEMA_VERSION
+        assert (shard_dir(store) / "old.rec").exists()
+        assert (shard_dir(store) / "old.lod").exists()
+        assert not (store.activities_dir / "old.json").exists()
+        assert store.get_activity("old").model_dump() == original.model_dump()
+        assert store.migrate_activity("old") is False
+
+    def test_migrate_adds_missing_lod(self, store):
+        store.save_activity(make_activity("a1"))
+        header_file = shard_dir(store) / "a1.json"
+        header = json.loads(header_file.read_text(encoding='utf-8'))
+        header["schema_version"] = 2
+        header_file.write_text(json.dumps(header), encoding='utf-8')
+        (shard_dir(store) / "a1.lod").unlink()
+
+        assert store.find_outdated_activities() == ["a1"]
+        assert store.get_activity_lod("a1", ["heart_rate"], width=1000)["points"] == 61
+        assert store.migrate_activity("a1") is True
+        assert (shard_dir(store) / "a1.lod").exists()
+
+    def test_migrate_skips_deleted_activity(self, store):
+        write_legacy_activity(store, make_activity("old"))
+        store.rebuild_index()
+        store.delete_activity("old")
+
+        assert store.migrate_activity("old") is False
+        assert list(store.activities_dir.iterdir()) == []
+
+    def test_index_lock_free_while_rewriting(self, store, monkeypatch):
+        for i in range(2):
+            write_legacy_activity(store, make_activity(f"old{i}"))
+        store.rebuild_index()
+        other = DataStore(str(store.data_dir))
+        blocked = []
+        original = store._encode_activity_files
+
+        def encode(activity):
+            # Another instance saving while files are being encoded must not wait for the batch
+            saver = threading.Thread(target=other.save_activity, args=(make_activity(f"new-{activity.id}"),))
+            saver.start()
+            saver.join(timeout=5)
+            blocked.append(saver.is_alive())
+            return original(activity)
+
+        monkeypatch.setattr(store, "_encode_activity_files", encode)
+        store.start_migration(throttle_sec=0)
+        store._migration.join(timeout=10)
+
+        assert blocked == [False, False]
+        assert store.migration_status()["migrated"] == 2
+        assert store.find_outdated_activities() == []
+        assert store.list_activities()[1] == 4
+
+    def test_edit_during_rewrite_is_kept(self, store, monkeypatch):
+        write_legacy_activity(store, make_activity("old"))
+        store.rebuild_index()
+        other = DataStore(str(store.data_dir))
+        original = store._encode_activity_files
+
+        def encode(activity):
+            other.update_activities_metadata({"old": {"name": "renamed"}})
+            return original(activity)
+
+        monkeypatch.setattr(store, "_encode_activity_files", encode)
+        assert store.migrate_activity("old") is False
+        assert store.get_activity("old").name == "renamed"
+        assert not [p for p in store.activities_dir.rglob("*.tmp")]
+        monkeypatch.undo()
+        assert store.migrate_activity("old") is True
+        assert DataStore(str(store.data_dir)).get_activity_meta("old").name == "renamed"
+
+    def test_background_worker_reports_progress(self, store):
+        for i in range(3):
+            write_legacy_activity(store, make_activity(f"old{i}"))
+        store.rebuild_index()
+        assert store.migration_status()["state"] == "idle"
+        assert store.migration_status()["pending"] is None
+
+        store.start_migration(throttle_sec=0)
+        store._migration.join(timeout=10)
+
+        status = store.migration_status()
+        assert status["state"] == "done"
+        assert status["total"] == 3
+        assert status["migrated"] == 3
+        assert status["failed"] == []
+        assert status["pending"] == 0
+        assert store.find_outdated_activities() == []
+
+
+class TestSearch:
+    """Search index follows saves, renames and deletes"""
+
+    def test_search_tracks_mutations(self, store):
+        store.save_activity(make_activity("a1", name="Tempo"))
+        store.save_activity(make_activity("a2", name="Easy"))
+        assert [a.id for a in store.search_activities("tempo")[0]] == ["a1"]
+
+        store.update_activities_metadata({"a2": {"name": "Tempo again"}})
+        store.delete_activity("a1")
+        store.save_activity(make_activity("a3", name="Tempo hills"))
+
+        activities, total = store.search_activities("tempo", fuzzy=False)
+        assert total == 2
+        assert {a.id for a in activities} == {"a2", "a3"}
+
+    def test_search_file_name_and_device(self, store):
+        store.save_activity(make_activity("a1", name="Morning"))
+        meta = store.search_activities("morning.fit")[0][0]
+        assert meta.file_name == "Morning.fit"
+        assert meta.devices == ["龙豆跑步"]
+        assert store.search_activities("龙豆")[1] == 1
+
+    def test_search_pagination(self, store):
+        for i in range(5):
+            store.save_activity(make_activity(f"a{i}", name="Easy"))
+        activities, total = store.search_activities("easy", page=2, limit=2)
+        assert total == 5
+        assert [a.id for a in activities] == ["a2", "a1"]
+
+
+class TestStatisticsRollup:
+    """Rollups follow saves, metadata updates and deletes"""
+
+    def test_rollup_tracks_mutations(self, store):
+        store.save_activity(make_activity("a1"))
+        store.save_activity(make_activity("a2"))
+        assert store.get_statistics_rollup("day")["buckets"][0]["count"] == 2
+
+        store.update_activities_metadata({"a2": {"sport": "trail_running"}})
+        store.delete_activity("a1")
+
+        result = store.get_statistics_rollup("month", by_sport=True)
+        assert [b["key"] for b in result["buckets"]] == ["2025-06"]
+        assert list(result["buckets"][0]["sports"]) == ["trail_running"]
+        stats = store.get_statistics()
+        assert stats["total_activities"] == 1
+        assert stats["sports"] == ["trail_running"]
+
+    def test_rollup_sees_other_process_changes(self, store, tmp_path):
+        store.save_activity(make_activity("a1"))
+        assert store.get_statistics()["total_activities"] == 1
+
+        DataStore(str(tmp_path / "data")).save_activity(make_activity("a2"))
+        assert store.get_statistics()["total_activities"] == 2
+
+
+class TestShardedLayout:
+    """Activity files live in activities/YYYY/MM and are located via the index"""
+
+    def test_files_sharded_by_activity_date(self, store):
+        store.save_activity(make_activity("a1"))
+        later = make_activity("a2")
+        later.session.start_time = datetime(2026, 1, 15, 7, 0, 0)
+        store.save_activity(later)
+
+        assert sorted(p.relative_to(store.activities_dir).as_posix() for p in stored_files(store)) == [
+            "2025/06/a1.json", "2025/06/a1.lod", "2025/06/a1.rec",
+            "2026/01/a2.json", "2026/01/a2.lod", "2026/01/a2.rec",
+        ]
+        assert store.get_activity("a2").session.start_time == datetime(2026, 1, 15, 7, 0, 0)
+
+    def test_resave_moves_flat_files_into_shard(self, store):
+        write_legacy_activity(store, make_activity("old"))
+        store.rebuild_index()
+        assert store.get_activity("old") is not None
+
+        store.save_activity(store.get_activity("old"))
+        assert sorted(p.name for p in stored_files(store)) == ["old.json", "old.lod", "old.rec"]
+        assert (shard_dir(store) / "old.json").exists()
+
+    def test_rebuild_index_reads_flat_and_sharded(self, store):
+        store.save_activity(make_activity("new"))
+        write_legacy_activity(store, make_activity("old"))
+
+        index, report = store.rebuild_index()
+        assert sorted(a.id for a in index.activities) == ["new", "old"]
+        assert report["skipped"] == []
+
+    def test_delete_all_removes_shards(self, store):
+        store.save_activity(make_activity("a1"))
+        write_legacy_activity(store, make_activity("old"))
+        store.rebuild_index()
+
+        assert store.delete_all_activities() == 2
+        assert list(store.activities_dir.iterdir()) == []
+
+
+@pytest.fixture
+def wb_store(tmp_path):
+    store = DataStore(str(tmp_path / "data"), write_behind=True)
+    yield store
+    store.close(timeout=5)
+
+
+def hold_writes(store: DataStore, monkeypatch):
+    """Block the background writer; returns (writer started, release) events"""
+    started = threading.Event()
+    release = threading.Event()
+    write = store._write_activity_files
+
+    def blocked_write(activity):
+        started.set()
+        release.wait(5)
+        write(activity)
+
+    monkeypatch.setattr(store, "_write_activity_files", blocked_write)
+    return started, release
+
+
+class TestWriteBehind:
+    """Saves return before the activity reaches disk"""
+
+    def test_pending_activity_served_from_memory(self, wb_store, monkeypatch):
+        _, release = hold_writes(wb_store, monkeypatch)
+        original = make_activity("a1", "pending")
+        wb_store.save_activity(original)
+
+        assert stored_files(wb_store) == []
+        assert wb_store.get_activity("a1").model_dump() == original.model_dump()
+        assert wb_store.get_activity_payload("a1") == original.model_dump(mode='json')
+        assert wb_store.get_record_columns("a1", ["heart_rate"])["heart_rate"][0] == 140
+        assert wb_store.get_activity_lod("a1", ["heart_rate"], 1000) is not None
+        assert [a.id for a in wb_store.list_activities()[0]] == ["a1"]
+
+        release.set()
+        assert wb_store.flush(timeout=5)
+        assert (shard_dir(wb_store) / "a1.json").exists()
+        assert DataStore(str(wb_store.data_dir)).get_activity("a1").model_dump() == original.model_dump()
+
+    def test_index_updates_coalesced(self, wb_store, monkeypatch):
+        started, release = hold_writes(wb_store, monkeypatch)
+        wb_store.save_activity(make_activity("a1"))
+        assert started.wait(5)
+        for i in range(2, 5):
+            wb_store.save_activity(make_activity(f"a{i}"))
+        wb_store.save_activity(make_activity("a4", "renamed"))
+
+        release.set()
+        assert wb_store.flush(timeout=5)
+        status = wb_store.write_behind_status()
+        assert status["written"] == 4
+        assert status["commits"] == 2
+        lines = wb_store.journal_file.read_text(encoding='utf-8').splitlines()
+        assert len(lines) == 4
+        assert wb_store.get_activity_meta("a4").name == "renamed"
+
+    def test_mutations_flush_first(self, wb_store):
+        wb_store.save_activity(make_activity("a1"))
+        assert wb_store.update_activities_metadata({"a1": {"name": "edited"}}) == {"a1": True}
+        wb_store.save_activity(make_activity("a2"))
+        assert wb_store.delete_activity("a2") is True
+
+        reopened = DataStore(str(wb_store.data_dir))
+        assert [a.id for a in reopened.list_activities()[0]] == ["a1"]
+        assert reopened.get_activity("a1").name == "edited"
+        assert not (shard_dir(wb_store) / "a2.json").exists()
+
+    def test_failed_write_is_retried(self, wb_store, monkeypatch):
+        write = wb_store._write_activity_files
+        calls = []
+
+        def flaky_write(activity):
+            calls.append(activity.id)
+            if len(calls) == 1:
+                raise OSError("disk unavailable")
+            write(activity)
+
+        monkeypatch.setattr(wb_store._write_behind, "retry_sec", 0.01)
+        monkeypatch.setattr(wb_store, "_write_activity_files", flaky_write)
+        wb_store.save_activity(make_activity("a1"))
+
+        assert wb_store.flush(timeout=5)
+        assert calls == ["a1", "a1"]
+        status = wb_store.write_behind_status()
+        assert status["failed"] == 1
+        assert "disk unavailable" in status["last_error"]
+        assert (shard_dir(wb_store) / "a1.json").exists()
+
+    def test_persistent_write_failure_is_abandoned(self, wb_store, monkeypatch):
+        wb_store.save_activity(make_activity("a1"))
+        assert wb_store.flush(timeout=5)
+
+        def failing_write(activity):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(wb_store._write_behind, "retry_sec", 0.01)
+        monkeypatch.setattr(wb_store, "_write_activity_files", failing_write)
+        wb_store.save_activity(make_activity("a1", "renamed"))
+        wb_store.save_activity(make_activity("a2"))
+
+        assert wb_store.delete_activity("a1") is True
+        status = wb_store.write_behind_status()
+        assert status["abandoned"] == 2
+        assert sorted(status["abandoned_ids"]) == ["a1", "a2"]
+        assert wb_store.get_activity_meta("a2") is None
+        assert wb_store.list_activities()[1] == 0
+
+    def test_mutation_times_out_instead_of_hanging(self, wb_store, monkeypatch):
+        _, release = hold_writes(wb_store, monkeypatch)
+        monkeypatch.setattr(wb_store, "FLUSH_TIMEOUT_SEC", 0.05)
+        wb_store.save_activity(make_activity("a1"))
+        with pytest.raises(TimeoutError):
+            wb_store.update_activities_metadata({"a1": {"name": "edited"}})
+        release.set()
+        assert wb_store.flush(timeout=5)
+
+    def test_close_drains_queue(self, wb_store):
+        wb_store.save_activity(make_activity("a1"))
+        assert wb_store.close(timeout=5)
+
+        assert (shard_dir(wb_store) / "a1.json").exists()
+        assert wb_store.write_behind_status() == {"enabled": False}
+        wb_store.save_activity(make_activity("a2"))  # synchronous after close
+        assert (shard_dir(wb_store) / "a2.json").exists()
+
+
+class TestTiering:
+    """Old, idle activities move to a compressed cold tier and back on access"""
+
+    def test_freeze_and_thaw_on_access(self, store):
+        original = make_activity("a1")
+        store.save_activity(original)
+
+        assert store.freeze_activity("a1") is True
+        assert sorted(p.name for p in stored_files(store)) == ["a1.cold"]
+        assert store.get_activity_meta("a1").tier == "cold"
+        assert store.freeze_activity("a1") is False
+
+        assert store.get_activity("a1").model_dump() == original.model_dump()
+        assert sorted(p.name for p in stored_files(store)) == ["a1.json", "a1.lod", "a1.rec"]
+        meta = store.get_activity_meta("a1")
+        assert meta.tier == "hot"
+        assert meta.last_accessed is not None
+
+    def test_access_times_kept_in_memory_until_persisted(self, store, monkeypatch):
+        store.save_activity(make_activity("a1"))
+        saved_at = store.get_activity_meta("a1").last_accessed
+        assert saved_at is not None
+
+        monkeypatch.setattr(store, "ACCESS_RECORD_INTERVAL_SEC", 0)
+        store.get_activity("a1")
+        store.get_activity_payload("a1")
+        store.get_activity_lod("a1", ["heart_rate"], 1000)
+        lines = store.journal_file.read_text(encoding='utf-8').splitlines()
+        assert [json.loads(l)["op"] for l in lines] == ["put"]
+
+        store.close()
+        lines = store.journal_file.read_text(encoding='utf-8').splitlines()
+        assert [json.loads(l)["op"] for l in lines] == ["put", "touch"]
+        reopened = DataStore(str(store.data_dir))
+        assert reopened.get_activity_meta("a1").last_accessed > saved_at
+
+    def test_apply_tiering_skips_recent_and_accessed(self, store):
+        store.save_activity(make_activity("old"))
+        store.save_activity(make_activity("opened"))
+        recent = make_activity("recent")
+        recent.session.start_time = datetime.now()
+        store.save_activity(recent)
+        store._commit_index_ops([{"op": "touch", "id": aid, "at": "2020-01-01T00:00:00"}
+                                 for aid in ("old", "opened", "recent")])
+        store.get_activity("opened")
+
+        report = store.apply_tiering(cold_after_days=180)
+        assert report["frozen"] == 1
+        assert {a.id: a.tier for a in store.list_activities()[0]} == {
+            "old": "cold", "opened": "hot", "recent": "hot"
+        }
+        assert report["tiers"]["cold"]["count"] == 1
+        assert report["tiers"]["cold"]["bytes"] > 0
+
+    def test_freshly_saved_old_activity_stays_hot(self, store):
+        store.save_activity(make_activity("a1"))
+        assert store.apply_tiering(cold_after_days=180)["frozen"] == 0
+
+    def test_rebuild_index_reads_cold_archives(self, store):
+        store.save_activity(make_activity("a1"))
+        store.save_activity(make_activity("a2"))
+        store.freeze_activity("a1")
+
+        index, report = store.rebuild_index()
+        assert {a.id: a.tier for a in index.activities} == {"a1": "cold", "a2": "hot"}
+        assert report["skipped"] == []
+        assert store.get_activity("a1") is not None
+
+    def test_resave_and_delete_remove_archive(self, store):
+        store.save_activity(make_activity("a1"))
+        store.save_activity(make_activity("a2"))
+        store.freeze_activity("a1")
+        store.freeze_activity("a2")
+
+        store.save_activity(make_activity("a1", "renamed"))
+        assert not (shard_dir(store) / "a1.cold").exists()
+        assert store.get_activity_meta("a1").tier == "hot"
+
+        assert store.delete_activity("a2") is True
+        assert sorted(p.name for p in stored_files(store)) == ["a1.json", "a1.lod", "a1.rec"]
+
+
+def save_overlay(store: DataStore, base_id: str, overlay_id: str, device: str = "polar_h10") -> Activity:
+    """Save an HR-merge style overlay of base_id: every other record gets an imported HR value"""
+    activity = store.get_activity(base_id)
+    activity.id = overlay_id
+    key = f"imported_{device}_hr"
+    for record in activity.records[::2]:
+        record.iq_fields[key] = 150
+    activity.available_iq_fields.append(key)
+    activity.base_id = base_id
+    activity.overlay_fields = [f"iq_{key}"]
+    store.save_activity(activity)
+    return activity
+
+
+class TestMergeOverlay:
+    """HR-merged activities store only their own columns and resolve the rest from the base"""
+
+    def test_overlay_stores_only_added_column(self, store):
+        from column_store import read_column_pack
+        store.save_activity(make_activity("a1"))
+        merged = save_overlay(store, "a1", "m1")
+
+        count, columns = read_column_pack(shard_dir(store) / "m1.rec")
+        assert (count, list(columns)) == (61, ["iq_imported_polar_h10_hr"])
+        assert store._read_activity_data("m1", check_trusted=True)["trusted"] is True
+        assert store.get_activity("m1").model_dump() == merged.model_dump()
+        assert store.get_activity_payload("m1") == merged.model_dump(mode='json')
+        assert store.get_activity_meta("m1").base_id == "a1"
+
+        window = store.get_record_columns("m1", ["heart_rate", "iq_imported_polar_h10_hr"], ("elapsed_time", 10, 13))
+        assert window == {"heart_rate": [140, 141, 142, 143], "iq_imported_polar_h10_hr": [150, None, 150, None]}
+
+    def test_repeated_merge_adds_one_column(self, store):
+        from column_store import read_column_pack
+        store.save_activity(make_activity("a1"))
+        save_overlay(store, "a1", "m1")
+        twice = save_overlay(store, "m1", "m2", device="wahoo")
+
+        assert list(read_column_pack(shard_dir(store) / "m2.rec")[1]) == ["iq_imported_wahoo_hr"]
+        assert store.get_activity("m2").records[0].iq_fields == {
+            "dr_gct": 240, "imported_polar_h10_hr": 150, "imported_wahoo_hr": 150
+        }
+        assert store.get_activity("m2").model_dump() == twice.model_dump()
+
+    def test_lod_combines_base_and_overlay(self, store, tmp_path):
+        store.save_activity(make_activity("a1", seconds=1200))
+        merged = save_overlay(store, "a1", "m1")
+        full = DataStore(str(tmp_path / "full"))
+        merged.base_id, merged.overlay_fields = None, []
+        full.save_activity(merged)
+
+        fields = ["heart_rate", "iq_imported_polar_h10_hr"]
+        lod = store.get_activity_lod("m1", fields, 100)
+        assert lod["level_sec"] > 0
+        assert lod == full.get_activity_lod("m1", fields, 100)
+
+    def test_base_resaved_on_same_timeline_keeps_overlay(self, store):
+        store.save_activity(make_activity("a1"))
+        save_overlay(store, "a1", "m1")
+        corrected = make_activity("a1")
+        for record in corrected.records:
+            record.heart_rate += 1
+        store.save_activity(corrected)
+
+        assert store.get_activity_meta("m1").base_id == "a1"
+        record = store.get_activity("m1").records[0]
+        assert (record.heart_rate, record.iq_fields["imported_polar_h10_hr"]) == (141, 150)
+
+    def test_base_timeline_change_materializes_overlay(self, store):
+        store.save_activity(make_activity("a1"))
+        merged = save_overlay(store, "a1", "m1")
+        store.save_activity(make_activity("a1", seconds=30))
+
+        assert store.get_activity_meta("m1").base_id is None
+        activity = store.get_activity("m1")
+        assert (activity.base_id, len(activity.records)) == (None, 61)
+        assert [r.model_dump() for r in activity.records] == [r.model_dump() for r in merged.records]
+
+    def test_deleting_base_materializes_overlay(self, store):
+        store.save_activity(make_activity("a1"))
+        merged = save_overlay(store, "a1", "m1")
+        save_overlay(store, "m1", "m2", device="wahoo")
+
+        store.delete_activities(["a1", "m2"])
+        assert sorted(p.name for p in stored_files(store)) == ["m1.json", "m1.lod", "m1.rec"]
+        activity = store.get_activity("m1")
+        assert activity.base_id is None
+        assert [r.model_dump() for r in activity.records] == [r.model_dump() for r in merged.records]
+
+
+class TestMetadataSidecar:
+    """Metadata edits go to a small sidecar and the index, never to the header or records"""
+
+    def test_edit_writes_only_sidecar(self, store):
+        store.save_activity(make_activity("a1"))
+        before = {p.name: p.read_bytes() for p in stored_files(store)}
+
+        store.update_activities_metadata({"a1": {"notes": "easy day", "tags": [" race ", "race", ""]}})
+        store.update_activities_metadata({"a1": {"name": "Tempo"}})
+        after = {p.name: p.read_bytes() for p in stored_files(store)}
+        assert set(after) - set(before) == {"a1.meta"}
+        assert all(after[name] == data for name, data in before.items())
+
+        activity = store.get_activity("a1")
+        assert (activity.name, activity.notes, activity.tags) == ("Tempo", "easy day", ["race"])
+        assert store.get_activity_payload("a1")["tags"] == ["race"]
+        meta = store.get_activity_meta("a1")
+        assert (meta.name, meta.notes, meta.tags) == ("Tempo", "easy day", ["race"])
+
+    def test_concurrent_edits_both_kept(self, store, monkeypatch):
+        store.save_activity(make_activity("a1"))
+        other = DataStore(str(store.data_dir))
+        original = data_store.read_metadata_sidecar
+
+        def slow_read(path):
+            # Widen the read-merge-write window so an unlocked merge would drop one edit
+            metadata = original(path)
+            time.sleep(0.05)
+            return metadata
+
+        monkeypatch.setattr(data_store, "read_metadata_sidecar", slow_read)
+        threads = [
+            threading.Thread(target=store.update_activities_metadata, args=({"a1": {"name": "Tempo"}},)),
+            threading.Thread(target=other.update_activities_metadata, args=({"a1": {"tags": ["race"]}},)),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        monkeypatch.setattr(data_store, "read_metadata_sidecar", original)
+        assert original(store._metadata_file("a1")) == {"name": "Tempo", "tags": ["race"]}
+        for reader in (store, other, DataStore(str(store.data_dir))):
+            meta = reader.get_activity_meta("a1")
+            assert (meta.name, meta.tags) == ("Tempo", ["race"])
+
+    def test_cold_activity_not_thawed(self, store):
+        store.save_activity(make_activity("a1"))
+        store.freeze_activity("a1")
+
+        store.update_activities_metadata({"a1": {"name": "Long run", "sport": "trail"}})
+        assert sorted(p.name for p in stored_files(store)) == ["a1.cold", "a1.meta"]
+        assert store.get_activity_meta("a1").tier == "cold"
+        activity = store.get_activity("a1")
+        assert (activity.name, activity.session.sport) == ("Long run", "trail")
+
+    def test_rebuild_index_applies_sidecar(self, store):
+        store.save_activity(make_activity("a1"))
+        store.update_activities_metadata({"a1": {"tags": ["intervals"], "sport": "track"}})
+
+        index, _ = store.rebuild_index()
+        assert (index.activities[0].tags, index.activities[0].sport) == (["intervals"], "track")
+
+    def test_full_save_folds_sidecar_into_header(self, store):
+        store.save_activity(make_activity("a1"))
+        store.update_activities_metadata({"a1": {"name": "Tempo"}})
+        store.save_activity(store.get_activity("a1"))
+
+        assert not (shard_dir(store) / "a1.meta").exists()
+        assert json.loads((shard_dir(store) / "a1.json").read_text(encoding='utf-8'))["name"] == "Tempo"
+
+    def test_tags_and_notes_searchable(self, store):
+        store.save_activity(make_activity("a1", "Morning"))
+        store.save_activity(make_activity("a2", "Evening"))
+        store.update_activities_metadata({"a1": {"tags": ["parkrun"]}, "a2": {"notes": "felt strong on hills"}})
+
+        assert [a.id for a in store.search_activities("parkrun")[0]] == ["a1"]
+        assert [a.id for a in store.search_activities("hills")[0]] == ["a2"]
+        assert [a.id for a in store.list_activities(filter_tag="parkrun")[0]] == ["a1"]
+
+    def test_merge_provenance_updates_devices(self, store):
+        store.save_activity(make_activity("a1"))
+        provenance = {"method": "metadata_align", "decision": "manual", "sources": [{"device_name": "Polar H10"}]}
+
+        store.update_activities_metadata({"a1": {"merge_provenance": provenance}})
+        assert store.get_activity_meta("a1").devices[-1] == "Polar H10"
+        assert store.get_activity("a1").merge_provenance.decision == "manual"
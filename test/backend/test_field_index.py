@@ -0,0 +1,103 @@
+"""
+Backend unit tests for field_index.py
+Tests the field -> activity bitmap index and its DataStore integration
+"""
+import sys
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'backend'))
+
+import field_index
+from data_store import DataStore
+from field_index import FieldIndex
+from models import ActivityMeta
+from test_data_store import make_activity
+
+
+def meta(activity_id, fields=(), iq_fields=()):
+    return ActivityMeta(id=activity_id, name=activity_id, available_fields=list(fields),
+                        available_iq_fields=list(iq_fields))
+
+
+def build_index(*metas):
+    index = FieldIndex()
+    for m in metas:
+        index.put(m)
+    return index
+
+
+class TestFieldIndex:
+    """Fields map to the activities that contain them"""
+
+    def test_matching_requires_all_fields(self):
+        index = build_index(
+            meta("1", ["heart_rate", "power"], ["dr_gct"]),
+            meta("2", ["heart_rate"]),
+            meta("3", ["power"], ["imported_polar_h10_hr"]),
+        )
+        assert index.matching(["heart_rate"]) == {"1", "2"}
+        assert index.matching(["heart_rate", "power"]) == {"1"}
+        assert index.matching(["iq_dr_gct"]) == {"1"}
+        assert index.matching(["missing"]) == set()
+        assert index.matching([]) == {"1", "2", "3"}
+
+    def test_prefix_match(self):
+        index = build_index(
+            meta("1", iq_fields=["imported_polar_h10_hr"]),
+            meta("2", iq_fields=["imported_wahoo_hr"]),
+            meta("3", iq_fields=["dr_gct"]),
+        )
+        assert index.matching(["iq_imported_*"]) == {"1", "2"}
+
+    def test_field_counts_for_subset(self):
+        index = build_index(
+            meta("1", ["heart_rate", "power"]),
+            meta("2", ["heart_rate"], ["dr_gct"]),
+            meta("3", ["cadence"]),
+        )
+        assert index.field_counts(["1", "2", "unknown"]) == {"heart_rate": 2, "iq_dr_gct": 1, "power": 1}
+        assert index.field_counts()["cadence"] == 1
+
+    def test_update_and_remove(self):
+        index = build_index(meta("1", ["heart_rate"]))
+        index.put(meta("1", ["power"]), old=meta("1", ["heart_rate"]))
+        assert index.matching(["heart_rate"]) == set()
+        assert index.matching(["power"]) == {"1"}
+        index.remove(meta("1", ["power"]))
+        assert index.field_counts() == {}
+        assert len(index) == 0
+
+    def test_compaction_keeps_membership(self, monkeypatch):
+        monkeypatch.setattr(field_index, "COMPACT_MIN_FREED", 2)
+        index = build_index(*(meta(str(i), ["heart_rate"] if i % 2 else ["power"]) for i in range(10)))
+        for i in range(6):
+            index.remove(meta(str(i), ["heart_rate"] if i % 2 else ["power"]))
+        assert len(index._ids) < 10
+        assert index.matching(["heart_rate"]) == {"7", "9"}
+        assert index.matching(["power"]) == {"6", "8"}
+        index.put(meta("10", ["power"]))
+        assert index.matching(["power"]) == {"6", "8", "10"}
+
+
+class TestDataStoreFieldIndex:
+    """The index follows saves and deletes and backs the list filter"""
+
+    def test_filter_and_union(self, tmp_path):
+        store = DataStore(str(tmp_path / "data"))
+        store.save_activity(make_activity("a1"))
+        merged = make_activity("a2")
+        merged.available_iq_fields.append("imported_polar_h10_hr")
+        store.save_activity(merged)
+
+        assert [a.id for a in store.list_activities(filter_fields=["iq_imported_*"])[0]] == ["a2"]
+        assert store.get_field_union(["a1"]) == {
+            "available_fields": ["distance", "elapsed_time", "heart_rate"],
+            "available_iq_fields": ["dr_gct"],
+            "counts": {"distance": 1, "elapsed_time": 1, "heart_rate": 1, "iq_dr_gct": 1},
+        }
+
+        store.delete_activity("a2")
+        assert store.list_activities(filter_fields=["iq_imported_*"])[0] == []
+        store.save_activity(merged)
+        assert store.get_field_union()["counts"]["iq_dr_gct"] == 2
@@ -0,0 +1,186 @@
+"""
+Backend unit tests for integrity.py
+Tests the store consistency scan and its repairs
+"""
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'backend'))
+
+from data_store import DataStore
+from integrity import GRACE_SEC, IntegrityJob, _repair, scan_store
+from store_cli import main as cli_main
+from test_data_store import make_activity, save_overlay
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = DataStore(str(tmp_path / "data"))
+    for i in range(3):
+        store.save_activity(make_activity(f"a{i}", f"run {i}"))
+    return store
+
+
+def shard(store: DataStore) -> Path:
+    return store.activities_dir / "2025" / "06"
+
+
+def make_old(path: Path):
+    old = time.time() - GRACE_SEC - 60
+    os.utime(path, (old, old))
+
+
+class TestScan:
+    """The scan reconciles the index with the activity files"""
+
+    def test_clean_store(self, store):
+        report = scan_store(store)
+        assert report["scanned"] == 3
+        assert report["ok"] == 3
+        for key in ("orphans", "dangling", "corrupt", "partial", "duplicates", "tier_mismatch", "missing_base",
+                    "temp_files"):
+            assert report[key] == []
+
+    def test_orphan_is_reindexed(self, store):
+        index = store._load_index()
+        index.activities = [a for a in index.activities if a.id != "a1"]
+        store._save_index(index)
+
+        report = scan_store(store, repair=True)
+        assert [o["id"] for o in report["orphans"]] == ["a1"]
+        assert DataStore(str(store.data_dir)).get_activity_meta("a1").name == "run 1"
+
+    def test_dangling_entry_is_dropped(self, store):
+        for path in shard(store).glob("a2.*"):
+            path.unlink()
+
+        report = scan_store(store, repair=True)
+        assert report["dangling"] == ["a2"]
+        assert DataStore(str(store.data_dir)).get_activity_meta("a2") is None
+
+    def test_corrupt_activity_is_quarantined(self, store):
+        (shard(store) / "a0.rec").write_bytes(b"garbage")
+
+        report = scan_store(store, repair=True)
+        assert [c["id"] for c in report["corrupt"]] == ["a0"]
+        assert report["dangling"] == ["a0"]
+        quarantine = Path(report["quarantine_dir"])
+        assert (quarantine / "activities" / "2025" / "06" / "a0.rec").read_bytes() == b"garbage"
+        assert not list(shard(store).glob("a0.*"))
+        assert DataStore(str(store.data_dir)).get_activity_meta("a0") is None
+
+    def test_partial_files_quarantined_only_after_grace_period(self, store):
+        store.delete_activity("a0")
+        partial = shard(store) / "a0.rec"
+        partial.write_bytes((shard(store) / "a1.rec").read_bytes())
+
+        assert scan_store(store)["partial"] == []
+        make_old(partial)
+        report = scan_store(store, repair=True)
+        assert [p["files"] for p in report["partial"]] == [["activities/2025/06/a0.rec"]]
+        assert not partial.exists()
+
+    def test_duplicate_flat_copy_is_quarantined(self, store):
+        for path in shard(store).glob("a0.*"):
+            shutil.copy(path, store.activities_dir / path.name)
+
+        report = scan_store(store, repair=True)
+        assert report["ok"] == 3
+        assert [d["files"] for d in report["duplicates"]] == \
+            [["activities/a0.json", "activities/a0.lod", "activities/a0.rec"]]
+        assert not (store.activities_dir / "a0.json").exists()
+        assert store.get_activity("a0").name == "run 0"
+
+    def test_tier_mismatch_is_corrected(self, store):
+        store.freeze_activity("a1")
+        meta = store.get_activity_meta("a1")
+        store._commit_index_ops([{"op": "put", "meta": meta.model_copy(update={"tier": "hot"}).model_dump(mode='json')}])
+
+        report = scan_store(store, repair=True)
+        assert report["tier_mismatch"] == [{"id": "a1", "index": "hot", "disk": "cold"}]
+        assert DataStore(str(store.data_dir)).get_activity_meta("a1").tier == "cold"
+
+    def test_overlay_with_missing_base_is_quarantined(self, store):
+        save_overlay(store, "a0", "m1")
+        save_overlay(store, "m1", "m2")
+        for path in shard(store).glob("a0.*"):
+            path.unlink()
+
+        found = scan_store(store)["missing_base"]
+        assert sorted((m["id"], m["base_id"]) for m in found) == [("m1", "a0"), ("m2", "m1")]
+        report = scan_store(store, repair=True)
+        assert report["ok"] == 2
+        assert report["dangling"] == ["a0"]
+        quarantine = Path(report["quarantine_dir"])
+        assert (quarantine / "activities" / "2025" / "06" / "m2.rec").exists()
+        reopened = DataStore(str(store.data_dir))
+        assert sorted(a.id for a in reopened.list_activities()[0]) == ["a1", "a2"]
+        assert scan_store(reopened)["missing_base"] == []
+
+    def test_overlay_kept_when_base_saved_after_scan(self, store):
+        save_overlay(store, "a0", "m1")
+        save_overlay(store, "m1", "m2")
+        for path in shard(store).glob("a0.*"):
+            path.unlink()
+        report = scan_store(store)
+
+        store.save_activity(make_activity("a0", "run 0"))
+        assert _repair(store, report, []) is None
+        assert sorted(a.id for a in store.list_activities()[0]) == ["a0", "a1", "a2", "m1", "m2"]
+
+    def test_stale_temp_files_removed(self, store):
+        fresh = shard(store) / "a0.rec.abc.tmp"
+        stale = shard(store) / "a1.rec.def.tmp"
+        fresh.write_bytes(b"x")
+        stale.write_bytes(b"x")
+        make_old(stale)
+
+        report = scan_store(store, repair=True)
+        assert report["temp_files"] == ["activities/2025/06/a1.rec.def.tmp"]
+        assert fresh.exists() and not stale.exists()
+
+    def test_scan_without_repair_changes_nothing(self, store):
+        (shard(store) / "a0.rec").write_bytes(b"garbage")
+        report = scan_store(store)
+        assert report["repaired"] is False
+        assert (shard(store) / "a0.rec").exists()
+        assert store.get_activity_meta("a0") is not None
+
+    def test_parallel_scan(self, store, monkeypatch):
+        monkeypatch.setattr(DataStore, "REBUILD_PARALLEL_MIN_FILES", 1)
+        (shard(store) / "a2.rec").write_bytes(b"garbage")
+        report = scan_store(store, max_workers=2)
+        assert report["ok"] == 2
+        assert [c["id"] for c in report["corrupt"]] == ["a2"]
+
+
+class TestIntegrityJob:
+    """The background job runs the throttled scan"""
+
+    def test_job_completes(self, store):
+        job = IntegrityJob(store, throttle_sec=0.001)
+        job.start()
+        job._thread.join(10)
+        status = job.status()
+        assert status["state"] == "done"
+        assert status["report"]["ok"] == 3
+
+
+class TestCheckCommand:
+    """store_cli check reports problems through its exit code"""
+
+    def test_check_and_repair(self, store, capsys):
+        data_dir = str(store.data_dir)
+        assert cli_main(["--data-dir", data_dir, "check"]) == 0
+
+        (shard(store) / "a0.rec").write_bytes(b"garbage")
+        assert cli_main(["--data-dir", data_dir, "check"]) == 2
+        assert cli_main(["--data-dir", data_dir, "check", "--repair"]) == 0
+        assert cli_main(["--data-dir", data_dir, "check"]) == 0
+        assert '"corrupt"' in capsys.readouterr().out
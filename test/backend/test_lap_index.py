@@ -0,0 +1,128 @@
+"""
+Backend unit tests for lap_index.py
+Tests the library-wide lap table and its DataStore integration
+"""
+import sys
+from datetime import date
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'backend'))
+
+from data_store import DataStore
+from lap_index import LAP_CACHE_NAME, LapIndex, laps_to_columns
+from models import Lap
+from test_data_store import make_activity
+
+
+def with_laps(activity, *laps):
+    """Attach laps given as (distance_m, seconds, avg_hr, iq_fields)"""
+    activity.laps = [
+        Lap(lap_number=i + 1, total_distance=distance, total_elapsed_time=seconds,
+            avg_speed=distance / seconds, avg_heart_rate=hr, iq_fields=iq)
+        for i, (distance, seconds, hr, iq) in enumerate(laps)
+    ]
+    return activity
+
+
+def dumped_laps(activity):
+    return [lap.model_dump(mode='json') for lap in activity.laps]
+
+
+class TestLapIndex:
+    """Lap rows are filtered and sorted in memory"""
+
+    def build(self):
+        index = LapIndex()
+        for activity in (
+            with_laps(make_activity("a1"), (1000, 240, 160, {"dr_gct": 230}), (1000, 230, 172, {"dr_gct": 225})),
+            with_laps(make_activity("a2"), (1000, 250, 150, {}), (400, 80, None, {"flag": True})),
+        ):
+            meta = DataStore._activity_to_meta(activity)
+            index.put(meta)
+            index.set_laps(meta, dumped_laps(activity))
+        return index
+
+    def test_columns(self):
+        columns = laps_to_columns(dumped_laps(with_laps(make_activity("a1"), (1000, 250, 150, {"flag": True, "x": 1.5}))))
+        assert columns["pace_sec_per_km"] == [250.0]
+        assert columns["iq_x"] == [1.5]
+        assert "iq_flag" not in columns
+        assert "avg_power" not in columns
+
+    def test_range_filter_and_sort(self):
+        index = self.build()
+        rows = index.query({"total_distance": (950, 1050), "pace_sec_per_km": (None, 245)})
+        assert [(r["activity_id"], r["lap_number"]) for r in rows] == [("a1", 1), ("a1", 2)]
+        rows = index.query({"avg_heart_rate": (None, 170)}, sort_by="pace_sec_per_km", descending=True)
+        assert [(r["activity_id"], r["lap_number"]) for r in rows] == [("a2", 1), ("a1", 1)]
+        assert [r["lap_number"] for r in index.query({"iq_dr_gct": (None, 228)})] == [2]
+
+    def test_sort_puts_missing_values_last(self):
+        rows = self.build().query({}, sort_by="avg_heart_rate")
+        assert [r.get("avg_heart_rate") for r in rows] == [150, 160, 172, None]
+
+    def test_signature_ignores_metadata_edits(self):
+        index = self.build()
+        meta = DataStore._activity_to_meta(make_activity("a1"))
+        index.put(meta.model_copy(update={"name": "renamed", "tags": ["x"], "tier": "cold"}))
+        assert index.stale_ids() == []
+        index.put(meta.model_copy(update={"distance_km": 9.9}))
+        assert index.stale_ids() == ["a1"]
+
+    def test_cache_round_trip(self, tmp_path):
+        index = self.build()
+        index.save(tmp_path / LAP_CACHE_NAME)
+        loaded = LapIndex.load(tmp_path / LAP_CACHE_NAME)
+        changed = DataStore._activity_to_meta(make_activity("a2")).model_copy(update={"distance_km": 1.4})
+        loaded.sync([DataStore._activity_to_meta(make_activity("a1")), changed])
+        assert loaded.stale_ids() == ["a2"]
+        assert len(loaded.query({})) == 2
+
+
+class TestDataStoreLapIndex:
+    """The lap index follows saves and deletes and survives restarts"""
+
+    def test_query_follows_store(self, tmp_path):
+        store = DataStore(str(tmp_path / "data"))
+        store.save_activity(with_laps(make_activity("a1", "tempo"), (1000, 240, 160, {}), (1000, 230, 172, {})))
+        store.save_activity(with_laps(make_activity("a2", "easy"), (1000, 330, 140, {})))
+
+        rows, total = store.query_laps({"total_distance": (950, 1050)}, sort_by="pace_sec_per_km", limit=2)
+        assert total == 3
+        assert [(r["activity_id"], r["lap_number"], r["activity_name"]) for r in rows] == [
+            ("a1", 2, "tempo"), ("a1", 1, "tempo")
+        ]
+
+        store.delete_activity("a1")
+        store.save_activity(with_laps(make_activity("a2", "easy"), (1000, 300, 150, {})))
+        rows, total = store.query_laps()
+        assert total == 1
+        assert rows[0]["avg_heart_rate"] == 150
+
+        assert store.query_laps(date_from=date(2025, 6, 2))[1] == 0
+        assert store.query_laps(date_to=date(2025, 6, 1), sport="running")[1] == 1
+
+    def test_cache_reused_after_restart(self, tmp_path, monkeypatch):
+        store = DataStore(str(tmp_path / "data"))
+        store.save_activity(with_laps(make_activity("a1"), (1000, 240, 160, {})))
+        store.save_activity(with_laps(make_activity("a2"), (1000, 250, 150, {})))
+        store.query_laps()
+        store.freeze_activity("a1")
+        store.update_activities_metadata({"a2": {"name": "renamed"}})
+
+        reopened = DataStore(str(tmp_path / "data"))
+        read = []
+        original = DataStore._read_laps
+        monkeypatch.setattr(DataStore, "_read_laps", lambda self, meta: read.append(meta.id) or original(self, meta))
+        rows, total = reopened.query_laps(sort_by="avg_heart_rate")
+        assert read == []
+        assert [r["activity_name"] for r in rows] == ["renamed", "run"]
+
+    def test_cold_activity_read_without_thaw(self, tmp_path):
+        store = DataStore(str(tmp_path / "data"))
+        store.save_activity(with_laps(make_activity("a1"), (1000, 240, 160, {"dr_gct": 230})))
+        store.freeze_activity("a1")
+        rows, _ = store.query_laps({"iq_dr_gct": (200, 240)})
+        assert [r["lap_number"] for r in rows] == [1]
+        assert store.get_activity_meta("a1").tier == "cold"
@@ -0,0 +1,83 @@
+"""
+Backend unit tests for lod.py
+Tests multi-resolution min/max/mean envelopes and level selection
+"""
+import sys
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'backend'))
+
+from lod import build_lod_columns, select_lod_level, lod_payload
+
+
+def make_columns(seconds: int):
+    return {
+        "timestamp": [f"2025-01-01T00:00:{i % 60:02d}" for i in range(seconds)],
+        "elapsed_time": [float(i) for i in range(seconds)],
+        "heart_rate": [100 + i % 10 for i in range(seconds)],
+        "iq_dr_gct": [None if i % 2 else 250.0 for i in range(seconds)],
+        "iq_label": ["a"] * seconds,
+    }
+
+
+class TestBuildLod:
+    """Envelope computation"""
+
+    def test_levels_and_point_counts(self):
+        lod = build_lod_columns(make_columns(600))
+        assert lod["levels"] == [[5, 120], [30, 20], [300, 2]]
+        assert lod["30/x"][:3] == [0, 30, 60]
+
+    def test_envelope_values(self):
+        lod = build_lod_columns(make_columns(600))
+        assert lod["5/heart_rate/min"][0] == 100
+        assert lod["5/heart_rate/max"][0] == 104
+        assert lod["5/heart_rate/mean"][0] == 102
+        assert lod["30/heart_rate/min"][0] == 100
+        assert lod["30/heart_rate/max"][0] == 109
+        assert lod["300/heart_rate/mean"][0] == 104.5
+
+    def test_sparse_and_non_numeric_columns(self):
+        lod = build_lod_columns(make_columns(600))
+        assert lod["5/iq_dr_gct/mean"][0] == 250.0
+        assert "5/iq_label/mean" not in lod
+        assert "5/timestamp/mean" not in lod
+
+    def test_irregular_time_axis_matches_regular(self):
+        """Partial edge buckets and out-of-order samples give the same envelopes"""
+        times = [float(i) for i in range(3, 603)]
+        hr = [100 + i % 7 for i in range(600)]
+        regular = build_lod_columns({"elapsed_time": times, "heart_rate": hr})
+        shuffled = build_lod_columns({"elapsed_time": times[::-1], "heart_rate": hr[::-1]})
+        assert regular["levels"] == [[5, 121], [30, 21], [300, 3]]
+        assert regular["5/heart_rate/max"] == shuffled["5/heart_rate/max"]
+        assert regular["300/heart_rate/mean"] == shuffled["300/heart_rate/mean"]
+        assert regular["5/heart_rate/min"][0] == 100
+
+    def test_without_time_axis(self):
+        assert build_lod_columns({"heart_rate": [1, 2, 3]}) == {}
+
+
+class TestSelectLevel:
+    """Level selection by pixel width"""
+
+    LEVELS = [[5, 4320], [30, 720], [300, 72]]
+
+    def test_raw_when_it_fits(self):
+        assert select_lod_level(self.LEVELS, 800, 1000) == 0
+
+    def test_finest_level_that_fits(self):
+        assert select_lod_level(self.LEVELS, 21600, 1000) == 30
+        assert select_lod_level(self.LEVELS, 21600, 5000) == 5
+
+    def test_coarsest_when_nothing_fits(self):
+        assert select_lod_level(self.LEVELS, 21600, 20) == 300
+
+    def test_payload_shape(self):
+        lod = build_lod_columns(make_columns(600))
+        payload = lod_payload(30, lod, ["heart_rate", "missing"])
+        assert payload["level_sec"] == 30
+        assert payload["points"] == 20
+        assert set(payload["series"]) == {"heart_rate"}
+        assert set(payload["series"]["heart_rate"]) == {"min", "max", "mean"}
@@ -0,0 +1,56 @@
+"""
+Backend unit tests for migrations.py
+Tests in-memory upgrades of older activity data (dual-read)
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'backend'))
+
+import migrations
+from migrations import Migration, stored_column_names, upgrade_activity_data
+
+
+@pytest.fixture
+def rename_step(monkeypatch):
+    """Register an extra step that renames the IQ field gct to dr_gct"""
+    steps = migrations.MIGRATIONS + [Migration(migrations.ACTIVITY_SCHEMA_VERSION, "rename", {"gct": "dr_gct"})]
+    monkeypatch.setattr(migrations, "MIGRATIONS", steps)
+    monkeypatch.setattr(migrations, "ACTIVITY_SCHEMA_VERSION", steps[-1].from_version + 1)
+    return steps[-1]
+
+
+class TestUpgradeActivityData:
+    """Reading older versions"""
+
+    def test_layout_only_steps_keep_data(self):
+        data = {"columns": {"iq_gct": [1]}, "available_iq_fields": ["gct"]}
+        upgraded = upgrade_activity_data(data)
+        assert upgraded["schema_version"] == migrations.ACTIVITY_SCHEMA_VERSION
+        assert upgraded["columns"] == {"iq_gct": [1]}
+
+    def test_iq_renames_applied(self, rename_step):
+        data = {
+            "schema_version": rename_step.from_version,
+            "columns": {"heart_rate": [150], "iq_gct": [240]},
+            "available_iq_fields": ["gct", "dr_gct"],
+            "session": {"iq_fields": {"gct": 241}},
+            "laps": [{"iq_fields": {"gct": 242}}],
+        }
+        upgraded = upgrade_activity_data(data)
+        assert upgraded["columns"] == {"heart_rate": [150], "iq_dr_gct": [240]}
+        assert upgraded["available_iq_fields"] == ["dr_gct"]
+        assert upgraded["session"]["iq_fields"] == {"dr_gct": 241}
+        assert upgraded["laps"][0]["iq_fields"] == {"dr_gct": 242}
+
+    def test_current_version_not_renamed(self, rename_step):
+        data = {"schema_version": migrations.ACTIVITY_SCHEMA_VERSION, "columns": {"iq_gct": [1]}}
+        assert upgrade_activity_data(data)["columns"] == {"iq_gct": [1]}
+
+    def test_stored_column_names(self, rename_step):
+        old = rename_step.from_version
+        assert stored_column_names(old, ["iq_dr_gct", "heart_rate"]) == ["iq_gct", "heart_rate"]
+        assert stored_column_names(old + 1, ["iq_dr_gct"]) == ["iq_dr_gct"]
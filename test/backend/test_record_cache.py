@@ -0,0 +1,174 @@
+"""
+Backend unit tests for record_cache.py
+Tests the compact dtype policy and the LRU record cache
+"""
+import random
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'backend'))
+
+import record_cache
+from column_store import records_to_columns, write_column_pack
+from data_store import DataStore
+from record_cache import SEMICIRCLE_DEGREES, RecordCache, pack_column
+from test_data_store import make_activity
+
+
+def packed(name, values):
+    column = pack_column(name, values)
+    restored = column.to_list()
+    assert restored == values
+    assert [type(v) for v in restored] == [type(v) for v in values]
+    return column
+
+
+class TestDtypePolicy:
+    """Columns are stored in the narrowest type that restores them exactly"""
+
+    def test_small_ints(self):
+        assert packed("heart_rate", [140, 150, None, 190]).typecode == "B"
+        assert packed("temperature", [-5, 20]).typecode == "b"
+        assert packed("power", [250, 400]).typecode == "h"
+        assert packed("iq_steps", [0, 60000]).typecode == "H"
+
+    def test_coordinates_kept_as_semicircles(self):
+        random.seed(0)
+        lats = [random.randint(-2 ** 30, 2 ** 30) * SEMICIRCLE_DEGREES for _ in range(100)]
+        column = packed("position_lat", lats)
+        assert (column.kind, column.typecode) == ("semicircle", "i")
+
+    def test_decimal_floats_scaled(self):
+        column = packed("iq_dr_v_osc", [8.1, 8.25, 7.9])
+        assert (column.kind, column.scale, column.typecode) == ("scaled", 100, "h")
+
+    def test_full_precision_floats_fall_back_to_double(self):
+        random.seed(1)
+        assert packed("speed", [random.random() for _ in range(50)]).typecode == "d"
+
+    def test_timestamps(self):
+        start = datetime(2025, 6, 1, 7, 0, 0)
+        column = packed("timestamp", [(start + timedelta(seconds=i)).isoformat() for i in range(10)] + [None])
+        assert (column.kind, column.typecode) == ("timestamp", "q")
+        packed("timestamp", [(start + timedelta(seconds=i)).isoformat() + "Z" for i in range(10)])
+
+    def test_other_values_kept_as_list(self):
+        assert packed("iq_state", ["run", "walk"]).kind == "list"
+        assert packed("iq_flag", [True, False]).kind == "list"
+        assert packed("iq_mixed", [1, 2.5]).kind == "list"
+
+    def test_memory_per_activity_drops(self):
+        random.seed(2)
+        columns = {
+            "heart_rate": [random.randint(120, 180) for _ in range(3600)],
+            "distance": [round(i * 2.9, 2) for i in range(3600)],
+            "iq_dr_gct": [round(random.uniform(230, 250), 1) for _ in range(3600)],
+        }
+        compact = sum(pack_column(name, values).nbytes() for name, values in columns.items())
+        # a list of floats costs a pointer plus a 24 byte float object per value
+        as_objects = sum(len(values) * (8 + 24) for values in columns.values())
+        assert compact * 10 < as_objects
+
+
+@pytest.fixture
+def rec_file(tmp_path):
+    activity = make_activity("a1", seconds=600)
+    columns = records_to_columns(activity.records)
+    path = tmp_path / "a1.rec"
+    write_column_pack(path, columns, len(activity.records), chunked=True)
+    return path, columns
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    calls = []
+    real = record_cache.read_column_pack
+
+    def counting(path, names=None):
+        calls.append(names)
+        return real(path, names)
+
+    monkeypatch.setattr(record_cache, "read_column_pack", counting)
+    return calls
+
+
+class TestRecordCache:
+    """Cached columns are served without reading the file"""
+
+    def test_hit_after_first_read(self, rec_file, reads):
+        path, columns = rec_file
+        cache = RecordCache(10 * 1024 * 1024)
+
+        assert cache.read(path) == (601, columns)
+        assert cache.read(path) == (601, columns)
+        assert cache.read(path, ["heart_rate", "missing"]) == (601, {"heart_rate": columns["heart_rate"]})
+        assert len(reads) == 1
+        assert cache.status()["hits"] == 2
+
+    def test_only_missing_columns_loaded(self, rec_file, reads):
+        path, columns = rec_file
+        cache = RecordCache(10 * 1024 * 1024)
+
+        cache.read(path, ["heart_rate"])
+        _, result = cache.read(path, ["heart_rate", "distance", "power"])
+        assert result == {"heart_rate": columns["heart_rate"], "distance": columns["distance"]}
+        cache.read(path, ["power"])
+        assert reads == [["heart_rate"], ["distance", "power"]]
+        assert cache.read(path, ["distance"], load=False) is not None
+        assert cache.read(path, ["speed"], load=False) is None
+
+    def test_rewritten_file_invalidates(self, rec_file):
+        path, columns = rec_file
+        cache = RecordCache(10 * 1024 * 1024)
+        cache.read(path)
+
+        changed = dict(columns, heart_rate=[100] * 601)
+        write_column_pack(path, changed, 601, chunked=True)
+        assert cache.read(path)[1]["heart_rate"] == [100] * 601
+
+    def test_least_recently_used_evicted(self, tmp_path, rec_file):
+        path, columns = rec_file
+        other = tmp_path / "a2.rec"
+        write_column_pack(other, columns, 601, chunked=True)
+        cache = RecordCache(10 * 1024 * 1024)
+        cache.read(path)
+        cache.max_bytes = cache.status()["bytes"] + 1
+
+        cache.read(other)
+        assert cache.status()["activities"] == 1
+        assert cache.read(path, load=False) is None
+
+
+class TestDataStoreCache:
+    """DataStore serves record reads from the cache"""
+
+    def test_payload_same_with_and_without_cache(self, tmp_path):
+        store = DataStore(str(tmp_path / "data"))
+        store.save_activity(make_activity("a1", seconds=1200))
+        uncached = DataStore(str(tmp_path / "data"), record_cache_mb=0)
+
+        expected = uncached.get_activity_payload("a1")
+        assert store.get_activity_payload("a1") == expected
+        assert store.get_activity_payload("a1") == expected
+        window = ("elapsed_time", 100, 700)
+        assert store.get_activity_payload("a1", record_range=window) == \
+            uncached.get_activity_payload("a1", record_range=window)
+
+        status = store.record_cache_status()
+        assert status["enabled"] and status["activities"] == 1 and status["hits"] == 2
+        assert uncached.record_cache_status() == {"enabled": False}
+
+    def test_resaved_activity_not_served_stale(self, tmp_path):
+        store = DataStore(str(tmp_path / "data"))
+        store.save_activity(make_activity("a1"))
+        store.get_record_columns("a1", ["heart_rate"])
+
+        changed = make_activity("a1")
+        for record in changed.records:
+            record.heart_rate = 99
+        store.save_activity(changed)
+        assert set(store.get_record_columns("a1", ["heart_rate"])["heart_rate"]) == {99}
@@ -0,0 +1,176 @@
+"""
+Backend unit tests for raw_store.py and reprocess.py
+Tests raw FIT archival and re-parsing activities with the current parser
+"""
+import os
+import sys
+import tarfile
+import time
+from pathlib import Path
+
+import pytest
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'backend'))
+
+import reprocess
+from data_store import DataStore
+from fit_parser import parser_fingerprint
+from integrity import GRACE_SEC, scan_store
+from raw_store import RawStore, content_hash
+from reprocess import ReprocessJob, find_reprocess_candidates, reprocess_activity
+from snapshot import write_snapshot
+from test_data_store import make_activity
+
+
+def fake_parse(data, file_name, activity_id, name):
+    """Stand-in for parse_fit_bytes: the 'current parser' shifts heart rate by one"""
+    activity = make_activity(activity_id, name)
+    for record in activity.records:
+        record.heart_rate += 1
+    activity.file_name = file_name
+    activity.parser_version = parser_fingerprint()
+    return activity
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(reprocess, "parse_fit_bytes", fake_parse)
+    return DataStore(str(tmp_path / "data"))
+
+
+def save_uploaded(store, activity_id, raw=b"FIT", parser_version="0-old"):
+    activity = make_activity(activity_id)
+    activity.raw_sha256 = store.raw_store.put(raw + activity_id.encode())
+    activity.parser_version = parser_version
+    store.save_activity(activity)
+    return activity
+
+
+class TestRawStore:
+    """Raw files are stored once per content"""
+
+    def test_content_addressed(self, tmp_path):
+        raw = RawStore(tmp_path / "raw")
+        sha = raw.put(b"abc")
+        assert sha == content_hash(b"abc")
+        assert raw.put(b"abc") == sha
+        assert len(list(raw.iter_files())) == 1
+        assert raw.get(sha) == b"abc"
+
+    def test_damaged_file_not_returned(self, tmp_path):
+        raw = RawStore(tmp_path / "raw")
+        sha = raw.put(b"abc")
+        raw.path(sha).write_bytes(b"abd")
+        assert raw.get(sha) is None
+        assert raw.get("0" * 64) is None
+
+
+class TestReprocess:
+    """Activities are re-parsed from their archived FIT files"""
+
+    def test_candidates(self, store):
+        save_uploaded(store, "old")
+        save_uploaded(store, "current", parser_version=parser_fingerprint())
+        store.save_activity(make_activity("no-raw"))
+
+        assert find_reprocess_candidates(store) == ["old"]
+        assert sorted(find_reprocess_candidates(store, force=True)) == ["current", "old"]
+        assert find_reprocess_candidates(store, ["current"]) == []
+
+    def test_keeps_identity_and_user_edits(self, store):
+        old = save_uploaded(store, "a1")
+        store.update_activities_metadata({"a1": {"name": "renamed", "sport": "trail"}})
+
+        assert reprocess_activity(store, "a1") is True
+        activity = store.get_activity("a1")
+        assert activity.name == "renamed"
+        assert activity.session.sport == "trail"
+        assert activity.created_at == old.created_at
+        assert activity.raw_sha256 == old.raw_sha256
+        assert activity.records[0].heart_rate == 141
+        assert store.get_activity_meta("a1").parser_version == parser_fingerprint()
+        assert find_reprocess_candidates(store) == []
+
+    def test_hr_merge_columns_carried_over(self, store):
+        merged = make_activity("m1")
+        merged.raw_sha256 = store.raw_store.put(b"FIT")
+        merged.records[5].iq_fields["imported_polar_h10_hr"] = 150
+        merged.available_iq_fields.append("imported_polar_h10_hr")
+        store.save_activity(merged)
+
+        reprocess_activity(store, "m1")
+        activity = store.get_activity("m1")
+        assert activity.records[5].iq_fields == {"dr_gct": 240, "imported_polar_h10_hr": 150}
+        assert "imported_polar_h10_hr" not in activity.records[6].iq_fields
+        assert "imported_polar_h10_hr" in activity.available_iq_fields
+
+    def test_job_reports_progress(self, store):
+        save_uploaded(store, "a1")
+        broken = save_uploaded(store, "a2")
+        store.raw_store.path(broken.raw_sha256).unlink()
+
+        job = ReprocessJob(store, find_reprocess_candidates(store), throttle_sec=0)
+        job.start()
+        job.join(10)
+        status = job.status()
+        assert status["state"] == "done"
+        assert (status["total"], status["processed"], status["reprocessed"]) == (2, 2, 1)
+        assert [f["id"] for f in status["failed"]] == ["a2"]
+
+    def test_job_commits_index_once_per_batch(self, store, monkeypatch):
+        for i in range(3):
+            save_uploaded(store, f"a{i}")
+        appends = []
+        original = store._journal.append
+        monkeypatch.setattr(store._journal, "append", lambda ops: appends.append(len(ops)) or original(ops))
+
+        job = ReprocessJob(store, find_reprocess_candidates(store), throttle_sec=0)
+        job.start()
+        job.join(10)
+        assert job.status()["reprocessed"] == 3
+        assert len(appends) == 1
+
+    def test_edit_while_staging_is_not_overwritten(self, store, monkeypatch):
+        save_uploaded(store, "a1")
+        save_uploaded(store, "a2")
+        other = DataStore(str(store.data_dir))
+        original = store._encode_activity_files
+
+        def encode(activity):
+            if activity.id == "a1":
+                other.update_activities_metadata({"a1": {"name": "renamed"}})
+            return original(activity)
+
+        monkeypatch.setattr(store, "_encode_activity_files", encode)
+        job = ReprocessJob(store, find_reprocess_candidates(store), throttle_sec=0)
+        job.start()
+        job.join(10)
+        status = job.status()
+        assert (status["processed"], status["reprocessed"], status["skipped"]) == (2, 1, 1)
+        assert store.get_activity("a1").name == "renamed"
+        assert find_reprocess_candidates(store) == ["a1"]
+
+
+class TestRawFilesInStore:
+    """Raw files follow the activities into snapshots and out of the integrity scan"""
+
+    def test_snapshot_includes_referenced_raw(self, store, tmp_path):
+        activity = save_uploaded(store, "a1")
+        write_snapshot(store, tmp_path / "backup.tar.gz")
+        with tarfile.open(tmp_path / "backup.tar.gz", mode="r:gz") as tar:
+            names = tar.getnames()
+        assert f"raw/{activity.raw_sha256[:2]}/{activity.raw_sha256}.fit" in names
+
+    def test_unreferenced_raw_quarantined(self, store):
+        kept = save_uploaded(store, "a1")
+        dropped = save_uploaded(store, "a2")
+        store.delete_activity("a2")
+        old = time.time() - GRACE_SEC - 60
+        for sha in (kept.raw_sha256, dropped.raw_sha256):
+            os.utime(store.raw_store.path(sha), (old, old))
+
+        report = scan_store(store, repair=True)
+        assert report["raw_orphans"] == [str(store.raw_store.path(dropped.raw_sha256).relative_to(store.data_dir))]
+        assert store.raw_store.exists(kept.raw_sha256)
+        assert not store.raw_store.exists(dropped.raw_sha256)
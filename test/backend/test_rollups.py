@@ -0,0 +1,91 @@
+"""
+Backend unit tests for rollups.py
+Tests incremental day/week/month aggregation per sport
+"""
+import sys
+from datetime import date, datetime
+from pathlib import Path
+
+import pytest
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'backend'))
+
+from models import ActivityMeta
+from rollups import StatsRollup, period_key, period_start
+
+
+def meta(activity_id, day, km=10.0, sec=3600.0, hr=None, sport="running", ascent=None):
+    return ActivityMeta(id=activity_id, name=activity_id, date=datetime.combine(day, datetime.min.time()),
+                        sport=sport, distance_km=km, duration_sec=sec, avg_heart_rate=hr, total_ascent=ascent)
+
+
+class TestPeriodKeys:
+    """Bucket keys and starts"""
+
+    def test_keys(self):
+        d = date(2025, 1, 1)  # ISO week 1 of 2025
+        assert period_key("day", d) == "2025-01-01"
+        assert period_key("week", d) == "2025-W01"
+        assert period_key("month", d) == "2025-01"
+
+    def test_iso_week_crosses_year(self):
+        assert period_key("week", date(2024, 12, 30)) == "2025-W01"
+        assert period_start("week", "2025-W01") == date(2024, 12, 30)
+
+    def test_unknown_period(self):
+        with pytest.raises(ValueError):
+            period_key("year", date(2025, 1, 1))
+
+
+class TestStatsRollup:
+    """Incremental maintenance and range queries"""
+
+    def test_weighted_heart_rate(self):
+        rollup = StatsRollup()
+        rollup.put(meta("a", date(2025, 6, 2), sec=3600, hr=150))
+        rollup.put(meta("b", date(2025, 6, 3), sec=1200, hr=170))
+        rollup.put(meta("c", date(2025, 6, 4), sec=600))
+
+        week = rollup.query("week")["buckets"][0]
+        assert week["key"] == "2025-W23"
+        assert week["count"] == 3
+        assert week["duration_sec"] == 5400
+        assert week["avg_heart_rate"] == 155
+
+    def test_update_and_remove(self):
+        rollup = StatsRollup()
+        old = meta("a", date(2025, 6, 2), km=10)
+        rollup.put(old)
+        new = meta("a", date(2025, 7, 1), km=12, sport="trail_running")
+        rollup.put(new, old)
+
+        months = rollup.query("month", by_sport=True)["buckets"]
+        assert [m["key"] for m in months] == ["2025-07"]
+        assert months[0]["sports"] == {"trail_running": {
+            "count": 1, "distance_km": 12.0, "duration_sec": 3600.0, "total_ascent": 0.0, "avg_heart_rate": None}}
+
+        rollup.remove(new)
+        assert rollup.query("month")["buckets"] == []
+        assert rollup.lifetime() == {}
+
+    def test_range_and_sport_filter(self):
+        rollup = StatsRollup()
+        rollup.put(meta("a", date(2025, 5, 31), km=5))
+        rollup.put(meta("b", date(2025, 6, 15), km=10))
+        rollup.put(meta("c", date(2025, 6, 20), km=30, sport="cycling"))
+        rollup.put(meta("d", date(2025, 7, 1), km=8))
+
+        result = rollup.query("month", date_from=date(2025, 6, 10), date_to=date(2025, 6, 30))
+        assert [b["key"] for b in result["buckets"]] == ["2025-06"]
+        assert result["totals"]["distance_km"] == 40
+
+        result = rollup.query("day", sport="running")
+        assert [b["key"] for b in result["buckets"]] == ["2025-05-31", "2025-06-15", "2025-07-01"]
+        assert result["totals"]["distance_km"] == 23
+
+    def test_undated_activity_only_in_lifetime(self):
+        rollup = StatsRollup()
+        rollup.put(ActivityMeta(id="x", name="x", distance_km=3.0))
+        assert rollup.query("day")["buckets"] == []
+        assert rollup.lifetime()["running"]["count"] == 1
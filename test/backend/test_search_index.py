@@ -0,0 +1,84 @@
+"""
+Backend unit tests for search_index.py
+Tests trigram search with prefix, substring and fuzzy matching
+"""
+import sys
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'backend'))
+
+from models import ActivityMeta
+from search_index import SearchIndex, normalize_text, trigrams
+
+
+def build_index(*metas):
+    index = SearchIndex()
+    for meta in metas:
+        index.put(meta)
+    return index
+
+
+def ids(hits):
+    return [aid for aid, _ in hits]
+
+
+class TestTokenizing:
+    """Normalization and trigram generation"""
+
+    def test_normalize_text(self):
+        assert normalize_text("Morning_Run-2025.fit") == "morning run 2025 fit"
+
+    def test_trigrams_are_padded(self):
+        assert trigrams("ab") == {"  a", " ab", "ab "}
+
+
+class TestSearchIndex:
+    """Ranking, prefix, fuzzy and incremental updates"""
+
+    def test_prefix_and_substring(self):
+        index = build_index(
+            ActivityMeta(id="1", name="Tempo run", file_name="a.fit"),
+            ActivityMeta(id="2", name="Easy run", file_name="b.fit"),
+        )
+        assert ids(index.search("te")) == ["1"]
+        assert ids(index.search("tem")) == ["1"]
+        assert set(ids(index.search("run"))) == {"1", "2"}
+
+    def test_ranking_prefers_name_and_prefix(self):
+        index = build_index(
+            ActivityMeta(id="file", name="Morning", file_name="tempo_0601.fit"),
+            ActivityMeta(id="inner", name="Long tempo block"),
+            ActivityMeta(id="exact", name="Tempo"),
+        )
+        assert ids(index.search("tempo")) == ["exact", "inner", "file"]
+
+    def test_ties_newest_first(self):
+        index = build_index(ActivityMeta(id="old", name="Easy"), ActivityMeta(id="new", name="Easy"))
+        assert ids(index.search("easy")) == ["new", "old"]
+
+    def test_fuzzy_match(self):
+        index = build_index(ActivityMeta(id="1", name="Interval session"))
+        assert ids(index.search("intervl")) == ["1"]
+        assert index.search("intervl", fuzzy=False) == []
+
+    def test_all_terms_required(self):
+        index = build_index(
+            ActivityMeta(id="1", name="Easy run", sport="running"),
+            ActivityMeta(id="2", name="Easy ride", sport="cycling"),
+        )
+        assert ids(index.search("easy cycling")) == ["2"]
+
+    def test_devices_and_chinese_names(self):
+        index = build_index(ActivityMeta(id="1", name="周末长距离", devices=["龙豆跑步"]))
+        assert ids(index.search("长距")) == ["1"]
+        assert ids(index.search("龙豆")) == ["1"]
+
+    def test_update_and_remove(self):
+        index = build_index(ActivityMeta(id="1", name="Tempo"))
+        index.put(ActivityMeta(id="1", name="Recovery"))
+        assert index.search("tempo", fuzzy=False) == []
+        assert ids(index.search("recov")) == ["1"]
+        index.remove("1")
+        assert index.search("recov") == []
+        assert len(index) == 0
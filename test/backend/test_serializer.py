@@ -0,0 +1,64 @@
+"""
+Backend unit tests for serializer.py
+Tests JSON encoding of datetimes, NumPy values and non-ASCII text
+"""
+import importlib
+import json
+import sys
+from datetime import date, datetime
+from pathlib import Path
+
+import pytest
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'backend'))
+
+import serializer
+from serializer import dumps, loads
+
+
+class TestSerializer:
+    """Output is compatible between orjson and the stdlib fallback"""
+
+    def test_roundtrip(self):
+        obj = {"name": "晨跑", "values": [1, 2.5, None], "nested": {"ok": True}}
+        data = dumps(obj)
+        assert isinstance(data, bytes)
+        assert loads(data) == obj
+        assert loads(memoryview(data)) == obj
+        assert loads(data.decode("utf-8")) == obj
+
+    def test_non_ascii_not_escaped(self):
+        assert "晨跑".encode("utf-8") in dumps({"name": "晨跑"})
+
+    def test_datetime_as_iso(self):
+        obj = {"t": datetime(2025, 6, 1, 7, 30, 15), "d": date(2025, 6, 1)}
+        assert loads(dumps(obj)) == {"t": "2025-06-01T07:30:15", "d": "2025-06-01"}
+
+    def test_numpy_values(self):
+        np = pytest.importorskip("numpy")
+        obj = {"arr": np.array([1.5, 2.5]), "i": np.int64(3), "f": np.float32(0.5)}
+        assert loads(dumps(obj)) == {"arr": [1.5, 2.5], "i": 3, "f": 0.5}
+
+    def test_unknown_type_as_str(self):
+        assert loads(dumps({"p": Path("a")})) == {"p": "a"}
+
+    def test_indent(self):
+        text = dumps({"a": [1]}, indent=True).decode("utf-8")
+        assert "\n  " in text
+        assert json.loads(text) == {"a": [1]}
+
+    def test_invalid_json_raises_decode_error(self):
+        with pytest.raises(json.JSONDecodeError):
+            loads(b"{broken")
+
+    def test_stdlib_fallback(self, monkeypatch):
+        monkeypatch.setitem(sys.modules, "orjson", None)  # make "import orjson" fail
+        fallback = importlib.reload(serializer)
+        try:
+            assert fallback.JSON_ENGINE == "json"
+            obj = {"name": "晨跑", "t": datetime(2025, 6, 1)}
+            assert fallback.loads(fallback.dumps(obj)) == {"name": "晨跑", "t": "2025-06-01T00:00:00"}
+        finally:
+            monkeypatch.undo()
+            importlib.reload(serializer)
@@ -0,0 +1,127 @@
+"""
+Backend unit tests for snapshot.py
+Tests streaming library snapshots and validated restore
+"""
+import io
+import sys
+import tarfile
+from pathlib import Path
+
+import pytest
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'backend'))
+
+from data_store import DataStore
+from snapshot import iter_snapshot, restore_snapshot, write_snapshot
+from store_cli import main as cli_main
+from test_data_store import make_activity, save_overlay
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = DataStore(str(tmp_path / "data"))
+    for i in range(3):
+        store.save_activity(make_activity(f"a{i}", f"run {i}"))
+    return store
+
+
+class TestSnapshot:
+    """Snapshots are single consistent archives of the store"""
+
+    def test_snapshot_contents(self, store, tmp_path):
+        report = write_snapshot(store, tmp_path / "backup.tar.gz")
+        assert report["activity_count"] == 3
+
+        with tarfile.open(tmp_path / "backup.tar.gz", mode="r:gz") as tar:
+            names = tar.getnames()
+        assert "manifest.json" in names and "index.json" in names
+        assert "activities/2025/06/a0.rec" in names
+        assert not any(name.startswith("index.journal") for name in names)
+
+    def test_activity_deleted_during_snapshot_is_left_out(self, store, tmp_path):
+        chunks = iter_snapshot(store, compress=False)
+        data = next(chunks)  # first activity written
+        store.delete_activity("a0")
+        data += b"".join(chunks)
+
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            names = tar.getnames()
+            index = tar.extractfile("index.json").read()
+        assert not any("a0." in name for name in names)
+        assert b'"a0"' not in index
+
+    def test_overlay_snapshot_includes_base_deleted_meanwhile(self, store, tmp_path):
+        merged = save_overlay(store, "a0", "m1")
+        chunks = iter_snapshot(store, compress=False)
+        data = next(chunks)  # overlay written first, together with its base
+        store.delete_activity("a0")
+        data += b"".join(chunks)
+        (tmp_path / "backup.tar").write_bytes(data)
+
+        with tarfile.open(tmp_path / "backup.tar") as tar:
+            names = tar.getnames()
+        assert "activities/2025/06/a0.rec" in names
+
+        report = restore_snapshot(tmp_path / "backup.tar", tmp_path / "restored")
+        assert (report["restored"], report["skipped"]) == (4, [])
+        restored = DataStore(str(tmp_path / "restored"))
+        assert restored.get_activity_meta("m1").base_id == "a0"
+        assert restored.get_activity("m1").records == merged.records
+
+    def test_restore_skips_overlay_without_base(self, store, tmp_path):
+        save_overlay(store, "a0", "m1")
+        save_overlay(store, "m1", "m2")
+        write_snapshot(store, tmp_path / "backup.tar.gz")
+        with tarfile.open(tmp_path / "backup.tar.gz", mode="r:gz") as full, \
+                tarfile.open(tmp_path / "broken.tar.gz", mode="w:gz") as broken:
+            for member in full:
+                if "/a0." not in member.name:
+                    broken.addfile(member, full.extractfile(member))
+
+        report = restore_snapshot(tmp_path / "broken.tar.gz", tmp_path / "restored")
+        assert report["restored"] == 2
+        assert sorted(s["file"] for s in report["skipped"]) == \
+            ["activities/2025/06/m1.json", "activities/2025/06/m2.json"]
+        restored = DataStore(str(tmp_path / "restored"))
+        assert sorted(a.id for a in restored.list_activities()[0]) == ["a1", "a2"]
+        assert not (tmp_path / "restored" / "activities" / "2025" / "06" / "m2.rec").exists()
+
+    def test_restore_roundtrip(self, store, tmp_path):
+        store.freeze_activity("a1")
+        store.get_activity("a2")
+        write_snapshot(store, tmp_path / "backup.tar.gz")
+
+        report = restore_snapshot(tmp_path / "backup.tar.gz", tmp_path / "restored")
+        assert report["restored"] == 3
+        assert report["skipped"] == []
+
+        restored = DataStore(str(tmp_path / "restored"))
+        assert [a.model_dump() for a in restored.list_activities()[0]] == \
+            [a.model_dump() for a in store.list_activities()[0]]
+        assert restored.get_activity_meta("a1").tier == "cold"
+        assert restored.get_activity("a0").model_dump() == store.get_activity("a0").model_dump()
+
+    def test_restore_skips_corrupted_activity(self, store, tmp_path):
+        (store.activities_dir / "2025" / "06" / "a0.rec").write_bytes(b"garbage")
+        write_snapshot(store, tmp_path / "backup.tar.gz")
+
+        report = restore_snapshot(tmp_path / "backup.tar.gz", tmp_path / "restored")
+        assert report["restored"] == 2
+        assert [s["file"] for s in report["skipped"]] == ["activities/2025/06/a0.json"]
+        assert not (tmp_path / "restored" / "activities" / "2025" / "06" / "a0.lod").exists()
+
+    def test_restore_refuses_non_empty_target(self, store, tmp_path):
+        write_snapshot(store, tmp_path / "backup.tar.gz")
+        with pytest.raises(ValueError):
+            restore_snapshot(tmp_path / "backup.tar.gz", store.data_dir)
+
+        report = restore_snapshot(tmp_path / "backup.tar.gz", store.data_dir, force=True)
+        assert Path(report["backup"]).is_dir()
+        assert DataStore(str(store.data_dir)).list_activities()[1] == 3
+
+    def test_cli_snapshot_and_restore(self, store, tmp_path):
+        archive = str(tmp_path / "cli.tar.gz")
+        assert cli_main(["--data-dir", str(store.data_dir), "snapshot", archive]) == 0
+        assert cli_main(["--data-dir", str(tmp_path / "moved"), "restore", archive]) == 0
+        assert DataStore(str(tmp_path / "moved")).list_activities()[1] == 3